@@ -5,32 +5,203 @@ load_dotenv()  # ← ZUERST .env laden
 
 import os
 import json
-from datetime import datetime, timedelta
+import time
+import logging
+from contextlib import contextmanager
+from pathlib import Path
+from datetime import date, datetime, time as dtime, timedelta
 from zoneinfo import ZoneInfo
 
-import pandas as pd
 import requests
 from requests.adapters import HTTPAdapter, Retry
 
 from constants import WETTERSTATION_AUTHT_GROUP
+from util.lazy import lazy_import
 from util.timeParser import TimeParser
 from util.mapping import entity_to_beehives
+from util.schema import compact_readings, concat_readings, to_epoch_ms
 
-BASE_URL = "https://apis.smartcity.hn/bildungscampus/iotplatform/digitalbeehive/v1"   
+# pandas/numpy erst bei Bedarf laden (schlanker Poller-Modus)
+pd = lazy_import("pandas")
+np = lazy_import("numpy")
+
+# Überschreibbar, z.B. für die lokale Stub-API der Lastsimulation (simulate.py)
+BASE_URL = os.getenv("API_BASE_URL", "https://apis.smartcity.hn/bildungscampus/iotplatform/digitalbeehive/v1")
 API_KEY = os.getenv("API_KEY")
+API_DUMP_DIR = os.getenv("API_DUMP_DIR")  # Rohantworten zum Nachspielen ablegen (Debugging)
+# Optional: nur diese Keys abfragen (kommagetrennt), z.B. für reine Anomalie-Checks
+API_REQUIRED_KEYS = [k.strip() for k in os.getenv("API_REQUIRED_KEYS", "").split(",") if k.strip()] or None
+
+KEY_CACHE_SECONDS = 6 * 60 * 60         # valueType-Liste pro authGroup zwischenspeichern
+KEY_REDISCOVERY_SECONDS = 24 * 60 * 60  # je Entity wieder alle Keys anfragen (neue Keys finden)
+KEY_DISCOVERY_SPAN_MS = 6 * 60 * 60 * 1000  # so viel Zeitraum ungefiltert abfragen, bevor gefiltert wird
+
+TZ = ZoneInfo("Europe/Berlin")  # Zeitzone der String-API und der Tagesgrenzen
+
+logger = logging.getLogger("beehive_poller.client")
+
+# Timeouts pro Request (Sekunden); ohne sie kann eine hängende Verbindung den Poller blockieren
+API_CONNECT_TIMEOUT = float(os.getenv("API_CONNECT_TIMEOUT", "5"))
+API_READ_TIMEOUT = float(os.getenv("API_READ_TIMEOUT", "30"))
+
+# Optional: schneller JSON-Parser, sonst stdlib
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+# Brotli nur anbieten, wenn urllib3 es auch dekodieren kann
+try:
+    import brotli  # noqa: F401
+    ACCEPT_ENCODING = "br, gzip, deflate"
+except ImportError:
+    try:
+        import brotlicffi  # noqa: F401
+        ACCEPT_ENCODING = "br, gzip, deflate"
+    except ImportError:
+        ACCEPT_ENCODING = "gzip, deflate"
+
+
+def _as_float64(raw: list) -> np.ndarray:
+    """Liste -> float64-Array; schneller Pfad für Zahlen, sonst nicht Umwandelbares als NaN."""
+    try:
+        return np.array(raw, dtype="float64")
+    except (TypeError, ValueError):
+        return pd.to_numeric(pd.Series(raw, dtype="object"), errors="coerce").to_numpy("float64")
+
+
+def is_no_data(exc: Exception) -> bool:
+    """True, wenn die API für Entity/Zeitraum schlicht keine Daten hat (404) statt eines Fehlers."""
+    response = getattr(exc, "response", None)
+    return isinstance(exc, requests.HTTPError) and response is not None and response.status_code == 404
+
+
+def day_bounds(day: date | str) -> tuple[int, int]:
+    """
+    Grenzen eines Kalendertags in Europe/Berlin als halboffenes Fenster [Beginn, Ende)
+    in Epoch-ms; an Tagen mit Zeitumstellung ist das Fenster 23 bzw. 25 Stunden lang.
+
+    Args:
+        day: date oder "TT.MM.JJJJ"
+    """
+    if isinstance(day, str):
+        try:
+            day = datetime.strptime(day, "%d.%m.%Y").date()
+        except ValueError as e:
+            raise ValueError(f'Ungültiges Datum "{day}". Erwartet: "TT.MM.JJJJ".') from e
+    start = datetime.combine(day, dtime(), tzinfo=TZ)
+    end = datetime.combine(day + timedelta(days=1), dtime(), tzinfo=TZ)
+    return to_epoch_ms(start), to_epoch_ms(end)
+
+
+class DeadlineExceeded(requests.Timeout):
+    """Zeitbudget (Client.budget) aufgebraucht, Request nicht (mehr) gestellt."""
+
+
+class _BudgetRetry(Retry):
+    """Retry, das nach Ablauf des Zeitbudgets nicht mehr wiederholt oder wartet."""
+
+    client: "Client | None" = None  # wird pro Client per Unterklasse gesetzt
+
+    def increment(self, *args, **kwargs):
+        if self.client is not None and self.client.remaining() == 0:
+            # Versuche als aufgebraucht behandeln -> reguläre MaxRetryError des letzten Fehlers
+            # (Kopie: die Instanz des Adapters wird für alle Requests wiederverwendet)
+            return super(_BudgetRetry, self.new(total=0)).increment(*args, **kwargs)
+        return super().increment(*args, **kwargs)
+
+    def sleep(self, response=None):
+        remaining = self.client.remaining() if self.client is not None else None
+        if remaining is not None:
+            wait = (self.get_retry_after(response) if response is not None else None) or self.get_backoff_time()
+            if wait >= remaining:
+                raise DeadlineExceeded(f"Wartezeit {wait:.1f}s übersteigt Restbudget {remaining:.1f}s")
+        super().sleep(response)
+
 
 class Client():
+    def __init__(self, dump_dir: str | None = API_DUMP_DIR,
+                 required_keys: list[str] | None = API_REQUIRED_KEYS,
+                 timeout: tuple[float, float] = (API_CONNECT_TIMEOUT, API_READ_TIMEOUT),
+                 base_url: str = BASE_URL):
+        """
+        Args:
+            dump_dir: Verzeichnis für Rohantworten (None = nicht speichern)
+            required_keys: nur diese Keys abfragen (None = alle, die eine Entity liefert)
+            timeout: (Connect, Read) in Sekunden pro Request
+            base_url: Basis-URL der API
+        """
+        self._session: requests.Session | None = None
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        # Ende des aktuellen Zeitbudgets (time.monotonic), None = unbegrenzt
+        self.deadline: float | None = None
+        self.dump_dir = Path(dump_dir) if dump_dir else None
+        self.required_keys = set(required_keys) if required_keys else None
+
+        # authGroup -> (Zeitpunkt, TIME_SERIES-Keys)
+        self._group_keys: dict[str, tuple[float, list[str]]] = {}
+        # entityId -> Keys, die die Entity tatsächlich liefert (gelernt aus Antworten)
+        self._entity_keys: dict[str, set[str]] = {}
+        # entityId -> Zeitpunkt der letzten abgeschlossenen Erkennung
+        self._entity_discovered: dict[str, float] = {}
+        # entityId -> in der laufenden Erkennung ungefiltert abgefragter Zeitraum (ms)
+        self._discovery_span: dict[str, int] = {}
+
+    @property
+    def session(self) -> requests.Session:
+        """Eine Session pro Client: Verbindungen (TLS, Keep-Alive) werden wiederverwendet."""
+        if self._session is None:
+            self._session = self._make_session()
+        return self._session
+
+    def remaining(self) -> float | None:
+        """Restzeit des aktuellen Budgets in Sekunden (None = kein Budget)."""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    @contextmanager
+    def budget(self, deadline: float | None):
+        """
+        Alle Requests im Block enden spätestens zum deadline (time.monotonic):
+        Timeouts werden auf die Restzeit gekürzt, danach wird nichts mehr gesendet
+        oder wiederholt (DeadlineExceeded).
+        """
+        previous, self.deadline = self.deadline, deadline
+        try:
+            yield self
+        finally:
+            self.deadline = previous
+
+    def _timeout(self) -> tuple[float, float]:
+        remaining = self.remaining()
+        if remaining is None:
+            return self.timeout
+        if remaining == 0:
+            raise DeadlineExceeded("Zeitbudget aufgebraucht, Request nicht gesendet")
+        connect, read = self.timeout
+        return min(connect, remaining), min(read, remaining)
+
     def _make_session(self) -> requests.Session:
         s = requests.Session()
-        retries = Retry(
+        s.headers["Accept-Encoding"] = ACCEPT_ENCODING
+        retry_cls = type("_ClientRetry", (_BudgetRetry,), {"client": self})
+        retries = retry_cls(
             total=3, backoff_factor=0.3,
             status_forcelist=(429, 500, 502, 503, 504),
             allowed_methods=frozenset(["GET","POST","PUT","DELETE","PATCH"])
         )
         s.mount("https://", HTTPAdapter(max_retries=retries))
         s.mount("http://",  HTTPAdapter(max_retries=retries))
-        s.request = lambda *a, **kw: requests.Session.request(s, *a, **kw)
-        return s 
+        # Jeder Request bekommt Timeouts (gekürzt auf das Restbudget)
+        send = s.request
+        def request(method, url, **kw):
+            kw.setdefault("timeout", self._timeout())
+            return send(method, url, **kw)
+        s.request = request
+        return s
 
     def _normalize_timeseries_payload(self, entity_id: str, payload) -> list[dict]:
         """
@@ -85,6 +256,109 @@ class Client():
         })
         return rows
 
+    def _rows_from_response(self, entity_id: str, data) -> list[dict]:
+        """Normalisiert eine get_time_series-Antwort (mit oder ohne Zwischenebene) auf Zeilen."""
+        # Manche APIs liefern eine Ebene mehr/weniger – beides abfedern:
+        # Beispiel 1: data == { "temperature": [...], "humidity": [...] }
+        # Beispiel 2: data == { "something": { "temperature": [...], ... } }
+        rows: list[dict] = []
+        if isinstance(data, dict) and any(isinstance(v, dict) for v in data.values()):
+            # Eine Ebene tiefer iterieren
+            for _, measurements in data.items():
+                rows.extend(self._normalize_timeseries_payload(entity_id, measurements))
+        else:
+            rows.extend(self._normalize_timeseries_payload(entity_id, data))
+        return rows
+
+    def _decode(self, r: requests.Response, dump_name: str | None = None):
+        """JSON-Body dekodieren (orjson falls installiert), optional Rohbody ablegen."""
+        body = r.content  # bereits entpackt (gzip/br)
+        if self.dump_dir is not None and dump_name:
+            self.dump_dir.mkdir(parents=True, exist_ok=True)
+            (self.dump_dir / f"{dump_name}.json").write_bytes(body)
+        return _json_loads(body)
+
+    @staticmethod
+    def _typed_timeseries(data) -> dict[str, tuple[np.ndarray, np.ndarray]] | None:
+        """
+        Dekodiert die Form { key: [ {ts, value}, ... ] } (ggf. unter "timeseries")
+        direkt in Arrays: key -> (ts float64, value float64). Nicht-numerische ts/Werte
+        werden zu NaN; Punkte ohne gültigen ts und Einträge, die kein Objekt sind, fallen heraus.
+
+        Returns:
+            None, wenn die Antwort eine andere Form hat (dann _rows_from_response)
+        """
+        if isinstance(data, dict) and isinstance(data.get("timeseries"), dict):
+            data = data["timeseries"]
+        if not isinstance(data, dict):
+            return None
+
+        out: dict[str, tuple[np.ndarray, np.ndarray]] = {}
+        for key, points in data.items():
+            if key == "beehiveId" or not points:
+                continue
+            if not isinstance(points, list):
+                return None
+            valid_points = [p for p in points if isinstance(p, dict)]
+            if not valid_points:
+                return None
+            if len(valid_points) < len(points):
+                logger.warning("Key %s: %d fehlerhafte Punkte übersprungen", key, len(points) - len(valid_points))
+                points = valid_points
+            ts = _as_float64([p.get("ts") for p in points])
+            values = _as_float64([p.get("value") for p in points])
+            valid = ~np.isnan(ts)
+            if not valid.all():
+                ts, values = ts[valid], values[valid]
+            out[key] = (ts, values)
+        return out
+
+    def _frame_from_response(self, entity_id: str, data) -> pd.DataFrame:
+        """Antwort -> DataFrame im kompakten Schema, ohne Umweg über Zeilen-Dicts."""
+        typed = self._typed_timeseries(data)
+        if typed is None:
+            return compact_readings(pd.DataFrame(self._rows_from_response(entity_id, data)))
+        if not typed:
+            return compact_readings(pd.DataFrame())
+
+        keys = list(typed)
+        lengths = [len(typed[k][0]) for k in keys]
+        df = pd.DataFrame({
+            "entityId": pd.Categorical.from_codes(np.zeros(sum(lengths), dtype="int8"), [entity_id]),
+            "key": pd.Categorical.from_codes(np.repeat(np.arange(len(keys)), lengths), keys),
+            "ts": np.concatenate([typed[k][0] for k in keys]),
+            "value": np.concatenate([typed[k][1] for k in keys]),
+        })
+        return compact_readings(df)
+
+    def _records_from_response(self, entity_id: str, data) -> list[dict]:
+        """
+        Schlanker Pfad ohne pandas: Antwort -> [{entityId, key, ts (Epoch-ms), value}].
+        Punkte ohne Zeitstempel oder numerischen Wert fallen heraus.
+        """
+        if isinstance(data, dict) and isinstance(data.get("timeseries"), dict):
+            data = data["timeseries"]
+        rows = self._rows_from_response(entity_id, data)
+
+        records: list[dict] = []
+        for row in rows:
+            if row.get("key") is None or row.get("key") == "beehiveId":
+                continue
+            try:
+                ts = float(row["ts"])
+                value = float(row["value"])
+            except (TypeError, ValueError):
+                continue
+            if value != value or ts != ts:  # NaN
+                continue
+            records.append({"entityId": entity_id, "key": row["key"],
+                            "ts": int(round(ts if ts > 1e12 else ts * 1000)), "value": value})
+        return records
+
+    def replay(self, path, entity_id: str) -> pd.DataFrame:
+        """Abgelegte Rohantwort (siehe dump_dir) erneut durch den Parser schicken."""
+        return self._frame_from_response(entity_id, _json_loads(Path(path).read_bytes()))
+
     def _to_berlin_datetime(self, df: pd.DataFrame) -> pd.DataFrame:
         if df.empty or "ts" not in df.columns:
             return df
@@ -93,99 +367,121 @@ class Client():
         df["datetime"] = pd.to_datetime(ts_num, unit=unit, utc=True).dt.tz_convert("Europe/Berlin")
         return df
 
-    def _get_day_df(self, authGroup: str, day_str: str) -> pd.DataFrame:
+    def _get_day_df(self, authGroup: str, day: date | str) -> pd.DataFrame:
         """
-        Kernlogik: holt alle Entities und lädt deren Time-Series für den gegebenen Tag (00:00–23:59, Europe/Berlin).
-        day_str: "TT.MM.JJJJ"
+        Kernlogik: holt alle Entities und lädt deren Time-Series für den gegebenen Tag
+        (Mitternacht bis Mitternacht Europe/Berlin, DST-korrekt, siehe day_bounds).
+        day: date oder "TT.MM.JJJJ"
+        Rückgabe im kompakten Schema (util.schema.READING_COLUMNS); fehlgeschlagene
+        Entities stehen mit Fehlertext in df.attrs["failed_entities"] (entityId -> Fehler).
         """
-        # Datum validieren
-        try:
-            datetime.strptime(day_str, "%d.%m.%Y")
-        except ValueError as e:
-            raise ValueError(f'Ungültiges Datum "{day_str}". Erwartet: "TT.MM.JJJJ".') from e
+        start_ms, end_ms = day_bounds(day)  # validiert auch das Datum
 
-        rows: list[dict] = []
+        frames: list[pd.DataFrame] = []
+        failed: dict[str, str] = {}
         entity_ids = self.get_all_entity_ids(authGroup)
 
         for eid in entity_ids:
             try:
-                data = self.get_time_series(
-                    entityId=eid,
-                    authGroup=authGroup,
-                    startTime="00:00",
-                    startDate=day_str,
-                    endTime="23:59",
-                    endDate=day_str
-                )
-
-                # Manche APIs liefern eine Ebene mehr/weniger – beides abfedern:
-                # Beispiel 1: data == { "temperature": [...], "humidity": [...] }
-                # Beispiel 2: data == { "something": { "temperature": [...], ... } }
-                if isinstance(data, dict) and any(isinstance(v, dict) for v in data.values()):
-                    # Eine Ebene tiefer iterieren
-                    for _, measurements in data.items():
-                        rows.extend(self._normalize_timeseries_payload(eid, measurements))
-                else:
-                    rows.extend(self._normalize_timeseries_payload(eid, data))
-
+                frames.append(self.fetch_window_df(eid, authGroup, start_ms, end_ms))
             except Exception as e:
-                rows.append({"entityId": eid, "key": None, "ts": None, "value": f"error: {str(e)}"})
-
-        df = pd.DataFrame(rows)
-        if "ts" in df.columns and not df.empty:
-            # Leere Strings als NA behandeln und in Zahl konvertieren
-            df["ts"] = pd.to_numeric(df["ts"].replace(["", "NaN", "nan"], pd.NA), errors="coerce")
-            df = df[df["ts"].notna()].copy()
-        df["beehiveId"] = df["entityId"].map(entity_to_beehives)
-        return self._to_berlin_datetime(df)
+                if is_no_data(e):
+                    continue  # Entity ohne Daten für diesen Tag
+                logger.warning("Entity %s (authGroup=%s) für %s fehlgeschlagen: %s", eid, authGroup, day, e)
+                failed[eid] = str(e)
+
+        # Nicht-numerische Werte sind bereits herausgefallen;
+        # die Beuten-Zuordnung liefert util.schema.beehive_dimension
+        df = concat_readings(frames)
+        df.attrs["failed_entities"] = failed
+        return df
     
     def get_all_entities(self, authGroup:str) -> json:
-        session =  self._make_session()
-        r = session.get(
-            f"{BASE_URL}/authGroup/{authGroup}/entityId?page=0",
+        r = self.session.get(
+            f"{self.base_url}/authGroup/{authGroup}/entityId?page=0",
             headers={"x-apikey": f"{API_KEY}"}
         )
         r.raise_for_status()
-        return r.json()
+        return self._decode(r)
 
     def _get_all_time_series_keys(self, authGroup) -> list[str]:
-        session =  self._make_session()
-        r = session.get(
-            f"{BASE_URL}/authGroup/{authGroup}/valueType",
+        cached = self._group_keys.get(authGroup)
+        if cached is not None and time.monotonic() - cached[0] < KEY_CACHE_SECONDS:
+            return cached[1]
+        r = self.session.get(
+            f"{self.base_url}/authGroup/{authGroup}/valueType",
             params={"x-apikey": API_KEY} 
         ) 
         r.raise_for_status()
-        value_types = r.json()
+        value_types = self._decode(r)
         time_series_keys = [item["key"] for item in value_types["valueType"]["TIME_SERIES"]]      
+        self._group_keys[authGroup] = (time.monotonic(), time_series_keys)
         return time_series_keys
+
+    def _keys_for(self, entityId: str, authGroup: str, keys: list[str] | None = None) -> tuple[list[str], bool]:
+        """
+        Keys für einen Request: die gelernten Keys der Entity (bzw. alle Keys der
+        authGroup, solange die Erkennung noch keine KEY_DISCOVERY_SPAN_MS an Daten
+        gesehen hat oder eine Neuerkennung fällig ist), geschnitten mit den gewünschten Keys.
+        So fallen auch selten gemeldete Keys nicht durch ein einzelnes kurzes Fenster.
+
+        Returns:
+            (Keys, discovery) – discovery=True, wenn ungefiltert alle Keys angefragt werden
+        """
+        group_keys = self._get_all_time_series_keys(authGroup)
+        wanted = set(keys) if keys else self.required_keys
+        learned = self._entity_keys.get(entityId)
+        due = time.monotonic() - self._entity_discovered.get(entityId, float("-inf")) >= KEY_REDISCOVERY_SECONDS
+
+        if learned and not due:
+            selection, discovery = [k for k in group_keys if k in learned], False
+        else:
+            selection, discovery = list(group_keys), wanted is None
+        if wanted is not None:
+            selection = [k for k in selection if k in wanted]
+        return selection, discovery
+
+    def _learn_keys(self, entityId: str, data, discovery: bool, span_ms: int = 0):
+        """
+        Merkt sich, welche Keys die Entity geliefert hat (nur ergänzen, nie entfernen).
+        Ungefilterte Abfragen summieren ihren Zeitraum; ab KEY_DISCOVERY_SPAN_MS gilt
+        die Erkennung als abgeschlossen und es wird auf die gelernten Keys gefiltert.
+        """
+        payload = data.get("timeseries", data) if isinstance(data, dict) else None
+        if not isinstance(payload, dict):
+            return
+        seen = {k for k, v in payload.items() if k != "beehiveId" and v}
+        if seen:
+            self._entity_keys.setdefault(entityId, set()).update(seen)
+        if discovery:
+            span = self._discovery_span.get(entityId, 0) + span_ms
+            if span >= KEY_DISCOVERY_SPAN_MS and self._entity_keys.get(entityId):
+                self._entity_discovered[entityId] = time.monotonic()
+                span = 0
+            self._discovery_span[entityId] = span
     
     def _parse_to_unix_ts(self, date_str: str, time_str: str) -> int:
-            dt = datetime.strptime(f"{date_str} {time_str}", "%d.%m.%Y %H:%M")
-            dt = dt.replace(tzinfo=ZoneInfo("Europe/Berlin"))
-            ts = dt.timestamp()
-            return int(ts * 1000)
+        """"TT.MM.JJJJ" + "HH:MM" (Europe/Berlin) -> Epoch-ms, nur noch für die String-API."""
+        dt = datetime.strptime(f"{date_str} {time_str}", "%d.%m.%Y %H:%M")
+        return to_epoch_ms(dt.replace(tzinfo=TZ))
     
     def get_all_entity_ids(self, authGroup:str) -> list[str]:
          entites = self.get_all_entities(authGroup)
          entity_ids = [item["entityId"]["id"] for item in entites["entities"]]
          return entity_ids
     
-    def get_time_series(self,
-                         entityId:str,
-                         authGroup:str,
-                         startTime:str="00:00",
-                         startDate:str="01.01.1970",
-                         endTime:str="23:59",
-                         endDate:str="24.09.2025"):
-        
-        startTs = self._parse_to_unix_ts(startDate, startTime)
-        endTs = self._parse_to_unix_ts(endDate, endTime)
-
-        session =  self._make_session()
-
-        keys =",".join(self._get_all_time_series_keys(authGroup)) 
-        r = session.get(
-            f"{BASE_URL}/authGroup/{authGroup}/entityId/{entityId}/valueType/timeseries",
+    def _fetch_time_series(self, entityId: str, authGroup: str,
+                           startTs: int, endTs: int, keys: list[str] | None = None):
+        """
+        Roh-Request für ein Zeitfenster (Epoch-ms, beide Grenzen inklusive), dekodiertes JSON zurück.
+        Angefragt werden nur die Keys, die die Entity liefert (siehe _keys_for).
+        """
+        selection, discovery = self._keys_for(entityId, authGroup, keys)
+        if not selection:
+            return {"timeseries": {}}
+        keys = ",".join(selection)
+        r = self.session.get(
+            f"{self.base_url}/authGroup/{authGroup}/entityId/{entityId}/valueType/timeseries",
             params={"x-apikey": API_KEY,
                     "keys": keys,
                     "endTs": str(endTs),
@@ -193,8 +489,27 @@ class Client():
                      } 
         ) 
         r.raise_for_status() 
+        data = self._decode(r, dump_name=f"{authGroup}_{entityId}_{startTs}_{endTs}")
+        self._learn_keys(entityId, data, discovery, endTs - startTs + 1)
+        return data
+
+    def _window_request(self, entityId: str, authGroup: str, start: int | datetime, end: int | datetime,
+                        keys: list[str] | None = None):
+        """Fenster [start, end) als Epoch-ms oder zeitzonenbewusste datetimes -> Roh-Request."""
+        start_ms, end_ms = to_epoch_ms(start), to_epoch_ms(end)
+        # Die API liefert beide Grenzen inklusive; end ausschließen, damit Folgefenster nicht überlappen
+        return self._fetch_time_series(entityId, authGroup, start_ms, end_ms - 1, keys)
+
+    def get_window(self, entityId: str, authGroup: str, start: int | datetime, end: int | datetime,
+                   keys: list[str] | None = None):
+        """
+        Rohantwort (inkl. beehiveId) für das halboffene Fenster [start, end).
 
-        time_series = r.json()
+        Args:
+            start, end: Epoch-ms oder zeitzonenbewusste datetimes
+            keys: nur diese Keys abfragen (überschreibt required_keys des Clients)
+        """
+        time_series = self._window_request(entityId, authGroup, start, end, keys)
 
         try:
          beehive_id = entity_to_beehives(entityId)  # erwartet: vorhandene Mapping-Funktion
@@ -202,15 +517,70 @@ class Client():
          beehive_id = None
 
         time_series["timeseries"].setdefault("beehiveId", beehive_id)
-        return time_series   
+        return time_series
+
+    def fetch_window_df(self, entityId: str, authGroup: str, start: int | datetime, end: int | datetime,
+                        keys: list[str] | None = None) -> pd.DataFrame:
+        """Wie get_window, dekodiert direkt in einen DataFrame im kompakten Schema."""
+        return self._frame_from_response(entityId, self._window_request(entityId, authGroup, start, end, keys))
+
+    def fetch_window(self, entityId: str, authGroup: str, start: int | datetime, end: int | datetime,
+                     keys: list[str] | None = None) -> list[dict]:
+        """Wie get_window, als Liste von Dicts (ohne pandas, für den schlanken Poller und Gap-Refill)."""
+        return self._records_from_response(entityId, self._window_request(entityId, authGroup, start, end, keys))
+
+    # ---------- String-API ("TT.MM.JJJJ"/"HH:MM", Europe/Berlin, Minutengenau) ----------
+
+    def _string_window(self, startDate: str, startTime: str, endDate: str, endTime: str) -> tuple[int, int]:
+        """String-Grenzen -> [start, end) in Epoch-ms; die Endminute bleibt wie bisher eingeschlossen."""
+        return self._parse_to_unix_ts(startDate, startTime), self._parse_to_unix_ts(endDate, endTime) + 1
+
+    def get_time_series(self,
+                         entityId:str,
+                         authGroup:str,
+                         startTime:str="00:00",
+                         startDate:str="01.01.1970",
+                         endTime:str="23:59",
+                         endDate:str="24.09.2025",
+                         keys: list[str] | None = None):
+        return self.get_window(entityId, authGroup, *self._string_window(startDate, startTime, endDate, endTime),
+                               keys=keys)
+
+    def get_time_series_df(self,
+                           entityId: str,
+                           authGroup: str,
+                           startTime: str = "00:00",
+                           startDate: str = "01.01.1970",
+                           endTime: str = "23:59",
+                           endDate: str = "24.09.2025",
+                           keys: list[str] | None = None) -> pd.DataFrame:
+        """
+        Wie get_time_series, dekodiert aber direkt in typisierte Arrays und liefert
+        einen DataFrame im kompakten Schema (siehe fetch_window_df).
+
+        Args:
+            keys: nur diese Keys abfragen (überschreibt required_keys des Clients)
+        """
+        return self.fetch_window_df(entityId, authGroup, *self._string_window(startDate, startTime, endDate, endTime),
+                                    keys=keys)
          
+    def get_time_series_records(self,
+                                entityId: str,
+                                authGroup: str,
+                                startTime: str = "00:00",
+                                startDate: str = "01.01.1970",
+                                endTime: str = "23:59",
+                                endDate: str = "24.09.2025",
+                                keys: list[str] | None = None) -> list[dict]:
+        """Wie get_time_series_df, aber als Liste von Dicts (ohne pandas, für den schlanken Poller)."""
+        return self.fetch_window(entityId, authGroup, *self._string_window(startDate, startTime, endDate, endTime),
+                                 keys=keys)
+
     def get_today_time_series_for_all_entities(self, authGroup: str) -> pd.DataFrame:
-        day_str = datetime.now(ZoneInfo("Europe/Berlin")).strftime("%d.%m.%Y")
-        return self._get_day_df(authGroup, day_str)
+        return self._get_day_df(authGroup, datetime.now(TZ).date())
 
     def get_yesterday_time_series_for_all_entities(self, authGroup: str) -> pd.DataFrame:
-        day_str = (datetime.now(ZoneInfo("Europe/Berlin")) - timedelta(days=1)).strftime("%d.%m.%Y")
-        return self._get_day_df(authGroup, day_str)
+        return self._get_day_df(authGroup, datetime.now(TZ).date() - timedelta(days=1))
     
     def get_yesterday_time_series_for_all_entities_bson(self, authGroup: str, *, replace_ts: bool = True) -> pd.DataFrame:
         """
@@ -223,9 +593,9 @@ class Client():
         df = tp.inject_bson_datetime(df, replace_ts=replace_ts)
         return df
 
-    def get_time_series_for_all_entities_on(self, authGroup: str, day: str) -> pd.DataFrame:
+    def get_time_series_for_all_entities_on(self, authGroup: str, day: date | str) -> pd.DataFrame:
         """
-        day: "TT.MM.JJJJ"
+        day: date oder "TT.MM.JJJJ"
         """
         return self._get_day_df(authGroup, day)
     
@@ -2,14 +2,37 @@ from __future__ import annotations
 
 import os
 import logging
-from typing import Dict
+from array import array
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterator, Optional
 
-import pandas as pd
-from pymongo import MongoClient, errors
+from pymongo import MongoClient, UpdateOne, errors
 
-from util.timeParser import TimeParser
+from db.migrationRunner import MigrationRunner
+from util.lazy import lazy_import
+from util.mapping import entity_id_to_sensor, entity_to_beehives, sensor_type
+from util.sensorRegistry import get_registry
+from util.schema import READING_COLUMNS, EPOCH, compact_readings, concat_readings, empty_readings, to_documents
 
-logger = logging.getLogger("beehive_poller")
+# pandas/numpy erst bei Bedarf laden (schlanker Poller-Modus)
+pd = lazy_import("pandas")
+np = lazy_import("numpy")
+
+logger = logging.getLogger("beehive_poller.db")
+
+# Speicher-Layouts
+LAYOUT_FULL = "full"
+LAYOUT_COMPACT = "compact"
+LAYOUT_BUCKET = "bucket"
+LAYOUTS = (LAYOUT_FULL, LAYOUT_COMPACT, LAYOUT_BUCKET)
+
+# Kurze Feldnamen im kompakten Layout. Sensor-Metadaten (entityId, sensorName,
+# beehiveIds, sensorType) liegen einmalig in der Referenz-Collection "<collection>_sensors".
+COMPACT_FIELDS = {"sensorRef": "s", "key": "k", "ts": "t", "value": "v"}
+
+# Bucket-Layout: ein Dokument pro (entityId, key, Stunde) mit parallelen
+# ts/value-Arrays und laufenden Kennzahlen min/max/sum/count.
+BUCKET_MS = 60 * 60 * 1000
 
 try:
     from dotenv import load_dotenv
@@ -18,16 +41,53 @@ except Exception:
     pass
 
 
+def _count_write_errors(details: dict, label: str) -> tuple[int, int]:
+    """
+    Zählt Duplikate (11000) und sonstige Fehler eines BulkWriteError; sonstige Fehler
+    werden je Fehlermeldung einmal mit Anzahl geloggt statt einmal pro Dokument.
+
+    Returns:
+        (duplicates, errors)
+    """
+    duplicates = 0
+    messages: Dict[str, int] = {}
+    for err in details.get("writeErrors", []):
+        if err.get("code") == 11000:
+            duplicates += 1
+        else:
+            msg = err.get("errmsg", "")
+            messages[msg] = messages.get(msg, 0) + 1
+    for msg, count in messages.items():
+        logger.error("%s (%dx): %s", label, count, msg)
+    return duplicates, sum(messages.values())
+
+
 class BeehiveDbClient:
     """MongoDB Client für Bienenstock-Sensordaten"""
     
-    def __init__(self, collection: str = "digitalBeehive", isTimeSeries: bool = True):
+    def __init__(self, collection: str = "digitalBeehive", isTimeSeries: bool = True,
+                 layout: str = LAYOUT_FULL, raw_ttl_days: Optional[float] = None):
         """
         Args:
             collection: Name der MongoDB Collection (default: "digitalBeehive")
-            isTimeSeries: Ob TimeParser für Zeitstempel-Konvertierung genutzt werden soll
+            isTimeSeries: Ob 'ts' als BSON-Datum (statt Epoch-ms) gespeichert werden soll
+            layout: LAYOUT_FULL (ein Dokument mit allen Feldern pro Messwert),
+                    LAYOUT_COMPACT (kurze Feldnamen, Sensor-Metadaten in Referenz-Collection) oder
+                    LAYOUT_BUCKET (ein Dokument pro Sensor, Key und Stunde)
+            raw_ttl_days: Rohdaten nach so vielen Tagen per TTL-Index löschen
+                          (None = unbegrenzt; benötigt isTimeSeries=True)
         """
+        if layout not in LAYOUTS:
+            raise ValueError(f"Unbekanntes Layout '{layout}'")
+        if raw_ttl_days is not None and not isTimeSeries:
+            raise ValueError("TTL benötigt ts als BSON-Datum (isTimeSeries=True)")
         self.isTimeSeries = isTimeSeries
+        self.layout = layout
+        self.raw_ttl_days = raw_ttl_days
+        self._sensor_refs: Dict[str, int] = {}
+        self._sensor_meta: Dict[int, dict] = {}
+        # Optional: bereits gespeicherte Messwerte vor dem Schreiben verwerfen (use_seen_filter)
+        self.seen_filter = None
         
         # MongoDB Connection
         mongo_uri = os.getenv("MONGO_URI")
@@ -37,37 +97,101 @@ class BeehiveDbClient:
         try:
             mongo_client = MongoClient(mongo_uri)
             self.logger = logging.getLogger("DbMongoClient")
-            self.collection = mongo_client["default"][collection]
+            self.db = mongo_client["default"]
+            self.collection = self.db[collection]
+            self.sensors = self.db[f"{collection}_sensors"]
             
             # Erstelle Unique Index für Duplikats-Vermeidung
             self._create_indexes()
+
+            # Sensor-Zuordnung zusätzlich aus <collection>_sensors (hot-reload)
+            if os.getenv("SENSOR_REGISTRY_MONGO", "").lower() in ("1", "true", "yes"):
+                get_registry().use_collection(self.sensors)
             
-            self.logger.log(logging.INFO, f"Collection '{collection}' loaded successfully")
-            logger.info(f"MongoDB Verbindung erfolgreich: default.{collection}")
+            self.logger.log(logging.INFO, "Collection '%s' loaded successfully", collection)
+            logger.info("MongoDB Verbindung erfolgreich: default.%s", collection)
             
         except Exception as e:
-            self.logger.log(logging.ERROR, f"Collection '{collection}' not found. {e}")
-            logger.error(f"MongoDB Verbindung fehlgeschlagen: {e}")
+            self.logger.log(logging.ERROR, "Collection '%s' not found. %s", collection, e)
+            logger.error("MongoDB Verbindung fehlgeschlagen: %s", e)
             raise
     
+    @classmethod
+    def from_env(cls, **kwargs) -> "BeehiveDbClient":
+        """
+        Client mit Collection und Layout aus der Umgebung (MONGO_COLLECTION, MONGO_LAYOUT),
+        damit Poller, job.py und retention.py dieselbe Collection im selben Layout nutzen.
+        """
+        kwargs.setdefault("collection", os.getenv("MONGO_COLLECTION", "digitalBeehive"))
+        kwargs.setdefault("layout", os.getenv("MONGO_LAYOUT", LAYOUT_FULL))
+        return cls(**kwargs)
+
     def _create_indexes(self):
         """Erstellt Unique Index auf (entityId, key, ts) um Duplikate zu verhindern"""
+        if self.layout == LAYOUT_COMPACT:
+            f = COMPACT_FIELDS
+            self._ensure_index([(f["sensorRef"], 1), (f["key"], 1), (f["ts"], 1)],
+                               unique=True, name="unique_sensor_reading")
+            self._ensure_index([("entityId", 1)], collection=self.sensors, unique=True, name="unique_entity")
+        elif self.layout == LAYOUT_BUCKET:
+            self._ensure_index([("entityId", 1), ("key", 1), ("hour", 1)],
+                               unique=True, name="unique_sensor_bucket")
+        else:
+            self._ensure_index([("entityId", 1), ("key", 1), ("ts", 1)],
+                               unique=True, name="unique_sensor_reading")
+            # Beuten-Sichten (Aggregationen)
+            self._ensure_index([("beehiveIds", 1), ("ts", 1)], name="beehive_ts")
+
+        # Zeitfenster über alle Sensoren (Aggregationen) und ggf. TTL der Rohdaten
+        ttl = {} if self.raw_ttl_days is None else {"expireAfterSeconds": int(self.raw_ttl_days * 86400)}
+        self._ensure_index([(self._ts_field(), 1)], name="ts_range", **ttl)
+        logger.debug("Unique Index erstellt/überprüft")
+
+    def _ensure_index(self, keys: list, collection=None, **kwargs):
+        """Legt einen Index an; Fehler (z.B. abweichende Optionen) betreffen nur diesen Index."""
         try:
-            self.collection.create_index(
-                [("entityId", 1), ("key", 1), ("ts", 1)],
-                unique=True,
-                name="unique_sensor_reading"
-            )
-            logger.debug("Unique Index erstellt/überprüft")
+            (collection if collection is not None else self.collection).create_index(keys, **kwargs)
         except Exception as e:
-            logger.warning(f"Index-Erstellung fehlgeschlagen (evtl. existiert bereits): {e}")
-    
+            logger.warning("Index-Erstellung '%s' fehlgeschlagen (evtl. existiert bereits): %s", kwargs.get("name"), e)
+
+    def _ts_field(self) -> str:
+        """Zeitfeld des Layouts (für Zeitfenster- und TTL-Index)."""
+        if self.layout == LAYOUT_COMPACT:
+            return COMPACT_FIELDS["ts"]
+        return "hour" if self.layout == LAYOUT_BUCKET else "ts"
+
+    def use_seen_filter(self, seen_filter, warm: bool = True):
+        """
+        Schaltet den Dedup-Filter (util.recentlySeen.RecentlySeen) vor den Inserts ein:
+        bekannte (entityId, key, ts) gehen gar nicht erst an MongoDB.
+        """
+        self.seen_filter = seen_filter
+        if warm:
+            seen_filter.warm(self)
+
+    def _drop_seen(self, keys: list) -> list:
+        """Maske der noch unbekannten Messwerte (alle True ohne Filter)."""
+        if self.seen_filter is None:
+            return [True] * len(keys)
+        return self.seen_filter.unseen(keys)
+
+    def _remember(self, keys: list, result: Dict[str, int], filtered: int) -> Dict[str, int]:
+        """Geschriebene Messwerte im Filter merken; verworfene zählen als Duplikate."""
+        if self.seen_filter is not None:
+            # Bei sonstigen Fehlern nichts merken: im nächsten Zyklus entscheidet wieder MongoDB
+            if not result["errors"]:
+                self.seen_filter.add(keys)
+            self.seen_filter.db_duplicates += result["duplicates"]
+            if filtered:
+                logger.info("Dedup-Filter: %d bekannte Messwerte nicht gesendet", filtered)
+        return {**result, "duplicates": result["duplicates"] + filtered}
+
     def insert_many(self, df: pd.DataFrame) -> Dict[str, int]:
         """
         Fügt DataFrame in MongoDB ein. Duplikate werden übersprungen.
         
         Args:
-            df: DataFrame mit Sensordaten
+            df: DataFrame mit Sensordaten (wird ins kompakte Schema gebracht)
             
         Returns:
             Dict mit 'inserted', 'duplicates', 'errors'
@@ -76,44 +200,96 @@ class BeehiveDbClient:
             logger.warning("Leerer DataFrame übergeben, nichts zu speichern")
             return {"inserted": 0, "duplicates": 0, "errors": 0}
         
-        # TimeParser für Zeitstempel-Konvertierung (wenn aktiviert)
-        if self.isTimeSeries:
-            tp = TimeParser()
-            docs = tp.inject_bson_datetime(df, replace_ts=True).to_dict("records")
+        # Kompaktes Schema -> Dokumente (ts als BSON-Datum, wenn aktiviert)
+        readings = compact_readings(df)
+        keys = list(zip(readings["entityId"].astype(str).tolist(), readings["key"].astype(str).tolist(),
+                        readings["ts"].tolist()))
+        mask = self._drop_seen(keys)
+        filtered = mask.count(False)
+        if filtered:
+            readings = readings[mask]
+            keys = [k for k, keep in zip(keys, mask) if keep]
+        if readings.empty:
+            return self._remember(keys, {"inserted": 0, "duplicates": 0, "errors": 0}, filtered)
+
+        if self.layout == LAYOUT_BUCKET:
+            return self._remember(keys, self._insert_buckets(readings), filtered)
+        if self.layout == LAYOUT_COMPACT:
+            docs = self._to_compact_documents(readings)
         else:
-            docs = df.to_dict("records")
-        
-        # Einfügen mit Duplikats-Behandlung
+            docs = to_documents(readings, bson_ts=self.isTimeSeries)
+        return self._remember(keys, self.insert_documents(docs), filtered)
+
+    def insert_documents(self, docs: list[dict]) -> Dict[str, int]:
+        """
+        Fügt fertige Dokumente in einem Bulk-Insert ein (ordered=False):
+        Duplikate (Unique Index) werden gezählt, der Rest wird trotzdem geschrieben.
+
+        Returns:
+            Dict mit 'inserted', 'duplicates', 'errors'
+        """
         inserted = 0
         duplicates = 0
         errors_count = 0
-        
-        for doc in docs:
+
+        if docs:
             try:
-                self.collection.insert_one(doc)
-                inserted += 1
-            except errors.DuplicateKeyError:
-                duplicates += 1
-                logger.debug(
-                    f"Duplikat übersprungen: entityId={doc.get('entityId')}, "
-                    f"key={doc.get('key')}, ts={doc.get('ts')}"
-                )
+                inserted = len(self.collection.insert_many(docs, ordered=False).inserted_ids)
+            except errors.BulkWriteError as e:
+                inserted = e.details.get("nInserted", 0)
+                duplicates, errors_count = _count_write_errors(e.details, "Fehler beim Einfügen")
             except Exception as e:
-                errors_count += 1
-                logger.error(f"Fehler beim Einfügen: {e}")
-                logger.debug(f"Problematisches Dokument: {doc}")
-        
+                errors_count = len(docs)
+                logger.error("Fehler beim Einfügen: %s", e)
+
         # Logging des Ergebnisses
-        logger.info(
-            f"MongoDB Insert: {inserted} eingefügt, "
-            f"{duplicates} Duplikate übersprungen, {errors_count} Fehler"
-        )
+        logger.info("MongoDB Insert: %d eingefügt, %d Duplikate übersprungen, %d Fehler",
+                    inserted, duplicates, errors_count)
         
         return {
             "inserted": inserted,
             "duplicates": duplicates,
             "errors": errors_count
         }
+
+    def insert_records(self, records: list[dict]) -> Dict[str, int]:
+        """
+        Schlanker Pfad ohne pandas: Messwerte als Dicts {entityId, key, ts (Epoch-ms), value}
+        direkt in Dokumente des Layouts umsetzen und gebündelt schreiben.
+
+        Returns:
+            Dict mit 'inserted', 'duplicates', 'errors'
+        """
+        keys = [(r["entityId"], r["key"], r["ts"]) for r in records]
+        mask = self._drop_seen(keys)
+        filtered = mask.count(False)
+        if filtered:
+            records = [r for r, keep in zip(records, mask) if keep]
+            keys = [k for k, keep in zip(keys, mask) if keep]
+        if not records:
+            return self._remember(keys, {"inserted": 0, "duplicates": 0, "errors": 0}, filtered)
+
+        meta: Dict[str, tuple] = {}
+        docs = []
+        for r in records:
+            eid = r["entityId"]
+            ts = EPOCH + timedelta(milliseconds=r["ts"]) if self.isTimeSeries else r["ts"]
+            if self.layout == LAYOUT_COMPACT:
+                f = COMPACT_FIELDS
+                docs.append({f["sensorRef"]: self._sensor_ref(eid), f["key"]: r["key"],
+                             f["ts"]: ts, f["value"]: r["value"]})
+            elif self.layout == LAYOUT_BUCKET:
+                docs.append({"entityId": eid, "key": r["key"], "ts": ts, "value": r["value"]})
+            else:
+                if eid not in meta:
+                    meta[eid] = (entity_id_to_sensor(eid), entity_to_beehives(eid))
+                name, hives = meta[eid]
+                docs.append({"entityId": eid, "sensorName": name, "key": r["key"],
+                             "ts": ts, "value": r["value"], "beehiveIds": hives})
+
+        if self.layout == LAYOUT_BUCKET:
+            return self._remember(keys, self._write_buckets(docs), filtered)
+        return self._remember(keys, self.insert_documents(docs), filtered)
     
     def insert_one(self, entry: dict) -> bool:
         """
@@ -127,45 +303,757 @@ class BeehiveDbClient:
         """
         try:
             self.collection.insert_one(entry)
-            logger.debug(f"Dokument eingefügt: {entry.get('entityId', 'unknown')}")
+            logger.debug("Dokument eingefügt: %s", entry.get("entityId", "unknown"))
             return True
         except errors.DuplicateKeyError:
-            logger.debug(f"Duplikat übersprungen: {entry.get('entityId', 'unknown')}")
+            logger.debug("Duplikat übersprungen: %s", entry.get("entityId", "unknown"))
             return False
         except Exception as e:
-            logger.error(f"Fehler beim Einfügen: {e}")
-            logger.debug(f"Problematisches Dokument: {entry}")
+            logger.error("Fehler beim Einfügen: %s", e)
+            logger.debug("Problematisches Dokument: %s", entry)
             return False
 
+    # --------- KOMPAKTES LAYOUT ---------
+
+    def _sensor_ref(self, entity_id: str, create: bool = True) -> Optional[int]:
+        """
+        Liefert die kurze numerische Referenz einer Entity und legt bei Bedarf
+        den Eintrag in der Referenz-Collection an.
+
+        Args:
+            create: False für Lesepfade – unbekannte Entity ergibt None statt eines neuen Eintrags
+        """
+        ref = self._sensor_refs.get(entity_id)
+        if ref is not None:
+            return ref
+
+        doc = self.sensors.find_one({"entityId": entity_id}, {"_id": 1})
+        if doc is None and not create:
+            return None
+        while doc is None:
+            last = self.sensors.find_one({}, {"_id": 1}, sort=[("_id", -1)])
+            new_id = last["_id"] + 1 if last else 1
+            sensor = entity_id_to_sensor(entity_id)
+            try:
+                self.sensors.insert_one({
+                    "_id": new_id,
+                    "entityId": entity_id,
+                    "sensorName": sensor,
+                    "sensorType": sensor_type(sensor) if sensor else None,
+                    "beehiveIds": entity_to_beehives(entity_id),
+                })
+                doc = {"_id": new_id}
+            except errors.DuplicateKeyError:
+                # Parallel angelegt (gleiche Entity oder gleiche _id) -> neu lesen
+                doc = self.sensors.find_one({"entityId": entity_id}, {"_id": 1})
+
+        self._sensor_refs[entity_id] = doc["_id"]
+        return doc["_id"]
+
+    def _load_sensor_meta(self) -> Dict[int, dict]:
+        """Lädt die (kleine) Referenz-Collection für Client-seitige Joins."""
+        self._sensor_meta = {d["_id"]: d for d in self.sensors.find({})}
+        self._sensor_refs.update({d["entityId"]: ref for ref, d in self._sensor_meta.items()})
+        return self._sensor_meta
+
+    def _to_compact_documents(self, readings: pd.DataFrame) -> list[dict]:
+        """Dokumente mit kurzen Feldnamen, ohne Metadaten und redundante Zeitfelder."""
+        f = COMPACT_FIELDS
+        return [
+            {f["sensorRef"]: self._sensor_ref(d["entityId"]), f["key"]: d["key"],
+             f["ts"]: d["ts"], f["value"]: d["value"]}
+            for d in to_documents(readings, bson_ts=self.isTimeSeries, with_beehives=False)
+        ]
+
+    # --------- BUCKET-LAYOUT ---------
+
+    def _insert_buckets(self, readings: pd.DataFrame) -> Dict[str, int]:
+        """
+        Hängt Messwerte per $push an den Stunden-Bucket an (Upsert).
+        Ein Messwert, dessen ts schon im Bucket steht, matcht den Filter nicht;
+        der Upsert scheitert dann am Unique Index und zählt als Duplikat.
+        """
+        return self._write_buckets(to_documents(readings, bson_ts=self.isTimeSeries, with_beehives=False))
+
+    def _write_buckets(self, docs: list[dict]) -> Dict[str, int]:
+        """Bucket-Upserts für Dokumente {entityId, key, ts, value}."""
+        ops = []
+        for doc in docs:
+            ts, value = doc["ts"], doc["value"]
+            ms = self._ts_ms(ts)
+            ops.append(UpdateOne(
+                {"entityId": doc["entityId"], "key": doc["key"],
+                 "hour": self._ts_bound(ms - ms % BUCKET_MS), "ts": {"$ne": ts}},
+                {"$push": {"ts": ts, "value": value},
+                 "$min": {"min": value}, "$max": {"max": value},
+                 "$inc": {"sum": value, "count": 1}},
+                upsert=True
+            ))
+
+        inserted = duplicates = errors_count = 0
+        if ops:
+            try:
+                result = self.collection.bulk_write(ops, ordered=False)
+                inserted = result.upserted_count + result.modified_count
+            except errors.BulkWriteError as e:
+                details = e.details
+                inserted = details.get("nUpserted", 0) + details.get("nModified", 0)
+                duplicates, errors_count = _count_write_errors(details, "Fehler beim Bucket-Update")
+
+        logger.info("MongoDB Bucket-Insert: %d eingefügt, %d Duplikate übersprungen, %d Fehler",
+                    inserted, duplicates, errors_count)
+        return {"inserted": inserted, "duplicates": duplicates, "errors": errors_count}
+
+    def _iter_bucket_frames(self, start=None, end=None, entity_ids=None, keys=None, *,
+                            batch_size: int = 1000, chunk_rows: int = 10000,
+                            sort: bool = False) -> Iterator[pd.DataFrame]:
+        """
+        Entpackt die Buckets im Fenster [start, end) spaltenweise in DataFrames
+        mit jeweils etwa chunk_rows Zeilen (kompaktes Schema). Innerhalb eines Buckets
+        wird nach ts sortiert; mit sort=True gilt die Reihenfolge (entityId, key, ts).
+        """
+        query = self._bucket_filter(start, end, entity_ids, keys)
+        start_ms = self._ts_ms(self._ts_bound(start)) if start is not None else None
+        end_ms = self._ts_ms(self._ts_bound(end)) if end is not None else None
+
+        def to_frame(entities, keys_col, ts_parts, value_parts) -> pd.DataFrame:
+            counts = [len(t) for t in ts_parts]
+            df = pd.DataFrame({
+                "entityId": pd.Categorical(np.repeat(entities, counts)),
+                "key": pd.Categorical(np.repeat(keys_col, counts)),
+                "ts": np.concatenate(ts_parts),
+                "value": np.concatenate(value_parts),
+            })
+            if start_ms is not None:
+                df = df[df["ts"] >= start_ms]
+            if end_ms is not None:
+                df = df[df["ts"] < end_ms]
+            return compact_readings(df)
+
+        entities, keys_col, ts_parts, value_parts = [], [], [], []
+        rows = 0
+        projection = {"_id": 0, "entityId": 1, "key": 1, "ts": 1, "value": 1}
+        cursor = self.collection.find(query, projection, batch_size=batch_size)
+        if sort:
+            cursor = cursor.sort([("entityId", 1), ("key", 1), ("hour", 1)])
+        for bucket in cursor:
+            n = len(bucket["ts"])
+            ts = np.fromiter((self._ts_ms(t) for t in bucket["ts"]), dtype="int64", count=n)
+            values = np.asarray(bucket["value"], dtype="float64")
+            # $push hängt verspätete Werte (Gap-Refill, übertragene Fenster) hinten an
+            if n > 1 and (np.diff(ts) < 0).any():
+                order = np.argsort(ts, kind="stable")
+                ts, values = ts[order], values[order]
+            entities.append(bucket["entityId"])
+            keys_col.append(bucket["key"])
+            ts_parts.append(ts)
+            value_parts.append(values)
+            rows += n
+            if rows >= chunk_rows:
+                yield to_frame(entities, keys_col, ts_parts, value_parts)
+                entities, keys_col, ts_parts, value_parts = [], [], [], []
+                rows = 0
+
+        if ts_parts:
+            yield to_frame(entities, keys_col, ts_parts, value_parts)
+
+    def _bucket_filter(self, start=None, end=None, entity_ids=None, keys=None) -> dict:
+        """Filter auf die Stunden-Buckets, die das Fenster [start, end) berühren."""
+        query = self._reading_filter(None, None, entity_ids, keys)
+        if start is not None or end is not None:
+            query["hour"] = {}
+            if start is not None:
+                start_ms = self._ts_ms(self._ts_bound(start))
+                query["hour"]["$gte"] = self._ts_bound(start_ms - start_ms % BUCKET_MS)
+            if end is not None:
+                query["hour"]["$lt"] = self._ts_bound(end)
+        return query
+
+    def _read_buckets(self, start=None, end=None, entity_ids=None, keys=None,
+                      batch_size: int = 1000) -> pd.DataFrame:
+        """Entpackt alle Buckets im Fenster [start, end) in einen DataFrame."""
+        frames = list(self._iter_bucket_frames(start, end, entity_ids, keys, batch_size=batch_size))
+        if not frames:
+            return empty_readings()
+        return concat_readings(frames) if len(frames) > 1 else frames[0]
+
+    def _ts_ms(self, value) -> int:
+        """Gespeicherten ts-Wert (BSON-Datum oder Epoch-ms) in Epoch-ms umrechnen."""
+        if isinstance(value, datetime):
+            if value.tzinfo is None:
+                value = value.replace(tzinfo=timezone.utc)
+            return int((value - EPOCH) / timedelta(milliseconds=1))
+        return int(value)
+
+    def _ts_bound(self, value):
+        """Zeitgrenze (Epoch-ms oder datetime) im gespeicherten ts-Format (naive UTC bzw. ms)."""
+        value = self._ts_ms(value)
+        if not self.isTimeSeries:
+            return int(value)
+        return (EPOCH + timedelta(milliseconds=int(value))).replace(tzinfo=None)
+
+    def _reading_filter(self, start=None, end=None, entity_ids=None, keys=None) -> dict:
+        """Mongo-Filter für ein Zeitfenster [start, end) im Feldnamen-Schema des Layouts."""
+        compact = self.layout == LAYOUT_COMPACT
+        f_entity = COMPACT_FIELDS["sensorRef"] if compact else "entityId"
+        f_key = COMPACT_FIELDS["key"] if compact else "key"
+        f_ts = COMPACT_FIELDS["ts"] if compact else "ts"
+
+        query: dict = {}
+        if entity_ids is not None:
+            ids = list(entity_ids)
+            if compact:
+                # Nur nachschlagen: unbekannte Entities haben keine Messwerte (leeres Ergebnis)
+                ids = [ref for ref in (self._sensor_ref(e, create=False) for e in ids) if ref is not None]
+            query[f_entity] = {"$in": ids}
+        if keys is not None:
+            query[f_key] = {"$in": list(keys)}
+        if start is not None or end is not None:
+            query[f_ts] = {}
+            if start is not None:
+                query[f_ts]["$gte"] = self._ts_bound(start)
+            if end is not None:
+                query[f_ts]["$lt"] = self._ts_bound(end)
+        return query
+
+    def find_documents(self, start=None, end=None, entity_ids=None, keys=None, *,
+                       fields: Optional[list[str]] = None, use_lookup: bool = False,
+                       batch_size: int = 5000, sort: bool = False) -> Iterator[dict]:
+        """
+        Liest Messwerte in der vollen Sicht (entityId, sensorName, beehiveIds, key, ts, value),
+        unabhängig vom Speicher-Layout.
+
+        Args:
+            start, end: Zeitfenster [start, end) als datetime oder Epoch-ms
+            entity_ids, keys: optionale Filter
+            fields: nur diese Felder der vollen Sicht liefern (Projection)
+            use_lookup: im kompakten Layout serverseitig per $lookup joinen
+                        statt Client-seitig über die Referenz-Collection
+            batch_size: Cursor-Batchgröße
+            sort: nach (entityId, key, ts) entlang des Unique Index sortieren
+
+        Yields:
+            Dokumente in der vollen Sicht
+        """
+        wanted = fields or READING_COLUMNS + ["beehiveIds"]
+
+        if self.layout == LAYOUT_BUCKET:
+            for df in self._iter_bucket_frames(start, end, entity_ids, keys, sort=sort):
+                hives = {e: entity_to_beehives(e) for e in df["entityId"].cat.categories}
+                for doc in to_documents(df, bson_ts=self.isTimeSeries, with_beehives=False):
+                    if "beehiveIds" in wanted:
+                        doc["beehiveIds"] = hives.get(doc["entityId"], [])
+                    yield {k: v for k, v in doc.items() if k in wanted}
+            return
+
+        query = self._reading_filter(start, end, entity_ids, keys)
+
+        if self.layout == LAYOUT_FULL:
+            projection = {"_id": 0, **{f: 1 for f in wanted}}
+            cursor = self.collection.find(query, projection, batch_size=batch_size)
+            if sort:
+                cursor = cursor.sort([("entityId", 1), ("key", 1), ("ts", 1)])
+            yield from cursor
+            return
+
+        f = COMPACT_FIELDS
+        stored = {"key": f["key"], "ts": f["ts"], "value": f["value"]}
+        meta_fields = [m for m in ("entityId", "sensorName", "beehiveIds") if m in wanted]
+
+        if use_lookup:
+            pipeline = [{"$match": query}]
+            if sort:
+                pipeline.append({"$sort": {f["sensorRef"]: 1, f["key"]: 1, f["ts"]: 1}})
+            if meta_fields:
+                pipeline += [
+                    {"$lookup": {"from": self.sensors.name, "localField": f["sensorRef"],
+                                 "foreignField": "_id", "as": "_sensor"}},
+                    {"$unwind": "$_sensor"},
+                ]
+            project = {"_id": 0}
+            project.update({m: f"$_sensor.{m}" for m in meta_fields})
+            project.update({name: f"${short}" for name, short in stored.items() if name in wanted})
+            pipeline.append({"$project": project})
+            yield from self.collection.aggregate(pipeline, batchSize=batch_size)
+            return
+
+        projection = {"_id": 0, f["sensorRef"]: 1}
+        projection.update({short: 1 for name, short in stored.items() if name in wanted})
+        meta = self._sensor_meta or self._load_sensor_meta()
+        cursor = self.collection.find(query, projection, batch_size=batch_size)
+        if sort:
+            cursor = cursor.sort([(f["sensorRef"], 1), (f["key"], 1), (f["ts"], 1)])
+        for doc in cursor:
+            sensor = meta.get(doc[f["sensorRef"]]) or self._load_sensor_meta().get(doc[f["sensorRef"]], {})
+            out = {m: sensor.get(m) for m in meta_fields}
+            out.update({name: doc.get(short) for name, short in stored.items() if name in wanted})
+            yield out
+
+    def find_readings(self, start=None, end=None, entity_ids=None, keys=None, *,
+                      use_lookup: bool = False, batch_size: int = 5000) -> pd.DataFrame:
+        """
+        Wie find_documents, aber als DataFrame im kompakten In-Memory-Schema
+        (ohne beehiveIds, siehe util.schema.beehive_dimension).
+        """
+        if self.layout == LAYOUT_BUCKET:
+            return self._read_buckets(start, end, entity_ids, keys)
+
+        columns: Dict[str, list] = {c: [] for c in READING_COLUMNS}
+        for doc in self.find_documents(start, end, entity_ids, keys, fields=READING_COLUMNS,
+                                       use_lookup=use_lookup, batch_size=batch_size):
+            for c in READING_COLUMNS:
+                columns[c].append(doc.get(c))
+        return compact_readings(pd.DataFrame(columns))
+
+    def iter_reading_batches(self, start=None, end=None, entity_ids=None, keys=None, *,
+                             batch_size: int = 10000) -> Iterator[pd.DataFrame]:
+        """
+        Streamt Messwerte im Fenster [start, end) als DataFrames im kompakten Schema
+        mit höchstens batch_size Zeilen, sortiert nach (entityId, key, ts).
+        Der Speicherbedarf hängt nur von batch_size ab, nicht von der Fenstergröße.
+        """
+        if self.layout == LAYOUT_BUCKET:
+            yield from self._iter_bucket_frames(start, end, entity_ids, keys,
+                                                chunk_rows=batch_size, sort=True)
+            return
+
+        columns: Dict[str, list] = {c: [] for c in READING_COLUMNS}
+        rows = 0
+        for doc in self.find_documents(start, end, entity_ids, keys, fields=READING_COLUMNS,
+                                       batch_size=batch_size, sort=True):
+            for c in READING_COLUMNS:
+                columns[c].append(doc.get(c))
+            rows += 1
+            if rows >= batch_size:
+                yield compact_readings(pd.DataFrame(columns))
+                columns = {c: [] for c in READING_COLUMNS}
+                rows = 0
+        if rows:
+            yield compact_readings(pd.DataFrame(columns))
+
+    # --------- AGGREGATIONEN (serverseitig) ---------
+
+    def _reading_stages(self, start=None, end=None, entity_ids=None, keys=None) -> list[dict]:
+        """
+        Pipeline-Anfang, der für jedes Layout Dokumente der Form
+        {entityId, key, ts, value} liefert (im kompakten Layout ist entityId die Sensor-Referenz).
+        """
+        if self.layout == LAYOUT_BUCKET:
+            stages = [
+                {"$match": self._bucket_filter(start, end, entity_ids, keys)},
+                {"$project": {"_id": 0, "entityId": 1, "key": 1,
+                              "r": {"$zip": {"inputs": ["$ts", "$value"]}}}},
+                {"$unwind": "$r"},
+                {"$project": {"entityId": 1, "key": 1,
+                              "ts": {"$arrayElemAt": ["$r", 0]}, "value": {"$arrayElemAt": ["$r", 1]}}},
+            ]
+            window = self._reading_filter(start, end)
+            if window:
+                stages.append({"$match": window})
+            return stages
+
+        stages = [{"$match": self._reading_filter(start, end, entity_ids, keys)}]
+        if self.layout == LAYOUT_COMPACT:
+            f = COMPACT_FIELDS
+            stages.append({"$project": {"_id": 0, "entityId": f"${f['sensorRef']}", "key": f"${f['key']}",
+                                        "ts": f"${f['ts']}", "value": f"${f['value']}"}})
+        return stages
+
+    def _frame_from_cursor(self, cursor, columns: Dict[str, str], resolve_refs: bool = True) -> pd.DataFrame:
+        """
+        Dekodiert einen (gebatchten) Aggregations-Cursor direkt in typisierte Spalten.
+
+        Args:
+            cursor: Iterator über flache Dokumente
+            columns: Spaltenname -> "category" | "ts" (Epoch-ms int64) | "float64" | "int64"
+            resolve_refs: im kompakten Layout Sensor-Referenzen in entityId auflösen
+        """
+        typecodes = {"ts": "q", "float64": "d", "int64": "q"}
+        buffers = {c: array("i") if kind == "category" else array(typecodes[kind])
+                   for c, kind in columns.items()}
+        codes: Dict[str, Dict] = {c: {} for c, kind in columns.items() if kind == "category"}
+
+        for doc in cursor:
+            for c, kind in columns.items():
+                v = doc.get(c)
+                if kind == "category":
+                    buffers[c].append(codes[c].setdefault(v, len(codes[c])))
+                elif kind == "ts":
+                    buffers[c].append(self._ts_ms(v))
+                elif kind == "float64":
+                    buffers[c].append(float("nan") if v is None else float(v))
+                else:
+                    buffers[c].append(int(v or 0))
+
+        data = {}
+        for c, kind in columns.items():
+            if kind == "category":
+                data[c] = pd.Categorical.from_codes(np.frombuffer(buffers[c], dtype=np.int32),
+                                                    categories=list(codes[c]))
+            else:
+                data[c] = np.frombuffer(buffers[c], dtype=np.float64 if kind == "float64" else np.int64)
+        df = pd.DataFrame(data)
+
+        if resolve_refs and self.layout == LAYOUT_COMPACT and "entityId" in df.columns:
+            meta = self._load_sensor_meta()
+            df["entityId"] = df["entityId"].cat.rename_categories(
+                [meta.get(ref, {}).get("entityId", str(ref)) for ref in df["entityId"].cat.categories])
+        if "entityId" in df.columns and "sensorName" not in df.columns:
+            df.insert(df.columns.get_loc("entityId") + 1, "sensorName",
+                      get_registry().sensor_names(df["entityId"]))
+        return df
+
+    def _ts_expr(self) -> object:
+        """ts als BSON-Datum (Epoch-ms werden serverseitig umgewandelt)."""
+        return "$ts" if self.isTimeSeries else {"$toDate": "$ts"}
+
+    def _bucket_expr(self, unit: str, bin_size: int, tz: str) -> dict:
+        return {"$dateTrunc": {"date": self._ts_expr(), "unit": unit, "binSize": bin_size, "timezone": tz}}
+
+    # Kennzahlen pro Zeit-Bucket (aggregate_stats, beehive_stats, Rollups)
+    STATS_ACCUMULATORS = {
+        "count": {"$sum": 1},
+        "sum": {"$sum": "$value"},
+        "min": {"$min": "$value"},
+        "max": {"$max": "$value"},
+        "mean": {"$avg": "$value"},
+    }
+    STATS_COLUMNS = {"count": "int64", "sum": "float64", "min": "float64", "max": "float64", "mean": "float64"}
+
+    def aggregate_stats(self, start=None, end=None, *, unit: str = "hour", bin_size: int = 1,
+                        entity_ids=None, keys=None, tz: str = "Europe/Berlin",
+                        batch_size: int = 5000) -> pd.DataFrame:
+        """
+        Zeit-Buckets pro Sensor und Key, serverseitig per $dateTrunc/$group berechnet.
+
+        Args:
+            start, end: Zeitfenster [start, end) als datetime oder Epoch-ms
+            unit, bin_size: Bucketgröße für $dateTrunc (z.B. "minute"/15, "hour"/1, "day"/1)
+            entity_ids, keys: optionale Filter
+            tz: Zeitzone für Tages-/Wochengrenzen
+
+        Returns:
+            DataFrame mit entityId, sensorName, key, ts (Bucket-Beginn, Epoch-ms),
+            count, sum, min, max, mean
+        """
+        pipeline = self._reading_stages(start, end, entity_ids, keys) + [
+            {"$group": {
+                "_id": {"e": "$entityId", "k": "$key", "b": self._bucket_expr(unit, bin_size, tz)},
+                **self.STATS_ACCUMULATORS,
+            }},
+            {"$project": {"_id": 0, "entityId": "$_id.e", "key": "$_id.k", "ts": "$_id.b",
+                          **{c: 1 for c in self.STATS_COLUMNS}}},
+            {"$sort": {"entityId": 1, "key": 1, "ts": 1}},
+        ]
+        cursor = self.collection.aggregate(pipeline, batchSize=batch_size, allowDiskUse=True)
+        return self._frame_from_cursor(cursor, {
+            "entityId": "category", "key": "category", "ts": "ts", **self.STATS_COLUMNS,
+        })
+
+    def beehive_stats(self, start=None, end=None, *, unit: str = "hour", bin_size: int = 1,
+                      beehive_ids=None, keys=None, tz: str = "Europe/Berlin",
+                      batch_size: int = 5000) -> pd.DataFrame:
+        """
+        Wie aggregate_stats, aber pro Beute: beehiveIds wird serverseitig per $unwind
+        aufgelöst (ein Sensor kann mehreren Beuten zugeordnet sein, z.B. die Wetterstation).
+
+        Returns:
+            DataFrame mit beehiveId, entityId, sensorName, key, ts, count, sum, min, max, mean
+        """
+        if self.layout == LAYOUT_BUCKET:
+            # Buckets tragen keine Beuten-Zuordnung -> über die Dimensionstabelle joinen
+            from util.schema import beehive_dimension
+            dim = beehive_dimension()
+            if beehive_ids is not None:
+                dim = dim[dim["beehiveId"].isin(list(beehive_ids))]
+            stats = self.aggregate_stats(start, end, unit=unit, bin_size=bin_size,
+                                         entity_ids=dim["entityId"].astype(str).unique(),
+                                         keys=keys, tz=tz, batch_size=batch_size)
+            out = dim.astype({"entityId": str}).merge(stats.astype({"entityId": str}), on="entityId")
+            out["entityId"] = out["entityId"].astype("category")
+            return out.sort_values(["beehiveId", "entityId", "key", "ts"], ignore_index=True)
+
+        stages = self._reading_stages(start, end, keys=keys)
+        hive_field = "$beehiveIds"
+        if self.layout == LAYOUT_COMPACT:
+            stages += [
+                {"$lookup": {"from": self.sensors.name, "localField": "entityId",
+                             "foreignField": "_id", "as": "_sensor"}},
+                {"$unwind": "$_sensor"},
+            ]
+            hive_field = "$_sensor.beehiveIds"
+        elif beehive_ids is not None:
+            # Multikey-Index beehive_ts vor dem $unwind nutzen
+            stages[0]["$match"]["beehiveIds"] = {"$in": list(beehive_ids)}
+        stages.append({"$unwind": hive_field})
+        if beehive_ids is not None:
+            stages.append({"$match": {hive_field[1:]: {"$in": list(beehive_ids)}}})
+
+        pipeline = stages + [
+            {"$group": {
+                "_id": {"h": hive_field, "e": "$entityId", "k": "$key",
+                        "b": self._bucket_expr(unit, bin_size, tz)},
+                **self.STATS_ACCUMULATORS,
+            }},
+            {"$project": {"_id": 0, "beehiveId": "$_id.h", "entityId": "$_id.e", "key": "$_id.k",
+                          "ts": "$_id.b", **{c: 1 for c in self.STATS_COLUMNS}}},
+            {"$sort": {"beehiveId": 1, "entityId": 1, "key": 1, "ts": 1}},
+        ]
+        cursor = self.collection.aggregate(pipeline, batchSize=batch_size, allowDiskUse=True)
+        df = self._frame_from_cursor(cursor, {
+            "beehiveId": "int64", "entityId": "category", "key": "category", "ts": "ts",
+            **self.STATS_COLUMNS,
+        })
+        df["beehiveId"] = df["beehiveId"].astype("int16")
+        return df
+
+    def latest_per_sensor(self, entity_ids=None, keys=None, batch_size: int = 5000) -> pd.DataFrame:
+        """
+        Letzter Messwert pro (entityId, key). $sort + $group/$first in Richtung des
+        Unique Index, damit MongoDB nur den jeweils letzten Indexeintrag liest.
+
+        Returns:
+            DataFrame mit entityId, sensorName, key, ts (Epoch-ms), value
+        """
+        if self.layout == LAYOUT_BUCKET:
+            last = {"$max": "$ts"}
+            pipeline = [
+                {"$match": self._bucket_filter(entity_ids=entity_ids, keys=keys)},
+                {"$sort": {"entityId": -1, "key": -1, "hour": -1}},
+                {"$group": {"_id": {"e": "$entityId", "k": "$key"}, "ts": {"$first": last},
+                            "value": {"$first": {"$arrayElemAt": [
+                                "$value", {"$indexOfArray": ["$ts", last]}]}}}},
+            ]
+        else:
+            f = COMPACT_FIELDS if self.layout == LAYOUT_COMPACT else \
+                {"sensorRef": "entityId", "key": "key", "ts": "ts", "value": "value"}
+            pipeline = [
+                {"$match": self._reading_filter(entity_ids=entity_ids, keys=keys)},
+                {"$sort": {f["sensorRef"]: -1, f["key"]: -1, f["ts"]: -1}},
+                {"$group": {"_id": {"e": f"${f['sensorRef']}", "k": f"${f['key']}"},
+                            "ts": {"$first": f"${f['ts']}"}, "value": {"$first": f"${f['value']}"}}},
+            ]
+        pipeline += [
+            {"$project": {"_id": 0, "entityId": "$_id.e", "key": "$_id.k", "ts": 1, "value": 1}},
+            {"$sort": {"entityId": 1, "key": 1}},
+        ]
+        cursor = self.collection.aggregate(pipeline, batchSize=batch_size)
+        return self._frame_from_cursor(cursor, {
+            "entityId": "category", "key": "category", "ts": "ts", "value": "float64",
+        })
+
+    # --------- RETENTION: TTL & ROLLUPS ---------
+
+    def apply_raw_ttl(self, days: float):
+        """
+        Setzt (oder ändert) die TTL der Rohdaten auf dem Zeitfenster-Index ts_range.
+        Bestehende Indexe werden per collMod umgestellt, sonst neu angelegt.
+        """
+        if not self.isTimeSeries:
+            raise ValueError("TTL benötigt ts als BSON-Datum (isTimeSeries=True)")
+        seconds = int(days * 86400)
+        try:
+            self.db.command("collMod", self.collection.name,
+                            index={"name": "ts_range", "expireAfterSeconds": seconds})
+        except errors.OperationFailure as e:
+            logger.info("collMod für TTL nicht möglich (%s), lege ts_range neu an", e)
+            try:
+                self.collection.drop_index("ts_range")
+            except errors.OperationFailure:
+                pass
+            self.collection.create_index([(self._ts_field(), 1)], name="ts_range", expireAfterSeconds=seconds)
+        self.raw_ttl_days = days
+        logger.info("Rohdaten-TTL: %s Tage (%s)", days, self.collection.name)
+
+    def rollup_collection(self, unit: str):
+        """Collection der Rollups einer Auflösung, z.B. digitalBeehive_rollup_hour."""
+        return self.db[f"{self.collection.name}_rollup_{unit}"]
+
+    def build_rollups(self, unit: str = "hour", start=None, end=None, *,
+                      tz: str = "Europe/Berlin", ttl_days: Optional[float] = None) -> int:
+        """
+        Verdichtet Rohdaten serverseitig zu Zeit-Buckets und schreibt sie per $merge
+        in die Rollup-Collection (idempotent: Buckets werden ersetzt).
+        Ohne start wird ab dem letzten vorhandenen Rollup-Bucket fortgesetzt.
+
+        Args:
+            unit: "hour" oder "day" (Bucketgröße)
+            start, end: Zeitfenster [start, end) als datetime oder Epoch-ms
+            tz: Zeitzone für Tagesgrenzen
+            ttl_days: Aufbewahrung der Rollups (None = unbegrenzt)
+
+        Returns:
+            Anzahl Rollup-Buckets in der Collection
+        """
+        target = self.rollup_collection(unit)
+        ttl = {} if ttl_days is None else {"expireAfterSeconds": int(ttl_days * 86400)}
+        self._ensure_index([("ts", 1)], collection=target, name="ts_range", **ttl)
+        self._ensure_index([("entityId", 1), ("key", 1), ("ts", 1)], collection=target,
+                           name="unique_sensor_rollup", unique=True)
+
+        if start is None:
+            # Letzten (evtl. unvollständigen) Bucket neu berechnen
+            last = target.find_one({}, {"ts": 1}, sort=[("ts", -1)])
+            if last is not None:
+                start = last["ts"]
+
+        stages = self._reading_stages(start, end)
+        if self.layout == LAYOUT_COMPACT:
+            stages += [
+                {"$lookup": {"from": self.sensors.name, "localField": "entityId",
+                             "foreignField": "_id", "as": "_sensor"}},
+                {"$set": {"entityId": {"$first": "$_sensor.entityId"}}},
+            ]
+        pipeline = stages + [
+            {"$group": {
+                "_id": {"e": "$entityId", "k": "$key", "b": self._bucket_expr(unit, 1, tz)},
+                **self.STATS_ACCUMULATORS,
+            }},
+            {"$project": {"_id": 0, "entityId": "$_id.e", "key": "$_id.k", "ts": "$_id.b",
+                          **{c: 1 for c in self.STATS_COLUMNS}}},
+            {"$merge": {"into": target.name, "on": ["entityId", "key", "ts"],
+                        "whenMatched": "replace", "whenNotMatched": "insert"}},
+        ]
+        self.collection.aggregate(pipeline, allowDiskUse=True)
+        count = target.estimated_document_count()
+        logger.info("Rollups '%s' aktualisiert (%d Buckets)", target.name, count)
+        return count
+
+    def read_rollups(self, unit: str = "hour", start=None, end=None, entity_ids=None, keys=None,
+                     batch_size: int = 5000) -> pd.DataFrame:
+        """
+        Liest Rollups (auch für Zeiträume, deren Rohdaten per TTL schon gelöscht sind).
+
+        Returns:
+            DataFrame mit entityId, sensorName, key, ts (Bucket-Beginn, Epoch-ms), count, sum, min, max, mean
+        """
+        query: dict = {}
+        if entity_ids is not None:
+            query["entityId"] = {"$in": list(entity_ids)}
+        if keys is not None:
+            query["key"] = {"$in": list(keys)}
+        if start is not None or end is not None:
+            # Rollup-ts ist immer ein BSON-Datum
+            def bound(v):
+                return (EPOCH + timedelta(milliseconds=self._ts_ms(v))).replace(tzinfo=None)
+            query["ts"] = {}
+            if start is not None:
+                query["ts"]["$gte"] = bound(start)
+            if end is not None:
+                query["ts"]["$lt"] = bound(end)
+        cursor = self.rollup_collection(unit).find(
+            query, {"_id": 0}, batch_size=batch_size).sort([("entityId", 1), ("key", 1), ("ts", 1)])
+        return self._frame_from_cursor(cursor, {
+            "entityId": "category", "key": "category", "ts": "ts", **self.STATS_COLUMNS,
+        }, resolve_refs=False)
+
+    # --------- ABGELEITETE KENNZAHLEN PRO BEUTE (siehe util.derived) ---------
+
+    def derived_collection(self):
+        """Collection der abgeleiteten Beuten-Reihen, z.B. digitalBeehive_derived."""
+        return self.db[f"{self.collection.name}_derived"]
+
+    def derived_watermark(self) -> Optional[int]:
+        """Letzter gespeicherter Rasterpunkt (Epoch-ms) oder None."""
+        last = self.derived_collection().find_one({}, {"ts": 1}, sort=[("ts", -1)])
+        return None if last is None else self._ts_ms(last["ts"])
+
+    def upsert_derived(self, df: pd.DataFrame) -> int:
+        """
+        Schreibt abgeleitete Punkte (beehiveId, metric, ts, value) per Upsert,
+        ein erneuter Lauf über dasselbe Fenster ersetzt die Werte.
+
+        Returns:
+            Anzahl eingefügter oder geänderter Punkte
+        """
+        target = self.derived_collection()
+        self._ensure_index([("beehiveId", 1), ("metric", 1), ("ts", 1)], collection=target,
+                           name="unique_hive_metric", unique=True)
+        self._ensure_index([("ts", 1)], collection=target, name="ts_range")
+        if df.empty:
+            return 0
+
+        hives = df["beehiveId"].to_numpy().tolist()
+        metrics = df["metric"].astype(str).tolist()
+        ts = [EPOCH + timedelta(milliseconds=t) for t in df["ts"].to_numpy("int64").tolist()]
+        values = df["value"].to_numpy("float64").tolist()
+        ops = [
+            UpdateOne({"beehiveId": h, "metric": m, "ts": t}, {"$set": {"value": v}}, upsert=True)
+            for h, m, t, v in zip(hives, metrics, ts, values)
+        ]
+        result = target.bulk_write(ops, ordered=False)
+        return result.upserted_count + result.modified_count
+
+    def read_derived(self, start=None, end=None, beehive_ids=None, metrics=None,
+                     batch_size: int = 5000) -> pd.DataFrame:
+        """
+        Liest abgeleitete Reihen für Dashboards/Alarme.
+
+        Returns:
+            DataFrame mit beehiveId, metric, ts (Epoch-ms), value
+        """
+        query: dict = {}
+        if beehive_ids is not None:
+            query["beehiveId"] = {"$in": [int(b) for b in beehive_ids]}
+        if metrics is not None:
+            query["metric"] = {"$in": list(metrics)}
+        if start is not None or end is not None:
+            query["ts"] = {}
+            if start is not None:
+                query["ts"]["$gte"] = (EPOCH + timedelta(milliseconds=self._ts_ms(start))).replace(tzinfo=None)
+            if end is not None:
+                query["ts"]["$lt"] = (EPOCH + timedelta(milliseconds=self._ts_ms(end))).replace(tzinfo=None)
+        cursor = self.derived_collection().find(
+            query, {"_id": 0}, batch_size=batch_size).sort([("beehiveId", 1), ("metric", 1), ("ts", 1)])
+        df = self._frame_from_cursor(cursor, {
+            "beehiveId": "int64", "metric": "category", "ts": "ts", "value": "float64",
+        }, resolve_refs=False)
+        df["beehiveId"] = df["beehiveId"].astype("int16")
+        return df
+
     # --------- UPDATE-FUNKTIONEN (von Nils hinzugefügt) ---------
+    # Mit runner (siehe migration()) laufen die Updates batchweise, gedrosselt
+    # und fortsetzbar statt als ein unbegrenztes update_many.
+
+    def migration(self, name: str, **kwargs) -> MigrationRunner:
+        """
+        Erzeugt einen MigrationRunner für diese Collection.
+        kwargs: batch_size, max_docs_per_second, range_field, dry_run, report_every
+        """
+        return MigrationRunner(self.collection, name, **kwargs)
+
+    def _update_many(self, query: dict, update, runner: Optional[MigrationRunner]):
+        if runner is not None:
+            return runner.run(query, update)
+        return self.collection.update_many(query, update)
 
-    def update_add_field_all(self, field: str, value):
+    def update_add_field_all(self, field: str, value, runner: Optional[MigrationRunner] = None):
         """Fügt allen Dokumenten ein (neues) Feld hinzu bzw. überschreibt es."""
-        return self.collection.update_many({}, {"$set": {field: value}})
+        return self._update_many({}, {"$set": {field: value}}, runner)
 
-    def update_add_field_if_missing(self, field: str, value):
+    def update_add_field_if_missing(self, field: str, value, runner: Optional[MigrationRunner] = None):
         """Fügt das Feld nur hinzu, wenn es nicht existiert."""
-        return self.collection.update_many({field: {"$exists": False}}, {"$set": {field: value}})
+        return self._update_many({field: {"$exists": False}}, {"$set": {field: value}}, runner)
 
     def update_one_set(self, query: dict, set_fields: dict):
         """Setzt Felder für ein einzelnes (erstes) Match."""
         return self.collection.update_one(query, {"$set": set_fields})
 
-    def update_many_set(self, query: dict, set_fields: dict):
+    def update_many_set(self, query: dict, set_fields: dict, runner: Optional[MigrationRunner] = None):
         """Setzt Felder für alle Dokumente, die dem Filter entsprechen."""
-        return self.collection.update_many(query, {"$set": set_fields})
+        return self._update_many(query, {"$set": set_fields}, runner)
 
-    def update_many_pipeline(self, query: dict, pipeline: list):
+    def update_many_pipeline(self, query: dict, pipeline: list, runner: Optional[MigrationRunner] = None):
         """
         Update via Pipeline (MongoDB >= 4.2), z.B. berechnete Felder.
         Beispiel-Pipeline: [{"$set": {"tempC_avg": {"$avg": ["$TempC1","$TempC2","$TempC3"]}}}]
         """
-        return self.collection.update_many(query, pipeline)
+        return self._update_many(query, pipeline, runner)
 
-    def unset_fields(self, fields: list):
+    def unset_fields(self, fields: list, runner: Optional[MigrationRunner] = None):
         """Entfernt Felder aus allen Dokumenten."""
-        return self.collection.update_many({}, {"$unset": {f: "" for f in fields}})
+        return self._update_many({}, {"$unset": {f: "" for f in fields}}, runner)
 
-    def rename_field(self, old: str, new: str):
+    def rename_field(self, old: str, new: str, runner: Optional[MigrationRunner] = None):
         """Benennt ein Feld in allen Dokumenten um (falls vorhanden)."""
-        return self.collection.update_many({old: {"$exists": True}}, {"$rename": {old: new}})
\ No newline at end of file
+        return self._update_many({old: {"$exists": True}}, {"$rename": {old: new}}, runner)
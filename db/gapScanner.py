@@ -0,0 +1,271 @@
+from __future__ import annotations
+
+import time
+import logging
+import threading
+from statistics import median
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger("beehive_poller.gaps")
+
+Series = Tuple[str, str]
+Window = Tuple[int, int]
+
+GAP_FACTOR = 2.5                   # Lücke = Abstand > GAP_FACTOR * erwartetes Intervall
+MIN_GAP_MS = 2 * 60 * 1000         # kürzere Abstände nie als Lücke werten
+LEARN_HOURS = 24                   # Zeitraum, aus dem die Intervalle gelernt werden
+RELEARN_SECONDS = 6 * 60 * 60      # Intervalle so oft neu lernen
+
+
+def merge_windows(windows: List[Window]) -> List[Window]:
+    """Überlappende/angrenzende Zeitfenster zusammenfassen."""
+    merged: List[Window] = []
+    for start, end in sorted(windows):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+class GapScanner:
+    """
+    Lernt pro (entityId, key) das übliche Uplink-Intervall (Median der Abstände)
+    aus den gespeicherten Zeitstempeln (ein sortierter Scan alle relearn_seconds)
+    und sucht Lücken danach je bekannter Serie mit einer Bereichsabfrage, die auf
+    dem Unique Index (entityId, key, ts) liegt, statt jedes Mal über alle Serien
+    zu scannen und zu sortieren. Ohne pandas.
+    """
+
+    def __init__(self, db_client, *, factor: float = GAP_FACTOR, min_gap_ms: int = MIN_GAP_MS,
+                 learn_hours: int = LEARN_HOURS, relearn_seconds: int = RELEARN_SECONDS):
+        self.db_client = db_client
+        self.factor = factor
+        self.min_gap_ms = min_gap_ms
+        self.learn_hours = learn_hours
+        self.relearn_seconds = relearn_seconds
+        self.intervals: Dict[Series, int] = {}
+        self._learned_at: Optional[float] = None
+
+    def _iter_series(self, start_ms: int, end_ms: int, entity_ids=None,
+                     series: Optional[List[Series]] = None) -> Iterator[Tuple[Series, List[int]]]:
+        """
+        Zeitstempel (Epoch-ms, aufsteigend) pro Serie: mit `series` je Serie eine
+        indexgestützte Bereichsabfrage, sonst ein sortierter Scan über das Fenster.
+        """
+        if series is not None:
+            for entity_id, key in series:
+                ts = [self.db_client._ts_ms(doc["ts"])
+                      for doc in self.db_client.find_documents(start_ms, end_ms, [entity_id], [key],
+                                                               fields=["ts"], sort=True)]
+                if ts:
+                    yield (entity_id, key), ts
+            return
+        current: Optional[Series] = None
+        ts: List[int] = []
+        for doc in self.db_client.find_documents(start_ms, end_ms, entity_ids,
+                                                 fields=["entityId", "key", "ts"], sort=True):
+            series = (doc["entityId"], doc["key"])
+            if series != current:
+                if current is not None:
+                    yield current, ts
+                current, ts = series, []
+            ts.append(self.db_client._ts_ms(doc["ts"]))
+        if current is not None:
+            yield current, ts
+
+    @staticmethod
+    def _interval(ts: List[int]) -> Optional[int]:
+        diffs = [b - a for a, b in zip(ts, ts[1:]) if b > a]
+        return int(median(diffs)) if len(diffs) >= 2 else None
+
+    def learn_intervals(self, now_ms: Optional[int] = None) -> Dict[Series, int]:
+        """Erwartetes Intervall pro Serie aus den letzten learn_hours."""
+        now_ms = now_ms or int(time.time() * 1000)
+        learned = {}
+        for series, ts in self._iter_series(now_ms - self.learn_hours * 3600 * 1000, now_ms):
+            interval = self._interval(ts)
+            if interval:
+                learned[series] = interval
+        self.intervals = learned
+        self._learned_at = time.monotonic()
+        logger.info("Gap-Scanner: Intervalle für %d Serien gelernt", len(learned))
+        return learned
+
+    def threshold_ms(self, series: Series) -> Optional[int]:
+        interval = self.intervals.get(series)
+        return None if interval is None else max(self.min_gap_ms, int(self.factor * interval))
+
+    def find_gaps(self, start_ms: int, end_ms: int, entity_ids=None) -> Dict[Series, List[Window]]:
+        """
+        Lücken im Fenster [start, end) als {(entityId, key): [(von_ms, bis_ms), ...]}
+        (von/bis = letzter vorhandener Messwert bzw. Fenstergrenze).
+        Geprüft werden die Serien mit gelerntem Intervall; neue Serien kommen mit dem
+        nächsten Lernen (relearn_seconds) hinzu. Serien ohne Daten im Fenster fehlen ganz.
+        """
+        if self._learned_at is None or time.monotonic() - self._learned_at >= self.relearn_seconds:
+            self.learn_intervals(end_ms)
+
+        wanted = None if entity_ids is None else set(entity_ids)
+        known = sorted(s for s in self.intervals if wanted is None or s[0] in wanted)
+
+        gaps: Dict[Series, List[Window]] = {}
+        seen = set()
+        for series, ts in self._iter_series(start_ms, end_ms, series=known):
+            seen.add(series)
+            threshold = self.threshold_ms(series)
+            prev = start_ms
+            for t in ts:
+                if t - prev > threshold:
+                    gaps.setdefault(series, []).append((prev, t))
+                prev = t
+            if end_ms - prev > threshold:
+                gaps.setdefault(series, []).append((prev, end_ms))
+
+        for series in known:
+            if series not in seen and end_ms - start_ms > self.threshold_ms(series):
+                gaps[series] = [(start_ms, end_ms)]
+        return gaps
+
+
+class GapRefiller:
+    """
+    Hintergrund-Pass: sucht regelmäßig Lücken der letzten Stunden und holt nur die
+    fehlenden Fenster (und nur die fehlenden Keys) über die API nach. Gedrosselt über
+    einen Mindestabstand zwischen Requests und eine Obergrenze pro Durchlauf.
+    """
+
+    def __init__(self, client, db_client, auth_groups: List[Tuple[str, str]], *,
+                 scanner: Optional[GapScanner] = None,
+                 scan_interval_seconds: int = 15 * 60,
+                 scan_hours: int = 24,
+                 settle_minutes: int = 10,
+                 min_request_interval: float = 2.0,
+                 max_requests_per_pass: int = 30,
+                 max_attempts: int = 2,
+                 is_active: Optional[Callable[[], bool]] = None,
+                 on_records: Optional[Callable[[List[dict]], object]] = None):
+        """
+        Args:
+            client: eigener Client (nicht mit dem Poller teilen, Session ist nicht threadsicher)
+            db_client: BeehiveDbClient
+            auth_groups: [(Name, authGroup)], wie im Poller
+            scan_interval_seconds: Abstand zwischen zwei Durchläufen
+            scan_hours: so weit zurück nach Lücken suchen
+            settle_minutes: jüngste Minuten auslassen (deckt der reguläre Poll ab)
+            min_request_interval: Sekunden zwischen zwei Refill-Requests
+            max_requests_per_pass: Obergrenze Requests pro Durchlauf
+            max_attempts: so oft pro Lücke versuchen (Sensor offline -> Lücke bleibt)
+            is_active: Durchlauf nur, wenn True (z.B. nur das Leader-Replica)
+            on_records: erhält nachgeholte Messwerte zusätzlich (z.B. Live-Puffer des Pollers)
+        """
+        self.client = client
+        self.db_client = db_client
+        self.auth_groups = auth_groups
+        self.scanner = scanner or GapScanner(db_client)
+        self.scan_interval_seconds = scan_interval_seconds
+        self.scan_hours = scan_hours
+        self.settle_minutes = settle_minutes
+        self.min_request_interval = min_request_interval
+        self.max_requests_per_pass = max_requests_per_pass
+        self.max_attempts = max_attempts
+        self.is_active = is_active
+        self.on_records = on_records
+        self._attempts: Dict[Tuple[str, str, int], int] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _entity_groups(self) -> Dict[str, str]:
+        groups = {}
+        for name, auth_group in self.auth_groups:
+            try:
+                for eid in self.client.get_all_entity_ids(auth_group):
+                    groups[eid] = auth_group
+            except Exception as e:
+                logger.warning("Gap-Refill: Entities für %s nicht abrufbar: %s", name, e)
+        return groups
+
+    def run_once(self, now_ms: Optional[int] = None) -> Dict[str, int]:
+        """
+        Ein Durchlauf: Lücken suchen, pro Entity und zusammengefasstem Fenster
+        einen Request mit genau den fehlenden Keys stellen, Ergebnis speichern.
+
+        Returns:
+            Dict mit 'gaps', 'requests', 'inserted', 'skipped'
+        """
+        now_ms = now_ms or int(time.time() * 1000)
+        end_ms = now_ms - self.settle_minutes * 60 * 1000
+        start_ms = end_ms - self.scan_hours * 3600 * 1000
+        gaps = self.scanner.find_gaps(start_ms, end_ms)
+
+        def identity(eid: str, key: str, w_start: int, w_end: int) -> Tuple[str, str, int]:
+            # Fenstergrenzen wandern mit jedem Durchlauf: Lücken am Rand über das feste Ende
+            # erkennen, Serien ganz ohne Daten über -1
+            if w_start == start_ms:
+                return (eid, key, -1 if w_end == end_ms else w_end)
+            return (eid, key, w_start)
+
+        self._attempts = {k: v for k, v in self._attempts.items() if k[2] == -1 or k[2] >= start_ms}
+
+        # Pro Entity: Fenster zusammenfassen, fehlende Keys je Fenster sammeln
+        per_entity: Dict[str, List[Tuple[int, int, str]]] = {}
+        skipped = 0
+        for (eid, key), windows in gaps.items():
+            for w_start, w_end in windows:
+                if self._attempts.get(identity(eid, key, w_start, w_end), 0) >= self.max_attempts:
+                    skipped += 1
+                    continue
+                per_entity.setdefault(eid, []).append((w_start, w_end, key))
+
+        stats = {"gaps": sum(len(w) for w in gaps.values()), "requests": 0, "inserted": 0, "skipped": skipped}
+        if not per_entity:
+            return stats
+
+        groups = self._entity_groups()
+        for eid, items in per_entity.items():
+            auth_group = groups.get(eid)
+            if auth_group is None:
+                continue
+            for w_start, w_end in merge_windows([(s, e) for s, e, _ in items]):
+                if stats["requests"] >= self.max_requests_per_pass or self._stop.is_set():
+                    return stats
+                keys = sorted({k for s, e, k in items if s < w_end and e > w_start})
+                for s, e, k in items:
+                    if s < w_end and e > w_start:
+                        ident = identity(eid, k, s, e)
+                        self._attempts[ident] = self._attempts.get(ident, 0) + 1
+                try:
+                    records = self.client.fetch_window(eid, auth_group, w_start + 1, w_end, keys=keys)
+                    if records:
+                        stats["inserted"] += self.db_client.insert_records(records)["inserted"]
+                        if self.on_records is not None:
+                            self.on_records(records)
+                except Exception as e:
+                    logger.warning("Gap-Refill %s %s fehlgeschlagen: %s", eid, keys, e)
+                stats["requests"] += 1
+                self._stop.wait(self.min_request_interval)
+
+        logger.info("Gap-Refill: %d Lücken, %d Requests, %d Messwerte nachgeholt, %d aufgegeben",
+                    stats["gaps"], stats["requests"], stats["inserted"], stats["skipped"])
+        return stats
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                if self.is_active is None or self.is_active():
+                    self.run_once()
+            except Exception as e:
+                logger.error("Gap-Refill fehlgeschlagen: %s", e, exc_info=True)
+            self._stop.wait(self.scan_interval_seconds)
+
+    def start(self):
+        """Startet den Hintergrund-Thread (Daemon)."""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="gap-refill", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
@@ -0,0 +1,191 @@
+from __future__ import annotations
+
+import os
+import socket
+import bisect
+import hashlib
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from pymongo import ASCENDING, UpdateOne, errors
+
+logger = logging.getLogger("beehive_poller.lease")
+
+HEARTBEAT_SECONDS = 30   # so oft meldet sich ein Replica und verlängert seine Leases
+LEASE_SECONDS = 90       # ohne Heartbeat gilt ein Replica danach als weg, seine Leases als frei
+VNODES = 64              # virtuelle Knoten pro Replica im Hash-Ring (gleichmäßigere Verteilung)
+
+
+def _hash(value: str) -> int:
+    # Stabil über Prozesse hinweg (im Gegensatz zu hash())
+    return int.from_bytes(hashlib.md5(value.encode("utf-8")).digest()[:8], "big")
+
+
+class HashRing:
+    """Consistent Hashing: kommt ein Replica hinzu oder fällt weg, wandert nur ~1/n der Entities."""
+
+    def __init__(self, members: List[str], vnodes: int = VNODES):
+        self._points = sorted((_hash(f"{m}#{i}"), m) for m in members for i in range(vnodes))
+        self._hashes = [h for h, _ in self._points]
+
+    def owner(self, key: str) -> Optional[str]:
+        if not self._points:
+            return None
+        i = bisect.bisect(self._hashes, _hash(key)) % len(self._points)
+        return self._points[i][1]
+
+
+class LeaseCoordinator:
+    """
+    Verteilt Entities auf mehrere Poller-Replicas.
+
+    Jedes Replica hält einen Heartbeat in <collection>_members. Aus den lebenden
+    Replicas bildet jedes denselben Hash-Ring und beansprucht nur "seine" Entities.
+    Eine Lease pro Entity in <collection>_leases sorgt dafür, dass auch bei kurzzeitig
+    abweichender Sicht (Replica kommt/geht) höchstens ein Replica eine Entity abfragt.
+    Abgegebene Leases werden sofort freigegeben; die Lease merkt sich, bis wann die
+    Entity abgefragt wurde (polledUntil), damit der neue Besitzer lückenlos weitermacht.
+    """
+
+    def __init__(self, db_client, member_id: Optional[str] = None, *,
+                 heartbeat_seconds: int = HEARTBEAT_SECONDS,
+                 lease_seconds: int = LEASE_SECONDS,
+                 vnodes: int = VNODES):
+        """
+        Args:
+            db_client: BeehiveDbClient (Collections <collection>_members/_leases)
+            member_id: Name des Replicas (Standard: POD_NAME bzw. Hostname-PID)
+            heartbeat_seconds: Abstand der Heartbeats (Hintergrund-Thread)
+            lease_seconds: Gültigkeit von Heartbeat und Leases
+            vnodes: virtuelle Knoten pro Replica im Hash-Ring
+        """
+        base = db_client.collection.name
+        self.members_col = db_client.db[f"{base}_members"]
+        self.leases_col = db_client.db[f"{base}_leases"]
+        self.member_id = member_id or os.getenv("POD_NAME") or f"{socket.gethostname()}-{os.getpid()}"
+        self.heartbeat_seconds = heartbeat_seconds
+        self.lease_seconds = lease_seconds
+        self.vnodes = vnodes
+        self._owned: Dict[str, set] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        # Abgelaufene Replicas räumt Mongo selbst auf (Lebendigkeit prüfen wir explizit).
+        # Leases bleiben ohne TTL: polledUntil wird für die Übergabe gebraucht.
+        self.members_col.create_index([("expiresAt", ASCENDING)], expireAfterSeconds=0, name="expiresAt_ttl")
+        self.leases_col.create_index([("owner", ASCENDING)], name="owner")
+
+    def _now(self) -> datetime:
+        return datetime.now(timezone.utc)
+
+    def _expires(self) -> datetime:
+        return self._now() + timedelta(seconds=self.lease_seconds)
+
+    # ---------- Mitgliedschaft ----------
+
+    def heartbeat(self):
+        """Eigenen Eintrag und alle eigenen Leases verlängern."""
+        expires = self._expires()
+        self.members_col.update_one(
+            {"_id": self.member_id},
+            {"$set": {"expiresAt": expires, "host": socket.gethostname()}},
+            upsert=True)
+        self.leases_col.update_many({"owner": self.member_id}, {"$set": {"expiresAt": expires}})
+
+    def members(self) -> List[str]:
+        """Lebende Replicas (sortiert)."""
+        docs = self.members_col.find({"expiresAt": {"$gt": self._now()}}, {"_id": 1})
+        return sorted({d["_id"] for d in docs} | {self.member_id})
+
+    def is_leader(self) -> bool:
+        """Ein Replica (kleinste ID) übernimmt globale Aufgaben (Kennzahlen, Retention, Gap-Refill)."""
+        return self.members()[0] == self.member_id
+
+    # ---------- Leases ----------
+
+    def owned(self, group: str, entity_ids: List[str]) -> tuple[List[str], Dict[str, datetime]]:
+        """
+        Entities der Gruppe, die dieses Replica abfragen soll.
+
+        Returns:
+            (entity_ids, handover): handover = entityId -> polledUntil des Vorbesitzers
+            für in diesem Aufruf neu übernommene Entities
+        """
+        ring = HashRing(self.members(), self.vnodes)
+        mine = [e for e in entity_ids if ring.owner(e) == self.member_id]
+        mine_set = set(mine)
+        others = [e for e in entity_ids if e not in mine_set]
+        now, expires = self._now(), self._expires()
+
+        # Nicht mehr zugeordnete Entities sofort freigeben (Übergabe ohne TTL-Wartezeit)
+        if others:
+            self.leases_col.update_many(
+                {"_id": {"$in": others}, "owner": self.member_id},
+                {"$set": {"owner": None, "expiresAt": now}})
+
+        if mine:
+            ops = [UpdateOne(
+                {"_id": e, "$or": [{"owner": self.member_id}, {"owner": None}, {"expiresAt": {"$lte": now}}]},
+                {"$set": {"owner": self.member_id, "expiresAt": expires, "group": group}},
+                upsert=True) for e in mine]
+            try:
+                self.leases_col.bulk_write(ops, ordered=False)
+            except errors.BulkWriteError as e:
+                # 11000 = Lease gehört (noch) einem anderen Replica
+                for err in e.details.get("writeErrors", []):
+                    if err.get("code") != 11000:
+                        logger.error("Lease-Fehler: %s", err.get("errmsg"))
+
+        held = {d["_id"]: d.get("polledUntil") for d in self.leases_col.find(
+            {"_id": {"$in": mine}, "owner": self.member_id}, {"polledUntil": 1})}
+        previous = self._owned.get(group, set())
+        gained, lost = set(held) - previous, previous - set(held)
+        if gained or lost:
+            logger.info("Leases %s: %d/%d Entities (+%d übernommen, -%d abgegeben)",
+                        group, len(held), len(entity_ids), len(gained), len(lost))
+        self._owned[group] = set(held)
+
+        handover = {}
+        for e in gained:
+            until = held[e]
+            if until is not None:
+                handover[e] = until if until.tzinfo else until.replace(tzinfo=timezone.utc)
+        return [e for e in entity_ids if e in held], handover
+
+    def mark_polled(self, entity_ids: List[str], until: datetime):
+        """Merkt sich, bis wann die Entities abgefragt sind (für eine spätere Übergabe)."""
+        if entity_ids:
+            self.leases_col.update_many(
+                {"_id": {"$in": list(entity_ids)}, "owner": self.member_id},
+                {"$set": {"polledUntil": until}})
+
+    # ---------- Lebenszyklus ----------
+
+    def _loop(self):
+        while not self._stop.wait(self.heartbeat_seconds):
+            try:
+                self.heartbeat()
+            except Exception as e:
+                logger.warning("Heartbeat fehlgeschlagen: %s", e)
+
+    def start(self):
+        """Anmelden und Heartbeat-Thread (Daemon) starten."""
+        self.heartbeat()
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="lease-heartbeat", daemon=True)
+            self._thread.start()
+        logger.info("Replica %s angemeldet (%d aktiv)", self.member_id, len(self.members()))
+
+    def leave(self):
+        """Abmelden und alle Leases freigeben (andere Replicas übernehmen im nächsten Zyklus)."""
+        self._stop.set()
+        try:
+            self.leases_col.update_many({"owner": self.member_id},
+                                        {"$set": {"owner": None, "expiresAt": self._now()}})
+            self.members_col.delete_one({"_id": self.member_id})
+            logger.info("Replica %s abgemeldet, Leases freigegeben", self.member_id)
+        except Exception as e:
+            logger.warning("Abmelden fehlgeschlagen: %s", e)
@@ -0,0 +1,162 @@
+from __future__ import annotations
+
+import time
+import logging
+from datetime import datetime, timezone
+from typing import Dict, Optional, Union
+
+from pymongo.collection import Collection
+
+logger = logging.getLogger("beehive_poller.migrations")
+
+
+class MigrationRunner:
+    """
+    Führt ein Bulk-Update in Batches über die Collection aus, statt einem
+    unbegrenzten update_many({}). Fortschritt wird in einer Checkpoint-Collection
+    gespeichert, sodass ein abgebrochener Lauf beim nächsten Start fortgesetzt wird.
+    """
+
+    def __init__(self, collection: Collection, name: str, *,
+                 batch_size: int = 1000,
+                 max_docs_per_second: Optional[float] = None,
+                 range_field: str = "_id",
+                 checkpoint_collection: str = "migrations",
+                 dry_run: bool = False,
+                 report_every: int = 10):
+        """
+        Args:
+            collection: Ziel-Collection
+            name: eindeutiger Name der Migration (Schlüssel des Checkpoints)
+            batch_size: Dokumente pro Batch
+            max_docs_per_second: Drosselung (None = ungedrosselt)
+            range_field: Feld, über dessen Bereiche iteriert wird ("_id" oder "ts");
+                         braucht einen Index
+            checkpoint_collection: Collection für den Fortschritt
+            dry_run: nur zählen, welche Dokumente das Update träfe (would_modify, obere
+                     Schranke; ob sich ein Dokument tatsächlich ändert, zeigt erst der echte Lauf)
+            report_every: alle n Batches Durchsatz und ETA loggen
+        """
+        self.collection = collection
+        self.name = name
+        self.batch_size = batch_size
+        self.max_docs_per_second = max_docs_per_second
+        self.range_field = range_field
+        self.checkpoints = collection.database[checkpoint_collection]
+        self.dry_run = dry_run
+        self.report_every = report_every
+
+    @property
+    def _checkpoint_id(self) -> str:
+        return f"{self.collection.name}:{self.name}"
+
+    def _load_checkpoint(self) -> dict:
+        if self.dry_run:
+            return {}
+        return self.checkpoints.find_one({"_id": self._checkpoint_id}) or {}
+
+    def _save_checkpoint(self, **fields):
+        if self.dry_run:
+            return
+        self.checkpoints.update_one(
+            {"_id": self._checkpoint_id},
+            {"$set": {**fields, "updatedAt": datetime.now(timezone.utc)}},
+            upsert=True
+        )
+
+    def reset(self):
+        """Löscht den Checkpoint, der nächste Lauf beginnt von vorn."""
+        self.checkpoints.delete_one({"_id": self._checkpoint_id})
+
+    def _range_query(self, query: dict, lower, upper) -> dict:
+        bounds = {"$lte": upper}
+        if lower is not None:
+            bounds["$gt"] = lower
+        if self.range_field in query:
+            return {"$and": [query, {self.range_field: bounds}]}
+        return {**query, self.range_field: bounds}
+
+    def run(self, query: dict, update: Union[dict, list]) -> Dict[str, object]:
+        """
+        Wendet update (Update-Dokument oder Pipeline) batchweise auf alle
+        Dokumente an, die query erfüllen.
+
+        Returns:
+            Dict mit 'matched', 'modified', 'would_modify', 'batches', 'seconds', 'dry_run', 'done'
+            (im dry run ist 'modified' 0 und 'would_modify' die Anzahl getroffener Dokumente)
+        """
+        checkpoint = self._load_checkpoint()
+        if checkpoint.get("done"):
+            logger.info("Migration '%s' bereits abgeschlossen (Checkpoint)", self.name)
+            return {"matched": checkpoint.get("matched", 0), "modified": checkpoint.get("modified", 0),
+                    "would_modify": checkpoint.get("modified", 0), "batches": 0, "seconds": 0.0, "dry_run": self.dry_run, "done": True}
+
+        # Obergrenze beim Start festhalten: neu eingefügte Dokumente schreibt der
+        # laufende Ingest bereits im neuen Schema, der Lauf terminiert sicher.
+        last_doc = self.collection.find_one(query, {self.range_field: 1}, sort=[(self.range_field, -1)])
+        if last_doc is None:
+            self._save_checkpoint(done=True, matched=0, modified=0)
+            return {"matched": 0, "modified": 0, "would_modify": 0, "batches": 0, "seconds": 0.0,
+                    "dry_run": self.dry_run, "done": True}
+        upper_bound = checkpoint.get("upper", last_doc[self.range_field])
+
+        lower = checkpoint.get("last")
+        matched = checkpoint.get("matched", 0)
+        modified = checkpoint.get("modified", 0)
+        remaining = self.collection.count_documents(
+            self._range_query(query, lower, upper_bound))
+        logger.info("Migration '%s' startet: ~%d Dokumente, batch_size=%d, limit=%s Dok/s%s",
+                    self.name, remaining, self.batch_size, self.max_docs_per_second or "-",
+                    " (dry run)" if self.dry_run else "")
+
+        started = time.monotonic()
+        done_in_run = 0
+        batches = 0
+        while True:
+            ids = [
+                d[self.range_field] for d in self.collection.find(
+                    self._range_query(query, lower, upper_bound), {self.range_field: 1}
+                ).sort(self.range_field, 1).limit(self.batch_size)
+            ]
+            if not ids:
+                break
+
+            batch_query = self._range_query(query, lower, ids[-1])
+            if self.dry_run:
+                n = self.collection.count_documents(batch_query)
+                matched += n
+            else:
+                result = self.collection.update_many(batch_query, update)
+                n = result.matched_count
+                matched += n
+                modified += result.modified_count
+
+            lower = ids[-1]
+            done_in_run += n
+            batches += 1
+            self._save_checkpoint(last=lower, upper=upper_bound, matched=matched, modified=modified, done=False)
+
+            elapsed = time.monotonic() - started
+            if batches % self.report_every == 0:
+                rate = done_in_run / elapsed if elapsed > 0 else 0.0
+                eta = (remaining - done_in_run) / rate if rate > 0 else float("inf")
+                logger.info("Migration '%s': %d/%d Dokumente, %.0f Dok/s, ETA %.0fs",
+                            self.name, done_in_run, remaining, rate, eta)
+
+            # Drosselung: höchstens max_docs_per_second im Mittel
+            if self.max_docs_per_second:
+                wait = done_in_run / self.max_docs_per_second - elapsed
+                if wait > 0:
+                    time.sleep(wait)
+
+        seconds = time.monotonic() - started
+        self._save_checkpoint(last=lower, upper=upper_bound, matched=matched, modified=modified, done=True)
+        if self.dry_run:
+            logger.info("Migration '%s' beendet (dry run): %d gefunden, bis zu %d würden geändert, "
+                        "%d Batches in %.1fs", self.name, matched, matched, batches, seconds)
+        else:
+            logger.info("Migration '%s' beendet: %d gefunden, %d geändert, %d Batches in %.1fs",
+                        self.name, matched, modified, batches, seconds)
+        return {"matched": matched, "modified": modified,
+                "would_modify": matched if self.dry_run else modified, "batches": batches,
+                "seconds": seconds, "dry_run": self.dry_run, "done": True}
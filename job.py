@@ -1,19 +1,34 @@
 # file: Projects/daily_export.py
 import os
-import sys
+import time
 import logging
+import argparse
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
 from pathlib import Path
-from datetime import datetime
-from zoneinfo import ZoneInfo  
+from datetime import date, datetime, timedelta
 
+import numpy as np
 from pandas import DataFrame
 
 from constants import WETTERSTATION_AUTHT_GROUP, FUTTERKAMMER_AUTH_GROUP, BRUTKAMMER_AUTH_GROUP
-from client import Client
+from client import Client, TZ, day_bounds, is_no_data, to_epoch_ms
 from db.beehiveDbClient import BeehiveDbClient
+from db.gapScanner import merge_windows
+from util.fileIndex import FileIndex
+from util.logSetup import setup_logging
+from util.schema import CATEGORY_COLUMNS, compact_readings, concat_readings, with_local_datetime
+from retention import DATA_DIR, apply_file_retention
 
 created_data_frames = []
 
+# Export aus MongoDB
+DB_BATCH_SIZE = 10_000      # Zeilen pro Cursor-Batch / Schreibvorgang
+EXPORT_GAP_MINUTES = 45     # Abstand zwischen zwei Messwerten, ab dem eine Lücke nachgeholt wird
+EXPORT_IO_WORKERS = 8       # parallele Abrufe (API/MongoDB) im Batch-Export
+
 def setup_paths() -> tuple[Path, Path, str]:
     """
     Ermittelt die Basis-Pfade relativ zu diesem Script und erstellt
@@ -23,7 +38,7 @@ def setup_paths() -> tuple[Path, Path, str]:
     base_dir = Path(__file__).resolve().parent
 
     # Datum in Berliner Zeit (für "heute")
-    today_str = datetime.now(ZoneInfo("Europe/Berlin")).strftime("%Y-%m-%d")
+    today_str = datetime.now(TZ).strftime("%Y-%m-%d")
 
     # Tagesordner: Projects/data/YYYY-MM-DD
     day_dir = base_dir / "data" / today_str
@@ -36,27 +51,10 @@ def setup_paths() -> tuple[Path, Path, str]:
 
 def setup_logger(log_file: Path) -> logging.Logger:
     """
-    Richtet Logging ein, alle Logs in die Tages-Logdatei.
+    Richtet Logging ein, alle Logs in die Tages-Logdatei (und auf die Konsole,
+    hilfreich beim manuellen Start); geschrieben wird im Hintergrund (util/logSetup.py).
     """
-    logger = logging.getLogger("daily_export")
-    logger.setLevel(logging.INFO)
-    logger.handlers.clear()
-
-    fmt = logging.Formatter("%(asctime)s [%(levelname)s] %(message)s", "%Y-%m-%d %H:%M:%S")
-
-    # File-Handler
-    fh = logging.FileHandler(log_file, encoding="utf-8")
-    fh.setLevel(logging.INFO)
-    fh.setFormatter(fmt)
-    logger.addHandler(fh)
-
-    # Optional: Console-Handler (hilfreich beim manuellen Start)
-    ch = logging.StreamHandler(sys.stdout)
-    ch.setLevel(logging.INFO)
-    ch.setFormatter(fmt)
-    logger.addHandler(ch)
-
-    return logger
+    return setup_logging("daily_export", log_file)
 
 def export_group(c: Client, day_dir: Path, today_str: str, auth_group: str, filename_prefix: str, logger: logging.Logger):
     """
@@ -64,21 +62,190 @@ def export_group(c: Client, day_dir: Path, today_str: str, auth_group: str, file
     Fehler werden geloggt; der Job läuft weiter.
     """
     try:
-        logger.info(f"Starte Export: {filename_prefix} (authGroup={auth_group})")
+        logger.info("Starte Export: %s (authGroup=%s)", filename_prefix, auth_group)
         df = c.get_today_time_series_for_all_entities(auth_group)
+        failed = df.attrs.get("failed_entities")
+        if failed:
+            logger.warning("%s: %d Entities fehlgeschlagen (%s), Export unvollständig",
+                           filename_prefix, len(failed), ", ".join(failed))
 
         created_data_frames.append(df)
 
         csv_path = day_dir / f"{filename_prefix}_{today_str}.csv"
-        df.to_csv(csv_path, index=False, sep=";", encoding="utf-8-sig")
+        # Kompaktes Schema + lesbare Zeitspalte nur für die Datei
+        with_local_datetime(df).to_csv(csv_path, index=False, sep=";", encoding="utf-8-sig")
+        FileIndex(day_dir.parent).register(csv_path)
+
+        logger.info("Export erfolgreich: %s", csv_path)
+        logger.info("Zeilen: %d | Spalten: %s", len(df), list(df.columns))
+    except Exception as e:
+        logger.error("Fehler beim Export %s: %s", filename_prefix, e, exc_info=True)
+
+class ExportWriter:
+    """Schreibt DataFrames im kompakten Schema inkrementell als CSV oder Parquet."""
+
+    def __init__(self, path: Path, fmt: str = "csv"):
+        if fmt not in ("csv", "parquet"):
+            raise ValueError(f"Unbekanntes Exportformat '{fmt}'")
+        self.path = path
+        self.fmt = fmt
+        self.rows = 0
+        self.columns: list[str] = []
+        self._parquet = None
+        self._header_written = False
+
+    def write(self, df: DataFrame):
+        if df.empty:
+            return
+        out = with_local_datetime(df)
+        self.columns = list(out.columns)
+        if self.fmt == "csv":
+            out.to_csv(self.path, index=False, sep=";", encoding="utf-8-sig" if not self._header_written else "utf-8",
+                       mode="a" if self._header_written else "w", header=not self._header_written)
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            # Kategorien pro Batch unterschiedlich -> als Strings schreiben, damit das Schema stabil bleibt
+            out = out.astype({c: "string" for c in CATEGORY_COLUMNS if c in out.columns})
+            table = pa.Table.from_pandas(out, preserve_index=False)
+            if self._parquet is None:
+                self._parquet = pq.ParquetWriter(self.path, table.schema)
+            self._parquet.write_table(table.cast(self._parquet.schema))
+        self._header_written = True
+        self.rows += len(df)
+
+    def close(self):
+        if self._parquet is not None:
+            self._parquet.close()
+            self._parquet = None
+        elif not self._header_written and self.fmt == "csv":
+            # Leerer Tag: trotzdem eine Datei mit Kopfzeile anlegen
+            with_local_datetime(compact_readings(DataFrame())).to_csv(
+                self.path, index=False, sep=";", encoding="utf-8-sig")
+
+
+class GapTracker:
+    """
+    Erkennt Lücken pro (entityId, key) beim Streamen der nach (entityId, key, ts)
+    sortierten Messwerte. Merkt sich nur den letzten ts pro Serie.
+    """
+
+    def __init__(self, entity_ids: list[str], start_ms: int, end_ms: int, gap_ms: int):
+        self.entity_ids = list(entity_ids)
+        self.start_ms = start_ms
+        self.end_ms = end_ms
+        self.gap_ms = gap_ms
+        self.last: dict[tuple[str, str], int] = {}
+        self.windows: dict[tuple[str, str | None], list[tuple[int, int]]] = {}
+
+    def observe(self, chunk: DataFrame):
+        for (eid, key), ts in chunk.groupby(["entityId", "key"], observed=True, sort=False)["ts"]:
+            series = (str(eid), str(key))
+            t = np.sort(ts.to_numpy())
+            prev = self.last.get(series, self.start_ms)
+            bounds = np.concatenate(([prev], t))
+            for i in np.flatnonzero(np.diff(bounds) > self.gap_ms):
+                self.windows.setdefault(series, []).append((int(bounds[i]), int(bounds[i + 1])))
+            self.last[series] = max(prev, int(t[-1]))
+
+    def gaps(self) -> dict[tuple[str, str | None], list[tuple[int, int]]]:
+        """
+        Lücken als {(entityId, key): [(von_ms, bis_ms), ...]}.
+        key=None: für die Entity liegen gar keine Daten vor (alle Keys nachholen).
+        """
+        gaps = {k: list(v) for k, v in self.windows.items()}
+        for series, last in self.last.items():
+            if self.end_ms - last > self.gap_ms:
+                gaps.setdefault(series, []).append((last, self.end_ms))
+        seen = {eid for eid, _ in self.last}
+        for eid in self.entity_ids:
+            if eid not in seen:
+                gaps[(eid, None)] = [(self.start_ms, self.end_ms)]
+        return gaps
+
 
-        logger.info(f"Export erfolgreich: {csv_path}")
-        logger.info(f"Zeilen: {len(df)} | Spalten: {list(df.columns)}")
+def refill_gaps(c: Client, auth_group: str, gaps: dict, logger: logging.Logger) -> DataFrame:
+    """
+    Holt nur die erkannten Lücken über die API nach (ein Request pro Entity und
+    zusammengefasstem Fenster) und behält nur Messwerte, die wirklich in einer
+    Lücke ihres Keys liegen.
+    """
+    per_entity: dict[str, list[tuple[int, int]]] = {}
+    for (eid, _), windows in gaps.items():
+        per_entity.setdefault(eid, []).extend(windows)
+
+    frames = []
+    for eid, windows in per_entity.items():
+        for start_ms, end_ms in merge_windows(windows):
+            try:
+                # Exakt das Innere der Lücke (Grenzen sind vorhandene Messwerte bzw. Tagesgrenzen)
+                frames.append(c.fetch_window_df(eid, auth_group, start_ms + 1, end_ms))
+            except Exception as e:
+                start = datetime.fromtimestamp(start_ms / 1000, TZ)
+                end = datetime.fromtimestamp(end_ms / 1000, TZ)
+                logger.warning("Lücke %s %s-%s nicht nachgeholt: %s", eid, start.strftime("%H:%M"), end.strftime("%H:%M"), e)
+
+    df = concat_readings(frames)
+    if df.empty:
+        return df
+
+    # Nur Werte strikt innerhalb einer Lücke ihres Keys (bzw. der ganzen Entity)
+    keep = np.zeros(len(df), dtype=bool)
+    eids = df["entityId"].astype(str).to_numpy()
+    keys = df["key"].astype(str).to_numpy()
+    ts = df["ts"].to_numpy()
+    for (eid, key), windows in gaps.items():
+        mask = eids == eid if key is None else (eids == eid) & (keys == key)
+        for start_ms, end_ms in windows:
+            keep |= mask & (ts > start_ms) & (ts < end_ms)
+    return df[keep].drop_duplicates(subset=["entityId", "key", "ts"]).reset_index(drop=True)
+
+
+def export_group_from_db(c: Client, db_client: BeehiveDbClient, day_dir: Path, today_str: str,
+                         auth_group: str, filename_prefix: str, logger: logging.Logger,
+                         fmt: str = "csv"):
+    """
+    Streamt die heutigen Messwerte einer AuthGroup aus MongoDB in die Tagesdatei
+    (Range-Query über den Unique Index, große Cursor-Batches) und holt nur
+    erkannte Lücken über die API nach. Nachgeholte Werte landen auch in MongoDB.
+    Fehler werden geloggt; der Job läuft weiter.
+    """
+    try:
+        logger.info("Starte Export aus MongoDB: %s (authGroup=%s)", filename_prefix, auth_group)
+        start_ms, day_end_ms = day_bounds(datetime.strptime(today_str, "%Y-%m-%d").date())
+        end_ms = min(day_end_ms, to_epoch_ms(datetime.now(TZ)))
+
+        entity_ids = c.get_all_entity_ids(auth_group)
+        path = day_dir / f"{filename_prefix}_{today_str}.{fmt}"
+        writer = ExportWriter(path, fmt)
+        tracker = GapTracker(entity_ids, start_ms, end_ms, EXPORT_GAP_MINUTES * 60 * 1000)
+
+        try:
+            for chunk in db_client.iter_reading_batches(start_ms, end_ms, entity_ids=entity_ids,
+                                                        batch_size=DB_BATCH_SIZE):
+                tracker.observe(chunk)
+                writer.write(chunk)
+            from_db = writer.rows
+
+            gaps = tracker.gaps()
+            refilled = refill_gaps(c, auth_group, gaps, logger) if gaps else compact_readings(DataFrame())
+            writer.write(refilled)
+        finally:
+            writer.close()
+
+        FileIndex(day_dir.parent).register(path)
+        if not refilled.empty:
+            db_client.insert_many(refilled)
+
+        logger.info("Export erfolgreich: %s", path)
+        logger.info("Zeilen: %d (%d aus MongoDB, %d aus %d Lücken nachgeholt) | Spalten: %s",
+                    writer.rows, from_db, len(refilled), len(gaps), writer.columns)
     except Exception as e:
-        logger.error(f"Fehler beim Export {filename_prefix}: {e}", exc_info=True)
+        logger.error("Fehler beim Export %s: %s", filename_prefix, e, exc_info=True)
+
 
 def insert_into_database(data_frames: list[DataFrame], logger: logging.Logger):
-    dbClient = BeehiveDbClient()
+    dbClient = BeehiveDbClient.from_env()
     logger.log(logging.INFO, "Starting Insertion into DB")
     try:
         for df in data_frames:
@@ -89,22 +256,260 @@ def insert_into_database(data_frames: list[DataFrame], logger: logging.Logger):
 
 
 
-def main():
+# ---------- Batch-Export über Datumsbereiche (--from/--to) ----------
+
+_thread_state = threading.local()
+_worker_db: BeehiveDbClient | None = None
+
+
+def _thread_client() -> Client:
+    """Ein Client pro I/O-Thread (Sessions nicht zwischen Threads teilen)."""
+    client = getattr(_thread_state, "client", None)
+    if client is None:
+        client = _thread_state.client = Client()
+    return client
+
+
+def _init_export_worker(insert: bool):
+    """Initializer der Worker-Prozesse: eigene MongoDB-Verbindung (nicht über Prozesse teilbar)."""
+    global _worker_db
+    _worker_db = BeehiveDbClient.from_env() if insert else None
+
+
+def write_partition(df: DataFrame, path: str, fmt: str, insert_df: DataFrame | None) -> dict:
+    """
+    CPU-lastiger Teil einer Partition (Tag x AuthGroup), läuft im Worker-Prozess:
+    Zeitspalte und Datei schreiben, danach ein eigener Bulk-Insert.
+
+    Returns:
+        Dict mit 'path', 'rows', 'insert' (Insert-Ergebnis oder None)
+    """
+    writer = ExportWriter(Path(path), fmt)
+    try:
+        for start in range(0, len(df), DB_BATCH_SIZE):
+            writer.write(df.iloc[start:start + DB_BATCH_SIZE])
+    finally:
+        writer.close()
+    result = None
+    if _worker_db is not None and insert_df is not None and not insert_df.empty:
+        result = _worker_db.insert_many(insert_df)
+    return {"path": path, "rows": writer.rows, "insert": result}
+
+
+def _fetch_entity_day(entity_id: str, auth_group: str, start_ms: int, end_ms: int) -> DataFrame:
+    return _thread_client().fetch_window_df(entity_id, auth_group, start_ms, end_ms)
+
+
+def _load_partition_from_db(db_client: BeehiveDbClient, auth_group: str, entity_ids: list[str],
+                            start_ms: int, end_ms: int, logger: logging.Logger) -> tuple[DataFrame, DataFrame]:
+    """
+    Messwerte einer Partition aus MongoDB plus per API nachgeholte Lücken.
+
+    Returns:
+        (alle Messwerte, nachgeholte Messwerte)
+    """
+    tracker = GapTracker(entity_ids, start_ms, end_ms, EXPORT_GAP_MINUTES * 60 * 1000)
+    chunks = []
+    for chunk in db_client.iter_reading_batches(start_ms, end_ms, entity_ids=entity_ids, batch_size=DB_BATCH_SIZE):
+        tracker.observe(chunk)
+        chunks.append(chunk)
+    gaps = tracker.gaps()
+    refilled = refill_gaps(_thread_client(), auth_group, gaps, logger) if gaps else compact_readings(DataFrame())
+    return concat_readings(chunks + [refilled]), refilled
+
+
+def export_range(days: list[date], groups: list[tuple[str, str]], logger: logging.Logger, *,
+                 source: str = "db", fmt: str = "csv", workers: int | None = None,
+                 io_workers: int = EXPORT_IO_WORKERS, insert: bool = True) -> dict:
+    """
+    Exportiert Tage x AuthGroups nach data/<Tag>/<Prefix>_<Tag>.<fmt>.
+
+    Abrufe (API pro Entity und Tag bzw. MongoDB pro Partition) laufen in einem gemeinsamen,
+    begrenzten Thread-Pool; Umwandlung, Datei und Bulk-Insert je Partition in einem
+    Prozess-Pool. Höchstens etwa 2 x workers Partitionen sind gleichzeitig im Speicher.
+
+    Args:
+        days: Kalendertage (Europe/Berlin)
+        groups: (authGroup, Dateiprefix)
+        source: "db" (MongoDB + Lücken per API, nur Lücken werden eingefügt) oder "api" (alles einfügen)
+        workers: Prozesse (Standard: Anzahl Kerne)
+        io_workers: Threads für Abrufe
+        insert: Bulk-Insert in MongoDB je Partition
+
+    Returns:
+        Dict mit 'partitions', 'done', 'failed', 'rows', 'inserted'
+    """
+    workers = workers or os.cpu_count() or 1
+    db_client = BeehiveDbClient.from_env() if source == "db" else None
+    entity_ids = {group: _thread_client().get_all_entity_ids(group) for group, _ in groups}
+    now_ms = to_epoch_ms(datetime.now(TZ))
+    partitions = [(day, group, prefix) for day in days for group, prefix in groups]
+    stats = {"partitions": len(partitions), "done": 0, "failed": 0, "rows": 0, "inserted": 0}
+    started = time.monotonic()
+
+    fetching: deque = deque()   # (Partition, I/O-Futures) in Reihenfolge
+    writing: dict = {}          # Prozess-Future -> Partition
+
+    def submit_fetch(io_pool, day: date, group: str) -> list:
+        start_ms, end_ms = day_bounds(day)
+        end_ms = min(end_ms, now_ms)
+        if db_client is not None:
+            return [io_pool.submit(_load_partition_from_db, db_client, group, entity_ids[group],
+                                   start_ms, end_ms, logger)]
+        return [io_pool.submit(_fetch_entity_day, eid, group, start_ms, end_ms) for eid in entity_ids[group]]
+
+    def collect(partition, futures: list) -> tuple[DataFrame, DataFrame]:
+        if db_client is not None:
+            return futures[0].result()
+        day, group, prefix = partition
+        frames, failed = [], []
+        for eid, future in zip(entity_ids[group], futures):
+            try:
+                frames.append(future.result())
+            except Exception as e:
+                if is_no_data(e):
+                    continue  # Entity ohne Daten für diesen Tag
+                logger.warning("Partition %s %s: Entity %s fehlgeschlagen: %s", prefix, day, eid, e)
+                failed.append(eid)
+        # Unvollständige Partition nicht schreiben; zählt in stats["failed"]
+        if failed:
+            raise RuntimeError(f"{len(failed)} Entities fehlgeschlagen ({', '.join(failed)})")
+        df = concat_readings(frames)
+        return df, df
+
+    def report(partition, error: Exception | None = None):
+        stats["done"] += 1
+        if error is not None:
+            stats["failed"] += 1
+            logger.error("Partition %s %s fehlgeschlagen: %s", partition[2], partition[0], error)
+        elapsed = time.monotonic() - started
+        remaining = elapsed / stats["done"] * (len(partitions) - stats["done"])
+        logger.info("Fortschritt: %d/%d Partitionen, %d Zeilen, %d eingefügt, %.0fs (Rest ~%.0fs)",
+                    stats["done"], len(partitions), stats["rows"], stats["inserted"], elapsed, remaining)
+
+    def hand_over(proc_pool):
+        partition, futures = fetching.popleft()
+        day, _, prefix = partition
+        try:
+            df, insert_df = collect(partition, futures)
+        except Exception as e:
+            report(partition, e)
+            return
+        path = DATA_DIR / day.isoformat() / f"{prefix}_{day.isoformat()}.{fmt}"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        writing[proc_pool.submit(write_partition, df, str(path), fmt, insert_df if insert else None)] = partition
+
+    def drain(block: bool):
+        if not writing:
+            return
+        done, _ = wait(list(writing), timeout=None if block else 0, return_when=FIRST_COMPLETED)
+        for future in done:
+            partition = writing.pop(future)
+            try:
+                result = future.result()
+            except Exception as e:
+                report(partition, e)
+                continue
+            FileIndex(DATA_DIR).register(result["path"])
+            stats["rows"] += result["rows"]
+            if result["insert"] is not None:
+                stats["inserted"] += result["insert"]["inserted"]
+            report(partition)
+
+    ctx = multiprocessing.get_context("spawn")  # keine geforkten Mongo-/HTTP-Verbindungen in den Workern
+    with ThreadPoolExecutor(io_workers, thread_name_prefix="export-io") as io_pool, \
+            ProcessPoolExecutor(workers, mp_context=ctx, initializer=_init_export_worker,
+                                initargs=(insert,)) as proc_pool:
+        for day, group, prefix in partitions:
+            fetching.append(((day, group, prefix), submit_fetch(io_pool, day, group)))
+            # Begrenzt: höchstens workers Partitionen im Abruf und in den Prozessen
+            while len(fetching) > workers:
+                hand_over(proc_pool)
+            while len(writing) > workers:
+                drain(block=True)
+            drain(block=False)
+        while fetching:
+            hand_over(proc_pool)
+        while writing:
+            drain(block=True)
+
+    logger.info("Batch-Export: %d/%d Partitionen, %d Zeilen, %d eingefügt, %.0fs",
+                stats["done"] - stats["failed"], len(partitions), stats["rows"], stats["inserted"],
+                time.monotonic() - started)
+    return stats
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Täglicher Export der Bienenstock-Sensordaten")
+    parser.add_argument("--source", choices=["db", "api"], default="db",
+                        help="db: aus MongoDB streamen, Lücken per API nachholen; api: ganzen Tag von der API laden")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv", dest="fmt",
+                        help="Dateiformat (--source db oder Batch-Export)")
+    parser.add_argument("--from", dest="date_from", type=date.fromisoformat, default=None,
+                        help="Batch-Export ab diesem Tag (YYYY-MM-DD), alle AuthGroups")
+    parser.add_argument("--to", dest="date_to", type=date.fromisoformat, default=None,
+                        help="letzter Tag des Batch-Exports (Standard: --from)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Prozesse für Umwandlung/Datei/Insert (Standard: Anzahl Kerne)")
+    parser.add_argument("--io-workers", type=int, default=EXPORT_IO_WORKERS,
+                        help="parallele Abrufe (API/MongoDB)")
+    parser.add_argument("--no-insert", action="store_true",
+                        help="Batch-Export: nichts in MongoDB schreiben")
+    args = parser.parse_args(argv)
+    if args.date_to is not None and args.date_from is None:
+        parser.error("--to benötigt --from")
+    if args.date_from is not None and (args.date_to or args.date_from) < args.date_from:
+        parser.error("--to liegt vor --from")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
     day_dir, log_file, today_str = setup_paths()
     logger = setup_logger(log_file)
 
+    groups = [
+        (WETTERSTATION_AUTHT_GROUP, "Wetterstation"),
+        (FUTTERKAMMER_AUTH_GROUP, "Futterkammer"),
+        (BRUTKAMMER_AUTH_GROUP, "Brutkammer"),
+    ]
+
+    if args.date_from is not None:
+        last = args.date_to or args.date_from
+        days = [args.date_from + timedelta(days=i) for i in range((last - args.date_from).days + 1)]
+        logger.info("=== Batch-Export %s bis %s gestartet (%d Partitionen) ===", days[0], days[-1], len(days) * len(groups))
+        export_range(days, groups, logger, source=args.source, fmt=args.fmt, workers=args.workers,
+                     io_workers=args.io_workers, insert=not args.no_insert)
+        logger.info("=== Batch-Export beendet ===")
+        return
+
     logger.info("=== Daily Export Job gestartet ===")
-    logger.info(f"Tagesordner: {day_dir}")
+    logger.info("Tagesordner: %s", day_dir)
 
     c = Client()
 
+    db_client = None
+    if args.source == "db":
+        try:
+            db_client = BeehiveDbClient.from_env()
+        except Exception as e:
+            logger.error("MongoDB nicht erreichbar, exportiere von der API: %s", e)
+
     # Nacheinander exportieren – unabhängig per try/except
-    export_group(c, day_dir, today_str, WETTERSTATION_AUTHT_GROUP, "Wetterstation", logger)
-    export_group(c, day_dir, today_str, FUTTERKAMMER_AUTH_GROUP, "Futterkammer", logger)
-    export_group(c, day_dir, today_str, BRUTKAMMER_AUTH_GROUP, "Brutkammer", logger)
-    logger.info("Alle Daten wurden als Csv Datei gespeichert.")
+    if db_client is not None:
+        for auth_group, prefix in groups:
+            export_group_from_db(c, db_client, day_dir, today_str, auth_group, prefix, logger, fmt=args.fmt)
+        logger.info("Alle Daten wurden aus MongoDB exportiert.")
+    else:
+        for auth_group, prefix in groups:
+            export_group(c, day_dir, today_str, auth_group, prefix, logger)
+        logger.info("Alle Daten wurden als Csv Datei gespeichert.")
+
+        insert_into_database(created_data_frames, logger=logger )
 
-    insert_into_database(created_data_frames, logger=logger )
+    # Alte Tagesordner verdichten/aufräumen (über den Datei-Index, ohne Verzeichnis-Scan)
+    index = FileIndex(day_dir.parent)
+    index.register(log_file)
+    logger.info("Retention Dateien: %s", apply_file_retention(day_dir.parent))
 
     logger.info("=== Daily Export Job beendet ===")
 
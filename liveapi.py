@@ -0,0 +1,55 @@
+"""
+Lese-API auf den Live-Puffer des Pollers (util/ringBuffer.py): aktuelle Werte
+pro Beute oder Sensor direkt aus dem Speicher, ohne MongoDB-Abfrage.
+
+Startet im Poller, wenn LIVE_API_PORT gesetzt ist (benötigt fastapi/uvicorn).
+"""
+from __future__ import annotations
+
+import logging
+import threading
+
+logger = logging.getLogger("beehive_poller.live")
+
+
+def create_app(buffer):
+    """FastAPI-App mit Lese-Endpunkten auf einen RingBuffer."""
+    from fastapi import FastAPI, HTTPException
+
+    app = FastAPI(title="DigitalBeehive Live")
+
+    @app.get("/live/beehives")
+    def beehives():
+        return buffer.beehives()
+
+    @app.get("/live/beehives/{beehive_id}")
+    def beehive(beehive_id: int):
+        view = buffer.beehive(beehive_id)
+        if not view["roles"]:
+            raise HTTPException(status_code=404, detail=f"Keine aktuellen Werte für Beute {beehive_id}")
+        return view
+
+    @app.get("/live/entities/{entity_id}")
+    def entity(entity_id: str):
+        return buffer.entity(entity_id)
+
+    @app.get("/live/entities/{entity_id}/{key}")
+    def history(entity_id: str, key: str, n: int | None = None):
+        return [{"ts": ts, "value": value} for ts, value in buffer.history(entity_id, key, n)]
+
+    @app.get("/live/stats")
+    def stats():
+        return buffer.stats()
+
+    return app
+
+
+def start_in_background(buffer, host: str = "0.0.0.0", port: int = 8080) -> threading.Thread:
+    """Startet uvicorn in einem Daemon-Thread neben dem Poll-Loop."""
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(create_app(buffer), host=host, port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, name="live-api", daemon=True)
+    thread.start()
+    logger.info("Live-API auf %s:%s gestartet", host, port)
+    return thread
@@ -10,9 +10,10 @@ import pandas as pd
 from dotenv import load_dotenv
 from pymongo import MongoClient, errors
 
-from client import Client
-from util.mapping import entity_to_beehives, entity_id_to_sensor
-from util.timeParser import TimeParser
+from client import Client, TZ
+from util.fileIndex import FileIndex
+from util.logSetup import NO_SAMPLING, setup_logging
+from util.schema import compact_readings, to_documents, with_local_datetime
 from constants2 import (
     WETTERSTATION_AUTHT_GROUP,
     FUTTERKAMMER_AUTH_GROUP,
@@ -28,13 +29,8 @@ except Exception:
 
 load_dotenv()
 
-# Logging konfigurieren
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[logging.StreamHandler(sys.stdout)]
-)
-logger = logging.getLogger("BeehiveMain")
+# Logging konfigurieren (Ausgabe im Hintergrund-Thread, Levels über LOG_LEVELS)
+logger = setup_logging("BeehiveMain")
 
 class BeehiveDbClient:
     """MongoDB Client für Bienenstock-Sensordaten"""
@@ -55,25 +51,17 @@ class BeehiveDbClient:
                 name="unique_sensor_reading"
             )
         except Exception as e:
-            logger.warning(f"Index-Erstellung fehlgeschlagen: {e}")
+            logger.warning("Index-Erstellung fehlgeschlagen: %s", e)
 
     def insert_many(self, df: pd.DataFrame) -> Dict[str, int]:
         if df.empty:
             return {"inserted": 0, "duplicates": 0, "errors": 0}
 
-        df_clean = df.copy()
-        if "datetime_utc" in df_clean.columns:
-            df_clean = df_clean[df_clean["datetime_utc"].notna()]
-        elif "datetime" in df_clean.columns:
-            df_clean = df_clean[df_clean["datetime"].notna()]
-        if "ts" in df_clean.columns:
-            df_clean = df_clean[df_clean["ts"].notna()]
-
+        df_clean = compact_readings(df)
         if df_clean.empty:
             return {"inserted": 0, "duplicates": 0, "errors": 0}
 
-        tp = TimeParser()
-        docs = tp.inject_bson_datetime(df_clean, replace_ts=True).to_dict("records")
+        docs = to_documents(df_clean, bson_ts=True)
 
         inserted = 0
         duplicates = 0
@@ -87,7 +75,7 @@ class BeehiveDbClient:
                 duplicates += 1
             except Exception as e:
                 errors_count += 1
-                logger.error(f"Fehler beim Einfügen: {e}")
+                logger.error("Fehler beim Einfügen: %s", e)
 
         return {
             "inserted": inserted,
@@ -97,41 +85,19 @@ class BeehiveDbClient:
 
 
 def clean_dataframe(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Bereinigt Rohzeilen ins kompakte Schema (util.schema.READING_COLUMNS):
+    nur numerische Werte mit Zeitstempel, ohne Duplikate, sortiert nach Zeit.
+    """
     if df.empty:
-        return df
-
-    df = df[df["key"].notna() & (df["key"] != "beehiveId")].copy()
-    df["value"] = pd.to_numeric(df["value"], errors="coerce")
-    df = df.dropna(subset=["value"])
-    if "ts" in df.columns:
-        df = df.dropna(subset=["ts"])
-
-    tp = TimeParser()
-    df = tp.inject_bson_datetime(df, replace_ts=False)
-
-    if "datetime_utc" not in df.columns:
-        if "datetime" in df.columns:
-            df["datetime_utc"] = pd.to_datetime(df["datetime"], utc=True, errors="coerce")
-        else:
-            df["datetime_utc"] = pd.NaT
-
-    df["datetime_local"] = df["datetime_utc"].dt.tz_convert("Europe/Berlin")
-
-    subset_cols = [c for c in ["entityId", "key", "ts"] if c in df.columns]
-    if subset_cols:
-        df = df.drop_duplicates(subset=subset_cols)
-
-    df["sensorName"] = df["entityId"].map(entity_id_to_sensor)
-    df["beehiveIds"] = df["entityId"].map(entity_to_beehives)
+        return compact_readings(df)
 
-    if "datetime_local" in df.columns:
-        df = df.sort_values(by=["datetime_local", "entityId", "key"], ignore_index=True)
+    if "key" in df.columns:
+        df = df[df["key"].notna() & (df["key"] != "beehiveId")]
+    df = compact_readings(df)
 
-    cols = [
-        "datetime_local", "entityId", "sensorName",
-        "key", "value", "beehiveIds", "datetime_utc", "ts"
-    ]
-    df = df[[c for c in cols if c in df.columns]]
+    df = df.drop_duplicates(subset=["entityId", "key", "ts"])
+    df = df.sort_values(by=["ts", "entityId", "key"], ignore_index=True)
 
     return df
 
@@ -150,12 +116,13 @@ def check_anomalies(df: pd.DataFrame):
         return ["Keine Daten vorhanden"]
 
     messages = []
+    tz = ZoneInfo("Europe/Berlin")
 
     for _, row in df.iterrows():
         sensor = row.get("sensorName") or row.get("entityId")
         value = row["value"]
         key = row["key"]
-        dt = row.get("datetime_local", datetime.now())
+        dt = datetime.fromtimestamp(row["ts"] / 1000, tz) if "ts" in row else datetime.now(tz)
         season = get_season(dt.month)
 
         normal_range = None
@@ -183,48 +150,57 @@ def check_anomalies(df: pd.DataFrame):
     return messages
 
 
-def cleanup_old_csv(log_folder: str, days: int = 7):
-    now = time.time()
-    cutoff = now - days * 86400  # 7 Tage in Sekunden
+def log_anomalies(name: str, messages: list):
+    """
+    Fasst die Meldungen von check_anomalies zusammen: Alarme/Vorwarnungen je Sensor
+    und Key einmal mit Anzahl und letztem Wert, OK-Werte nur als Summe.
+    """
+    grouped: Dict[str, list] = {}
+    ok = 0
+    for msg in messages:
+        if msg.startswith("✅"):
+            ok += 1
+            continue
+        entry = grouped.setdefault(msg.split(" = ")[0], [0, msg])
+        entry[0] += 1
+        entry[1] = msg
+    # Alarme nie drosseln (SamplingFilter)
+    for count, last in grouped.values():
+        logger.warning("%s: %s [%dx, letzter Wert]", name, last, count, extra=NO_SAMPLING)
+    if not grouped:
+        logger.info("%s: Alle Werte im Normalbereich (%d)", name, ok)
+    else:
+        logger.info("%s: %d Werte im Normalbereich", name, ok)
+
 
-    for f in os.listdir(log_folder):
-        if f.endswith(".csv"):
-            path = os.path.join(log_folder, f)
-            if os.path.getmtime(path) < cutoff:
-                try:
-                    os.remove(path)
-                    print(f"🗑️ Gelöscht: {path}")
-                except Exception as e:
-                    print(f"⚠️ Fehler beim Löschen von {path}: {e}")
+def cleanup_old_csv(log_index: FileIndex, days: int = 7):
+    # Alter aus dem Datei-Index statt listdir + getmtime pro Datei
+    for rel in log_index.older_than(days * 86400, suffix=".csv"):  # 7 Tage in Sekunden
+        path = os.path.join(log_index.root, rel)
+        try:
+            log_index.remove([rel])
+            logger.info("Gelöscht: %s", path)
+        except Exception as e:
+            logger.warning("Fehler beim Löschen von %s: %s", path, e)
 
 
 def fetch_and_clean(auth_group: str, group_name: str) -> pd.DataFrame:
     c = Client()
-    now = datetime.now(ZoneInfo("Europe/Berlin"))
+    # Exaktes Fenster [jetzt - 5 min, jetzt) statt minutengenauer Strings
+    now = datetime.now(TZ)
     start = now - timedelta(minutes=5)
 
-    start_date = start.strftime("%d.%m.%Y")
-    start_time = start.strftime("%H:%M")
-    end_date = now.strftime("%d.%m.%Y")
-    end_time = now.strftime("%H:%M")
-
-    print(f"\n=== {group_name} ({auth_group}) ===")
+    logger.info("=== %s (%s) ===", group_name, auth_group)
     entity_ids = c.get_all_entity_ids(auth_group)
-    print(f"Gefundene Entity-IDs: {entity_ids}")
+    logger.info("%s: %d Entity-IDs gefunden", group_name, len(entity_ids))
+    logger.debug("Entity-IDs: %s", entity_ids)
 
     all_rows = []
 
     for eid in entity_ids:
-        print(f"\n--- Entity: {eid} ---")
+        logger.debug("Entity: %s", eid)
         try:
-            raw = c.get_time_series(
-                entityId=eid,
-                authGroup=auth_group,
-                startDate=start_date,
-                startTime=start_time,
-                endDate=end_date,
-                endTime=end_time
-            )
+            raw = c.get_window(eid, auth_group, start, now)
 
             if isinstance(raw, dict) and any(isinstance(v, dict) for v in raw.values()):
                 for key, measurements in raw.items():
@@ -235,22 +211,24 @@ def fetch_and_clean(auth_group: str, group_name: str) -> pd.DataFrame:
                 all_rows.extend(c._normalize_timeseries_payload(eid, raw))
 
         except Exception as e:
-            print(f"⚠️ Fehler beim Abrufen von Entity {eid}: {e}")
+            logger.warning("Fehler beim Abrufen von Entity %s: %s", eid, e)
 
     df = pd.DataFrame(all_rows)
-    df = c._to_berlin_datetime(df)
     df_clean = clean_dataframe(df)
 
-    print(f"\nBereinigt: {len(df_clean)} gültige Werte ({len(df) - len(df_clean)} entfernt)")
-    if not df_clean.empty:
-        print(df_clean.head(10).to_string(index=False))
+    logger.info("Bereinigt: %d gültige Werte (%d entfernt)", len(df_clean), len(df) - len(df_clean))
+    # Vorschau nur bei DEBUG bauen (to_string ist teuer)
+    if not df_clean.empty and logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Vorschau:\n%s", with_local_datetime(df_clean.head(10)).to_string(index=False))
 
     return df_clean
 
 
-def main():
+def main(log_index: FileIndex = None):
     log_folder = "Logs"
     os.makedirs(log_folder, exist_ok=True)
+    if log_index is None:
+        log_index = FileIndex(log_folder)
 
     db_client = BeehiveDbClient(collection="digitalBeehive")
     all_results = []
@@ -265,33 +243,29 @@ def main():
             all_results.append((name, df))
 
     total_rows = sum(len(df) for _, df in all_results)
-    print(f"\n=== Zusammenfassung: {total_rows} bereinigte Werte insgesamt ===")
+    logger.info("=== Zusammenfassung: %d bereinigte Werte insgesamt ===", total_rows)
 
     if total_rows > 0:
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         for name, df in all_results:
             filename = os.path.join(log_folder, f"cleaned_{name.lower()}_{timestamp}.csv")
-            df.to_csv(filename, index=False, sep=";", encoding="utf-8-sig")
-            print(f"💾 Gespeichert: {filename}")
-
-            print(f"\n=== Alarmcheck für {name} ===")
-            messages = check_anomalies(df)
-            if messages:
-                for msg in messages:
-                    print(msg)
-            else:
-                print("✅ Alle Werte im Normalbereich")
+            with_local_datetime(df).to_csv(filename, index=False, sep=";", encoding="utf-8-sig")
+            log_index.register(filename)
+            logger.info("Gespeichert: %s", filename)
+
+            log_anomalies(name, check_anomalies(df))
 
-            print(f"\n=== Speichern in MongoDB für {name} ===")
             result = db_client.insert_many(df)
-            print(f"MongoDB Insert: {result['inserted']} eingefügt, "
-                  f"{result['duplicates']} Duplikate, {result['errors']} Fehler")
+            logger.info("%s: MongoDB Insert: %d eingefügt, %d Duplikate, %d Fehler",
+                        name, result["inserted"], result["duplicates"], result["errors"])
 
-    cleanup_old_csv(log_folder)
+    cleanup_old_csv(log_index)
 
 
 if __name__ == "__main__":
+    os.makedirs("Logs", exist_ok=True)
+    log_index = FileIndex("Logs")
     while True:
-        main()
-        print("\n⏱️ Warten 5 Minuten bis zum nächsten Abruf...\n")
+        main(log_index)
+        logger.info("Warten 5 Minuten bis zum nächsten Abruf...")
         time.sleep(300)
@@ -1,17 +1,25 @@
 import os
 import sys
+import signal
 import time
 import logging
 from pathlib import Path
 from datetime import datetime, timedelta
-from zoneinfo import ZoneInfo
 
+import requests
 from dotenv import load_dotenv
-import pandas as pd
 
 from constants import WETTERSTATION_AUTHT_GROUP, FUTTERKAMMER_AUTH_GROUP, BRUTKAMMER_AUTH_GROUP
-from client import Client
+from client import Client, TZ
 from db.beehiveDbClient import BeehiveDbClient
+from util.schema import concat_readings
+from retention import RetentionScheduler
+from util.derived import update_derived_metrics
+from db.gapScanner import GapRefiller
+from db.leaseCoordinator import LeaseCoordinator
+from util.ringBuffer import RingBuffer, RING_SIZE
+from util.recentlySeen import RecentlySeen
+from util.logSetup import setup_logging, logging_stats
 
 # Lade Umgebungsvariablen
 load_dotenv()
@@ -20,6 +28,24 @@ load_dotenv()
 POLL_INTERVAL_SECONDS = 5 * 60  # 5 Minuten
 LOOKBACK_MINUTES = 5  # Standard: letzte 5 Minuten
 MAX_LOOKBACK_MINUTES = 60  # Maximal 1 Stunde zurückschauen
+# Zeitbudget pro Zyklus (Sekunden): ein Zyklus dauert höchstens Budget + ein Request-Timeout
+CYCLE_BUDGET_SECONDS = float(os.getenv("POLL_CYCLE_BUDGET_SECONDS", str(POLL_INTERVAL_SECONDS * 3 // 4)))
+# Schlanker Modus: Ingest ohne pandas/numpy (kleine Pods, schneller Start);
+# abgeleitete Kennzahlen laufen dann nicht im Poller
+POLLER_LITE = os.getenv("POLLER_LITE", "").lower() in ("1", "true", "yes")
+# Hintergrund-Pass, der Lücken in den gespeicherten Reihen gezielt nachholt
+GAP_REFILL = os.getenv("GAP_REFILL", "1").lower() in ("1", "true", "yes")
+# Mehrere Replicas: Entities per Consistent Hashing + Leases in MongoDB aufteilen
+POLLER_COORDINATION = os.getenv("POLLER_COORDINATION", "").lower() in ("1", "true", "yes")
+# Letzte Messwerte im Speicher; optional als Lese-API (liveapi.py, benötigt fastapi/uvicorn)
+LIVE_BUFFER_SIZE = int(os.getenv("LIVE_BUFFER_SIZE", str(RING_SIZE)))
+LIVE_API_PORT = os.getenv("LIVE_API_PORT")
+# Bereits gespeicherte Messwerte (überlappende Lookbacks) vor MongoDB verwerfen
+WRITE_DEDUP = os.getenv("WRITE_DEDUP", "1").lower() in ("1", "true", "yes")
+# Spaltenorientierter Analyse-Cache der letzten Tage (util/analysisCache.py, benötigt pyarrow);
+# 0 = aus, ANALYSIS_CACHE_DIR = Ablage als memory-mapped Arrow-Dateien (sonst nur im Speicher)
+ANALYSIS_CACHE_DAYS = float(os.getenv("ANALYSIS_CACHE_DAYS", "0"))
+ANALYSIS_CACHE_DIR = os.getenv("ANALYSIS_CACHE_DIR") or None
 
 # AuthGroups für die 3 Bienenstöcke
 AUTH_GROUPS = [
@@ -30,51 +56,70 @@ AUTH_GROUPS = [
 
 # Logging Setup
 def setup_logger() -> logging.Logger:
-    """Richtet Logger für Poller ein"""
-    logger = logging.getLogger("beehive_poller")
-    logger.setLevel(logging.INFO)
-    logger.handlers.clear()
-    
-    # Format
-    fmt = logging.Formatter(
-        "%(asctime)s [%(levelname)s] %(message)s",
-        "%Y-%m-%d %H:%M:%S"
-    )
-    
-    # Console Handler
-    ch = logging.StreamHandler(sys.stdout)
-    ch.setLevel(logging.INFO)
-    ch.setFormatter(fmt)
-    logger.addHandler(ch)
-    
-    # Optional: File Handler (tägliche Log-Datei)
-    log_dir = Path("logs")
-    log_dir.mkdir(exist_ok=True)
-    today = datetime.now(ZoneInfo("Europe/Berlin")).strftime("%Y-%m-%d")
-    fh = logging.FileHandler(log_dir / f"poller_{today}.log", encoding="utf-8")
-    fh.setLevel(logging.DEBUG)
-    fh.setFormatter(fmt)
-    logger.addHandler(fh)
-    
-    return logger
+    """
+    Richtet Logger für Poller ein: Konsole + tägliche Log-Datei, geschrieben von einem
+    Hintergrund-Thread (util/logSetup.py); Levels pro Komponente über LOG_LEVELS.
+    """
+    today = datetime.now(TZ).strftime("%Y-%m-%d")
+    return setup_logging("beehive_poller", Path("logs") / f"poller_{today}.log")
 
 logger = setup_logger()
 
 class BeehivePoller:
     """Hauptklasse für 5-Minuten Polling der Bienenstock-Sensordaten"""
     
-    def __init__(self):
-        self.client = Client()
+    def __init__(self, lite: bool = POLLER_LITE, client: Client | None = None):
+        """
+        Args:
+            lite: Ingest ohne pandas (Dicts -> Bulk-Insert), siehe POLLER_LITE
+            client: API-Client (Standard: Client(), z.B. Stub-API in simulate.py)
+        """
+        self.lite = lite
+        self.client = client or Client()
         self.db_client = None
         self.consecutive_errors = 0  # Zählt aufeinanderfolgende Fehler
+        self.cycle_budget = CYCLE_BUDGET_SECONDS
+        # (authGroup, entityId) -> Start des nicht abgerufenen Fensters
+        self.carry_over: dict[tuple[str, str], datetime] = {}
+        self.cycle_stats = {"aborted": 0, "skipped": 0}
+        # TTL und Rollups in MongoDB (täglich), erster Lauf nach einem Poll-Intervall im Hintergrund
+        self.retention = RetentionScheduler(initial_delay_seconds=POLL_INTERVAL_SECONDS)
+        # Letzte N Messwerte pro (entityId, key), wird nach jedem Insert fortgeschrieben
+        self.live = RingBuffer(LIVE_BUFFER_SIZE)
+        self.analysis = None
+        if ANALYSIS_CACHE_DAYS > 0:
+            try:
+                from util.analysisCache import AnalysisCache
+                self.analysis = AnalysisCache(ANALYSIS_CACHE_DIR, days=ANALYSIS_CACHE_DAYS)
+            except ImportError as e:
+                logger.warning("Analyse-Cache deaktiviert (pyarrow installiert?): %s", e)
         
         try:
-            self.db_client = BeehiveDbClient(collection="digitalBeehive", isTimeSeries=True)
+            self.db_client = BeehiveDbClient.from_env(isTimeSeries=True)
         except Exception as e:
-            logger.error(f"MongoDB Initialisierung fehlgeschlagen: {e}")
+            logger.error("MongoDB Initialisierung fehlgeschlagen: %s", e)
             logger.error("Poller kann nicht starten ohne DB-Verbindung!")
             sys.exit(1)
+
+        if WRITE_DEDUP:
+            try:
+                self.db_client.use_seen_filter(RecentlySeen())
+            except Exception as e:
+                logger.warning("Dedup-Filter konnte nicht vorbelegt werden: %s", e)
+
+        # Aufteilung der Entities zwischen Replicas (None = dieses Replica fragt alles ab)
+        self.coordinator = LeaseCoordinator(self.db_client) if POLLER_COORDINATION else None
+
+        # Eigener Client für den Refill-Thread (Session nicht zwischen Threads teilen)
+        # Nachgeholte Werte auch in Live-Puffer und Analyse-Cache übernehmen
+        self.gap_refiller = GapRefiller(Client(base_url=self.client.base_url), self.db_client, AUTH_GROUPS,
+                                        is_active=self.is_leader,
+                                        on_records=self._cache_records) if GAP_REFILL else None
     
+    def is_leader(self) -> bool:
+        """Globale Aufgaben (Kennzahlen, Retention, Gap-Refill) laufen nur auf einem Replica."""
+        return self.coordinator is None or self.coordinator.is_leader()
+
     def calculate_lookback_minutes(self) -> int:
         """
         Berechnet wie viele Minuten zurückgeschaut werden sollen.
@@ -87,15 +132,30 @@ class BeehivePoller:
         lookback = LOOKBACK_MINUTES + (self.consecutive_errors * POLL_INTERVAL_SECONDS // 60)
         return min(lookback, MAX_LOOKBACK_MINUTES)
     
-    def get_time_range(self, lookback_minutes: int) -> tuple[str, str, str, str]:
+    def _window(self, lookback_minutes: int, since: datetime | None = None,
+                now: datetime | None = None) -> tuple[datetime, datetime]:
+        """
+        Exaktes Abfragefenster [start, now) als zeitzonenbewusste datetimes;
+        since (übertragenes Fenster) verlängert es nach hinten.
         """
-        Berechnet Start/End Zeitpunkte für API-Abfrage.
+        now = now or datetime.now(TZ)
+        start = now - timedelta(minutes=lookback_minutes)
+        if since is not None:
+            start = max(min(start, since), now - timedelta(minutes=MAX_LOOKBACK_MINUTES))
+        return start, now
+
+    def get_time_range(self, lookback_minutes: int, since: datetime | None = None) -> tuple[str, str, str, str]:
+        """
+        Berechnet Start/End Zeitpunkte für die String-API des Clients (minutengenau);
+        der Poller selbst fragt exakte Fenster ab (siehe _window).
+        
+        Args:
+            since: Start eines im letzten Zyklus nicht abgerufenen Fensters (Carry-over)
         
         Returns:
             (startDate, startTime, endDate, endTime) im Format der API
         """
-        now = datetime.now(ZoneInfo("Europe/Berlin"))
-        start = now - timedelta(minutes=lookback_minutes)
+        start, now = self._window(lookback_minutes, since)
         
         return (
             start.strftime("%d.%m.%Y"),
@@ -104,109 +164,229 @@ class BeehivePoller:
             now.strftime("%H:%M")
         )
     
-    def fetch_and_store_group(self, name: str, auth_group: str, lookback_minutes: int) -> bool:
+    def fetch_and_store_group(self, name: str, auth_group: str, lookback_minutes: int,
+                              deadline: float | None = None) -> bool:
         """
         Holt Daten für eine AuthGroup und speichert in MongoDB.
         
+        Args:
+            deadline: Ende des Zeitbudgets der Gruppe (time.monotonic), None = unbegrenzt
+        
         Returns:
             True bei Erfolg, False bei Fehler
         """
         try:
-            logger.info(f"Starte Datenabfrage: {name} (lookback={lookback_minutes}min)")
-            
-            start_date, start_time, end_date, end_time = self.get_time_range(lookback_minutes)
+            logger.info("Starte Datenabfrage: %s (lookback=%dmin)", name, lookback_minutes)
             
             # Hole alle Entity IDs
-            entity_ids = self.client.get_all_entity_ids(auth_group)
-            logger.info(f"{name}: {len(entity_ids)} Sensoren gefunden")
+            with self.client.budget(deadline):
+                entity_ids = self.client.get_all_entity_ids(auth_group)
+            logger.info("%s: %d Sensoren gefunden", name, len(entity_ids))
             
-            all_rows = []
+            if self.coordinator is not None:
+                entity_ids, handover = self.coordinator.owned(auth_group, entity_ids)
+                owned = set(entity_ids)
+                # Übertragene Fenster abgegebener Entities holt der neue Besitzer über polledUntil
+                for key in [k for k in self.carry_over if k[0] == auth_group and k[1] not in owned]:
+                    del self.carry_over[key]
+                for entity_id, until in handover.items():
+                    self.carry_over.setdefault((auth_group, entity_id), until)
+                logger.info("%s: %d Sensoren in Besitz dieses Replicas", name, len(entity_ids))
             
-            # Für jede Entity Time-Series abrufen
-            for entity_id in entity_ids:
-                try:
-                    data = self.client.get_time_series(
-                        entityId=entity_id,
-                        authGroup=auth_group,
-                        startDate=start_date,
-                        startTime=start_time,
-                        endDate=end_date,
-                        endTime=end_time
-                    )
-                    
-                    # Normalisiere Daten
-                    if isinstance(data, dict) and any(isinstance(v, dict) for v in data.values()):
-                        for _, measurements in data.items():
-                            all_rows.extend(
-                                self.client._normalize_timeseries_payload(entity_id, measurements)
-                            )
-                    else:
-                        all_rows.extend(
-                            self.client._normalize_timeseries_payload(entity_id, data)
-                        )
-                
-                except Exception as e:
-                    logger.error(f"Fehler bei Entity {entity_id}: {e}")
-                    all_rows.append({
-                        "entityId": entity_id,
-                        "key": None,
-                        "ts": None,
-                        "value": f"error: {str(e)}"
-                    })
+            # Gemeinsames Fensterende aller Entities, auch für die Übergabe an andere Replicas
+            polled_until = datetime.now(TZ)
+            fetch = self.client.fetch_window if self.lite else self.client.fetch_window_df
+            results, done = self._fetch_entities(auth_group, entity_ids, lookback_minutes, deadline, fetch,
+                                                 polled_until)
+            if self.coordinator is not None:
+                self.coordinator.mark_polled(done, polled_until)
+            
+            if self.lite:
+                return self._store_records(name, [r for records in results for r in records])
             
-            # Erstelle DataFrame und konvertiere Zeitstempel
-            df = pd.DataFrame(all_rows)
-            df = self.client._to_berlin_datetime(df)
+            # DataFrame im kompakten Schema
+            df = concat_readings(results)
             
-            logger.info(f"{name}: {len(df)} Datenpunkte abgerufen")
+            logger.info("%s: %d Datenpunkte abgerufen", name, len(df))
             
             # Speichere in MongoDB
             if not df.empty:
+                self.live.add_frame(df)
+                if self.analysis is not None:
+                    self.analysis.append_frame(df)
                 result = self.db_client.insert_many(df)
-                logger.info(
-                    f"{name}: MongoDB Insert - {result['inserted']} neu, "
-                    f"{result['duplicates']} Duplikate, {result['errors']} Fehler"
-                )
+                logger.info("%s: MongoDB Insert - %d neu, %d Duplikate, %d Fehler",
+                            name, result["inserted"], result["duplicates"], result["errors"])
             else:
-                logger.warning(f"{name}: Keine Daten zum Speichern")
+                logger.warning("%s: Keine Daten zum Speichern", name)
             
             return True
             
         except Exception as e:
-            logger.error(f"Fehler bei {name}: {e}", exc_info=True)
+            logger.error("Fehler bei %s: %s", name, e, exc_info=True)
             return False
     
+    def _fetch_entities(self, auth_group: str, entity_ids: list[str], lookback_minutes: int,
+                        deadline: float | None, fetch, until: datetime | None = None) -> tuple[list, list[str]]:
+        """
+        Ruft jede Entity mit ihrem Anteil am Restbudget ab (ungenutzte Zeit geht an die
+        folgenden). Läuft das Budget ab, wird das Fenster der Entity in den nächsten
+        Zyklus übertragen statt den Zyklus zu verlängern.
+
+        Args:
+            fetch: Client.fetch_window bzw. fetch_window_df (Fenster [start, until))
+            until: gemeinsames Fensterende (Standard: jetzt)
+        
+        Returns:
+            (Ergebnisse, erfolgreich abgefragte entityIds)
+        """
+        results, done = [], []
+        for i, entity_id in enumerate(entity_ids):
+            carried = self.carry_over.get((auth_group, entity_id))
+            start, end = self._window(lookback_minutes, carried, until)
+            
+            entity_deadline = None
+            if deadline is not None:
+                now = time.monotonic()
+                if now >= deadline:
+                    self.carry_over[(auth_group, entity_id)] = start
+                    self.cycle_stats["skipped"] += 1
+                    continue
+                entity_deadline = now + (deadline - now) / (len(entity_ids) - i)
+            
+            try:
+                with self.client.budget(entity_deadline):
+                    results.append(fetch(entity_id, auth_group, start, end))
+                self.carry_over.pop((auth_group, entity_id), None)
+                done.append(entity_id)
+            except requests.RequestException as e:
+                # Abgebrochen (Timeout, Budget, Verbindung): Fenster im nächsten Zyklus nachholen
+                logger.warning("Request für Entity %s abgebrochen, Fenster ab %s folgt im nächsten Zyklus: %s",
+                               entity_id, start.strftime("%H:%M"), e)
+                self.carry_over[(auth_group, entity_id)] = start
+                self.cycle_stats["aborted"] += 1
+            except Exception as e:
+                logger.error("Fehler bei Entity %s: %s", entity_id, e)
+        return results, done
+    
+    def _store_records(self, name: str, records: list[dict]) -> bool:
+        """Schlanker Pfad: Messwerte als Dicts gebündelt schreiben (ohne pandas)."""
+        logger.info("%s: %d Datenpunkte abgerufen", name, len(records))
+        if not records:
+            logger.warning("%s: Keine Daten zum Speichern", name)
+            return True
+
+        self._cache_records(records)
+        result = self.db_client.insert_records(records)
+        logger.info("%s: MongoDB Insert - %d neu, %d Duplikate, %d Fehler",
+                    name, result["inserted"], result["duplicates"], result["errors"])
+        return True
+
+    def _cache_records(self, records: list[dict]):
+        """Messwerte (Dicts) in Live-Puffer und Analyse-Cache übernehmen."""
+        self.live.add_records(records)
+        if self.analysis is not None:
+            self.analysis.append_records(records)
+
     def poll_once(self):
         """Führt einen Polling-Zyklus aus"""
         lookback = self.calculate_lookback_minutes()
         
-        logger.info(f"=== Polling-Zyklus gestartet (lookback={lookback}min) ===")
+        logger.info("=== Polling-Zyklus gestartet (lookback=%dmin) ===", lookback)
         
         success_count = 0
+        started = time.monotonic()
+        deadline = started + self.cycle_budget
+        self.cycle_stats = {"aborted": 0, "skipped": 0}
         
-        for name, auth_group in AUTH_GROUPS:
-            if self.fetch_and_store_group(name, auth_group, lookback):
+        # Restbudget gleichmäßig auf die verbleibenden Gruppen verteilen
+        for i, (name, auth_group) in enumerate(AUTH_GROUPS):
+            now = time.monotonic()
+            group_deadline = now + max(0.0, deadline - now) / (len(AUTH_GROUPS) - i)
+            if self.fetch_and_store_group(name, auth_group, lookback, group_deadline):
                 success_count += 1
+
+        # Mit Koordination fragt dieses Replica nur einen Teil der Entities ab;
+        # die übrigen Serien des Live-Puffers aus MongoDB nachziehen
+        if self.coordinator is not None:
+            try:
+                self.live.refresh(self.db_client, hours=2 * POLL_INTERVAL_SECONDS / 3600)
+            except Exception as e:
+                logger.warning("Live-Puffer nicht aus MongoDB nachgezogen: %s", e)
         
         # Fehler-Counter anpassen
         if success_count == len(AUTH_GROUPS):
             if self.consecutive_errors > 0:
-                logger.info(f"Alle Gruppen erfolgreich nach {self.consecutive_errors} Fehlern")
+                logger.info("Alle Gruppen erfolgreich nach %d Fehlern", self.consecutive_errors)
             self.consecutive_errors = 0
         else:
             self.consecutive_errors += 1
-            logger.warning(
-                f"Nur {success_count}/{len(AUTH_GROUPS)} Gruppen erfolgreich. "
-                f"Consecutive Errors: {self.consecutive_errors}"
-            )
+            logger.warning("Nur %d/%d Gruppen erfolgreich. Consecutive Errors: %d",
+                           success_count, len(AUTH_GROUPS), self.consecutive_errors)
+        
+        self._log_cycle_stats(time.monotonic() - started)
         
+        # Beuten-Kennzahlen (Brut-Mittel, Deltas zu außen) fortschreiben;
+        # bei aufgebrauchtem Budget im nächsten Zyklus (Watermark holt auf)
+        leader = self.is_leader()
+        if not self.lite and leader and time.monotonic() < deadline:
+            try:
+                update_derived_metrics(self.db_client)
+            except Exception as e:
+                logger.error("Abgeleitete Kennzahlen fehlgeschlagen: %s", e, exc_info=True)
+
+        # Nur MongoDB; lokale Dateien verwaltet job.py bzw. `python retention.py`
+        if leader:
+            self.retention.run_if_due(self.db_client, background=True)
+
+        if self.analysis is not None:
+            try:
+                self.analysis.evict()
+                self.analysis.flush()
+            except Exception as e:
+                logger.warning("Analyse-Cache nicht fortgeschrieben: %s", e)
+
         logger.info("=== Polling-Zyklus beendet ===\n")
     
+    def _log_cycle_stats(self, duration: float):
+        stats = self.cycle_stats
+        msg = "Zyklus-Abruf: %.1fs von %.0fs Budget, %d Requests abgebrochen, %d übersprungen, %d Fenster übertragen"
+        args = (duration, self.cycle_budget, stats["aborted"], stats["skipped"], len(self.carry_over))
+        if stats["aborted"] or stats["skipped"] or duration > self.cycle_budget:
+            logger.warning("Später Zyklus – " + msg, *args)
+        else:
+            logger.info(msg, *args)
+        if self.db_client.seen_filter is not None and logger.isEnabledFor(logging.INFO):
+            logger.info("Dedup-Filter: %s", self.db_client.seen_filter.stats())
+        log_stats = logging_stats()
+        if log_stats["dropped"]:
+            logger.warning("Logging: %d Meldungen verworfen (Queue voll), %d gedrosselt",
+                           log_stats["dropped"], log_stats["suppressed"])
+
     def run(self):
         """Startet den endlosen Polling-Loop"""
         logger.info("Beehive Poller gestartet")
-        logger.info(f"Polling Intervall: {POLL_INTERVAL_SECONDS}s ({POLL_INTERVAL_SECONDS//60} Minuten)")
-        logger.info(f"Überwachte Bienenstöcke: {len(AUTH_GROUPS)}")
+        logger.info("Polling Intervall: %ds (%d Minuten)", POLL_INTERVAL_SECONDS, POLL_INTERVAL_SECONDS // 60)
+        logger.info("Überwachte Bienenstöcke: %d", len(AUTH_GROUPS))
+        if self.lite:
+            logger.info("Schlanker Modus: Ingest ohne pandas, keine abgeleiteten Kennzahlen")
+        if self.coordinator is not None:
+            self.coordinator.start()
+        try:
+            self.live.seed(self.db_client)
+        except Exception as e:
+            logger.warning("Live-Puffer konnte nicht vorbelegt werden: %s", e)
+        if self.analysis is not None:
+            try:
+                self.analysis.warm(self.db_client)
+            except Exception as e:
+                logger.warning("Analyse-Cache konnte nicht nachgeladen werden: %s", e)
+        if LIVE_API_PORT:
+            from liveapi import start_in_background
+            start_in_background(self.live, port=int(LIVE_API_PORT))
+        if self.gap_refiller is not None:
+            self.gap_refiller.start()
+            logger.info("Gap-Refill aktiv (alle %ss)", self.gap_refiller.scan_interval_seconds)
         
         try:
             while True:
@@ -215,19 +395,25 @@ class BeehivePoller:
                 except KeyboardInterrupt:
                     raise
                 except Exception as e:
-                    logger.error(f"Unerwarteter Fehler im Polling-Loop: {e}", exc_info=True)
+                    logger.error("Unerwarteter Fehler im Polling-Loop: %s", e, exc_info=True)
                     self.consecutive_errors += 1
                 
                 # Warte bis zum nächsten Intervall
-                logger.info(f"Warte {POLL_INTERVAL_SECONDS}s bis zum nächsten Poll...\n")
+                logger.info("Warte %ds bis zum nächsten Poll...\n", POLL_INTERVAL_SECONDS)
                 time.sleep(POLL_INTERVAL_SECONDS)
         
         except KeyboardInterrupt:
             logger.info("\nPoller durch Benutzer gestoppt (Ctrl+C)")
         finally:
+            if self.gap_refiller is not None:
+                self.gap_refiller.stop()
+            if self.coordinator is not None:
+                self.coordinator.leave()
             logger.info("Beehive Poller beendet")
 
 def main():
+    # Kubernetes beendet Pods per SIGTERM: sauber abmelden, damit andere Replicas sofort übernehmen
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
     poller = BeehivePoller()
     poller.run()
 
@@ -0,0 +1,157 @@
+"""
+Gestufte Aufbewahrung der Sensordaten:
+
+  1. Rohdaten in MongoDB: TTL-Index auf ts (RETENTION_RAW_DAYS, Standard: unbegrenzt)
+  2. Rollups pro Stunde/Tag per $merge, jahrelang aufbewahrt (RETENTION_ROLLUP_*_DAYS)
+  3. Lokale Exporte unter data/ (nur auf Wunsch): Tagesordner werden nach
+     RETENTION_COMPACT_DAYS in Monats-ZIPs verdichtet, Archive nach
+     RETENTION_ARCHIVE_DAYS gelöscht. Grundlage ist der FileIndex, kein Verzeichnis-Scan.
+     Ordner mit einer Datei KEEP_MARKER (z.B. die Referenz-Traces) bleiben unangetastet.
+
+Aufruf: MongoDB periodisch aus dem Poller (RetentionScheduler), Dateien am Ende
+von job.py, oder beides manuell mit `python retention.py`.
+"""
+import os
+import time
+import logging
+import threading
+from pathlib import Path
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+from typing import Dict, Optional
+
+from dotenv import load_dotenv
+
+from util.fileIndex import FileIndex
+
+load_dotenv()
+
+logger = logging.getLogger("beehive_poller.retention")
+
+
+def _env_days(name: str, default: Optional[float]) -> Optional[float]:
+    """Tage aus der Umgebung; leer/"none" = unbegrenzt."""
+    raw = os.getenv(name)
+    if raw is None:
+        return default
+    if raw.strip().lower() in ("", "none", "off"):
+        return None
+    return float(raw)
+
+
+# Konfiguration (Tage, None = unbegrenzt)
+RAW_TTL_DAYS = _env_days("RETENTION_RAW_DAYS", None)
+ROLLUP_TIERS = {
+    "hour": _env_days("RETENTION_ROLLUP_HOUR_DAYS", 2 * 365),
+    "day": _env_days("RETENTION_ROLLUP_DAY_DAYS", None),
+}
+COMPACT_AFTER_DAYS = _env_days("RETENTION_COMPACT_DAYS", None)
+ARCHIVE_DELETE_DAYS = _env_days("RETENTION_ARCHIVE_DAYS", None)
+RETENTION_INTERVAL_SECONDS = 24 * 60 * 60  # einmal täglich
+
+DATA_DIR = Path(__file__).resolve().parent / "data"
+KEEP_MARKER = ".retention-keep"  # Tagesordner mit dieser Datei werden nie verdichtet
+
+
+def apply_db_retention(db_client) -> Dict[str, int]:
+    """Rollups fortschreiben und TTL der Rohdaten setzen (Rollups zuerst, damit nichts verloren geht)."""
+    result = {}
+    for unit, ttl_days in ROLLUP_TIERS.items():
+        result[f"rollup_{unit}"] = db_client.build_rollups(unit, ttl_days=ttl_days)
+    if RAW_TTL_DAYS is not None:
+        current = db_client.collection.index_information().get("ts_range", {}).get("expireAfterSeconds")
+        if current != int(RAW_TTL_DAYS * 86400):
+            db_client.apply_raw_ttl(RAW_TTL_DAYS)
+    return result
+
+
+def apply_file_retention(data_dir: Path = DATA_DIR,
+                         compact_after_days: Optional[float] = COMPACT_AFTER_DAYS,
+                         delete_after_days: Optional[float] = ARCHIVE_DELETE_DAYS) -> Dict[str, int]:
+    """
+    Verdichtet alte Tagesordner zu Monats-ZIPs und löscht abgelaufene Archive.
+
+    Returns:
+        Dict mit 'compacted_days', 'deleted_archives', 'bytes'
+    """
+    index = FileIndex(data_dir)
+    today = datetime.now(ZoneInfo("Europe/Berlin")).date()
+    compacted = deleted = 0
+
+    if compact_after_days is not None:
+        cutoff = (today - timedelta(days=compact_after_days)).isoformat()
+        for day, rels in sorted(index.days_before(cutoff).items()):
+            if (Path(data_dir) / day / KEEP_MARKER).exists():
+                continue
+            archive = index.compact_day(day, rels)
+            compacted += 1
+            logger.info("Tagesordner %s verdichtet nach %s", day, archive)
+
+    if delete_after_days is not None:
+        cutoff = (today - timedelta(days=delete_after_days)).isoformat()
+        expired = index.archives_before(cutoff)
+        deleted = index.remove(expired)
+        for rel in expired:
+            logger.info("Archiv gelöscht: %s", rel)
+
+    return {"compacted_days": compacted, "deleted_archives": deleted, "bytes": index.total_size()}
+
+
+class RetentionScheduler:
+    """
+    Führt die Retention höchstens alle RETENTION_INTERVAL_SECONDS aus, auf Wunsch
+    erst nach initial_delay_seconds und in einem Hintergrund-Thread (der erste
+    Rollup-Lauf aggregiert die ganze Collection und soll das Polling nicht blockieren).
+    """
+
+    def __init__(self, interval_seconds: int = RETENTION_INTERVAL_SECONDS, *,
+                 initial_delay_seconds: float = 0):
+        self.interval_seconds = interval_seconds
+        self.last_run: Optional[float] = None
+        if initial_delay_seconds > 0:
+            self.last_run = time.monotonic() - interval_seconds + initial_delay_seconds
+        self._thread: Optional[threading.Thread] = None
+
+    def run_if_due(self, db_client=None, data_dir: Optional[Path] = None, *, background: bool = False) -> bool:
+        """
+        Args:
+            db_client: BeehiveDbClient für TTL und Rollups (None = überspringen)
+            data_dir: Datenordner für die Datei-Retention (None = überspringen)
+            background: in einem Daemon-Thread ausführen statt blockierend
+
+        Returns:
+            True, wenn ein Lauf gestartet wurde
+        """
+        now = time.monotonic()
+        if self.last_run is not None and now - self.last_run < self.interval_seconds:
+            return False
+        if self._thread is not None and self._thread.is_alive():
+            return False  # vorheriger Lauf noch aktiv
+        self.last_run = now
+        if background:
+            self._thread = threading.Thread(target=self._run, args=(db_client, data_dir),
+                                            name="retention", daemon=True)
+            self._thread.start()
+        else:
+            self._run(db_client, data_dir)
+        return True
+
+    def _run(self, db_client, data_dir: Optional[Path]):
+        try:
+            if db_client is not None:
+                logger.info("Retention MongoDB: %s", apply_db_retention(db_client))
+            if data_dir is not None:
+                logger.info("Retention Dateien: %s", apply_file_retention(data_dir))
+        except Exception as e:
+            logger.error("Retention fehlgeschlagen: %s", e, exc_info=True)
+
+
+def main():
+    from db.beehiveDbClient import BeehiveDbClient
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    RetentionScheduler().run_if_due(BeehiveDbClient.from_env(), DATA_DIR)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,413 @@
+"""
+Lastsimulation: spielt die CSV-Archive (data/<Tag>/auth_group_*.csv) beschleunigt über
+eine lokale Stub-API ab, hochskaliert auf N synthetische Beuten, und treibt damit den
+echten Pfad BeehivePoller -> Client -> BeehiveDbClient.
+
+Beispiel:
+    python simulate.py --hives 100 --speed 12 --cycles 10 --poll-seconds 30
+
+Schreibt in eine eigene Collection (Standard: digitalBeehive_sim) und berichtet
+Durchsatz, Latenz-Perzentile (API-Requests, DB-Writes, Zyklen) und Speicher.
+"""
+from __future__ import annotations
+
+import io
+import os
+import csv
+import gzip
+import json
+import time
+import uuid
+import random
+import bisect
+import logging
+import argparse
+import zipfile
+import tempfile
+import threading
+import multiprocessing
+from pathlib import Path
+from datetime import datetime
+from zoneinfo import ZoneInfo
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DATA_DIR = Path("data")
+DAY_MS = 24 * 60 * 60 * 1000
+SIM_NAMESPACE = uuid.UUID("5f1d3c2e-7a1b-4e57-9d0c-8a2b6c4e1f00")
+
+# Sensortyp -> AuthGroup (wie im echten Deployment, siehe constants.py)
+GROUP_BY_TYPE = {
+    "LoRaWAN SenseCAP-S2120": "digital_bee_hive_42-s2120",
+    "LoRaWAN Dragino-S31-LB": "digital_bee_hive_42_dragino-s31lb",
+    "LoRaWAN Dragino-D23-LB": "digital_bee_hive_42_dragino-d23-lb",
+}
+
+logger = logging.getLogger("beehive_poller")
+
+
+# =============================================================
+# Archiv laden und hochskalieren
+# =============================================================
+
+def _parse_value(raw: str):
+    for cast in (int, float):
+        try:
+            return cast(raw)
+        except ValueError:
+            pass
+    return raw
+
+
+def _day_csvs(day: str):
+    """Öffnet die auth_group_*.csv eines Tages aus data/<Tag>/ oder dem Monatsarchiv."""
+    paths = sorted((DATA_DIR / day).glob("auth_group_*.csv"))
+    if paths:
+        return [open(path, encoding="utf-8-sig", newline="") for path in paths]
+    archive = DATA_DIR / "archive" / f"{day[:7]}.zip"
+    if not archive.exists():
+        raise FileNotFoundError(f"Keine Archivdaten für {day} (weder {DATA_DIR / day} noch {archive})")
+    with zipfile.ZipFile(archive) as zf:
+        names = sorted(n for n in zf.namelist()
+                       if n.startswith(f"{day}/auth_group_") and n.endswith(".csv"))
+        return [io.StringIO(zf.read(n).decode("utf-8-sig"), newline="") for n in names]
+
+
+def load_archive(days: list[str]) -> dict[str, dict[str, list[tuple[int, object]]]]:
+    """
+    Liest die Tages-Archive als entityId -> key -> [(Offset-ms, Wert)], sortiert.
+    Offset = Abstand zu Mitternacht (Berlin) des Tages + Tagesindex * 24h, damit
+    mehrere Tage lückenlos hintereinander abgespielt werden. Ist der Tagesordner
+    bereits verdichtet, werden die CSVs aus data/archive/YYYY-MM.zip gelesen.
+    """
+    series: dict[str, dict[str, list[tuple[int, object]]]] = {}
+    for i, day in enumerate(days):
+        midnight = datetime.strptime(day, "%Y-%m-%d").replace(tzinfo=ZoneInfo("Europe/Berlin"))
+        base = int(midnight.timestamp() * 1000) - i * DAY_MS
+        for f in _day_csvs(day):
+            with f:
+                for row in csv.DictReader(f, delimiter=";"):
+                    series.setdefault(row["entityId"], {}).setdefault(row["key"], []).append(
+                        (int(row["ts"]) - base, _parse_value(row["value"])))
+    for keys in series.values():
+        for points in keys.values():
+            points.sort(key=lambda p: p[0])
+    return series
+
+
+def build_fleet(archive: dict, hives: int, jitter_seconds: float, seed: int = 42):
+    """
+    Skaliert die archivierte Anlage (3 Beuten, eine Wetterstation) auf `hives` Beuten:
+    Beute h übernimmt die Sensoren der Vorlage ((h-1) % 3) + 1, je 3 Beuten teilen sich
+    eine Wetterstation. Jede synthetische Entity bekommt eine eigene Phasenverschiebung
+    und pro Messwert etwas Jitter.
+
+    Returns:
+        (entities, registry, span): entities = entityId -> (authGroup, key -> (Offsets, Werte));
+        registry = Einträge für die Sensor-Registry (SENSOR_REGISTRY_FILE); span = Archivlänge in ms
+    """
+    from util.sensorRegistry import SensorRegistry
+
+    template = SensorRegistry()
+    rng = random.Random(seed)
+    span = max(p[0] for keys in archive.values() for pts in keys.values() for p in pts) + 1
+    jitter_ms = jitter_seconds * 1000
+
+    def clone(source_id: str, copy: str):
+        shift = rng.uniform(-jitter_ms, jitter_ms)
+        keys = {}
+        for key, points in archive.get(source_id, {}).items():
+            jittered = sorted(
+                (int(o + shift + rng.uniform(-jitter_ms, jitter_ms) / 10) % span, v) for o, v in points)
+            keys[key] = ([o for o, _ in jittered], [v for _, v in jittered])
+        return str(uuid.uuid5(SIM_NAMESPACE, f"{source_id}/{copy}")), keys
+
+    entities, registry = {}, []
+    for apiary in range((hives + 2) // 3):
+        hive_ids = list(range(apiary * 3 + 1, min(hives, apiary * 3 + 3) + 1))
+        for source_id in archive:
+            source_hives = template.beehives(source_id)
+            sensor_type = template.sensor_type(template.sensor_name(source_id) or "")
+            if sensor_type not in GROUP_BY_TYPE:
+                continue
+            if len(source_hives) > 1:
+                targets = hive_ids                  # Wetterstation: alle Beuten der Anlage
+            else:
+                targets = [h for h in hive_ids if ((h - 1) % 3) + 1 in source_hives]
+            if not targets:
+                continue
+            entity_id, keys = clone(source_id, f"{apiary}")
+            entities[entity_id] = (GROUP_BY_TYPE[sensor_type], keys)
+            registry.append({"entityId": entity_id,
+                             "sensorName": f"SIM-{apiary:04d}-{template.sensor_name(source_id)}",
+                             "sensorType": sensor_type, "beehiveIds": targets})
+    return entities, registry, span
+
+
+# =============================================================
+# Stub-API (eigener Prozess, damit der Speicher des Pollers sauber messbar bleibt)
+# =============================================================
+
+class ReplayClock:
+    """Bildet Echtzeit (Epoch-ms) auf den Archiv-Offset ab: offset = start + (t - origin) * speed."""
+
+    def __init__(self, origin_ms: int, start_offset_ms: int, speed: float, span_ms: int):
+        self.origin_ms = origin_ms
+        self.start_offset_ms = start_offset_ms
+        self.speed = speed
+        self.span_ms = span_ms
+
+    def to_offset(self, ts_ms: int) -> float:
+        return self.start_offset_ms + (ts_ms - self.origin_ms) * self.speed
+
+    def to_ts(self, offset: float) -> int:
+        return int(self.origin_ms + (offset - self.start_offset_ms) / self.speed)
+
+    def window(self, offsets: list[int], values: list, start_ms: int, end_ms: int):
+        """Punkte im Echtzeit-Fenster [start, end]; das Archiv läuft in Schleife."""
+        a0, a1 = self.to_offset(start_ms), self.to_offset(min(end_ms, int(time.time() * 1000)))
+        out = []
+        for lap in range(int(a0 // self.span_ms), int(a1 // self.span_ms) + 1):
+            base = lap * self.span_ms
+            lo = bisect.bisect_left(offsets, a0 - base)
+            hi = bisect.bisect_right(offsets, a1 - base)
+            out.extend({"ts": self.to_ts(base + offsets[i]), "value": values[i]} for i in range(lo, hi))
+        return out
+
+
+def _make_handler(entities: dict, clock: ReplayClock, latency_ms: float, error_rate: float):
+    groups: dict[str, list[str]] = {}
+    group_keys: dict[str, set[str]] = {}
+    for entity_id, (group, keys) in entities.items():
+        groups.setdefault(group, []).append(entity_id)
+        group_keys.setdefault(group, set()).update(keys)
+
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, code: int, payload=None):
+            body = json.dumps(payload if payload is not None else {}).encode()
+            gzip_ok = "gzip" in self.headers.get("Accept-Encoding", "")
+            if gzip_ok:
+                body = gzip.compress(body, compresslevel=5)
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            if gzip_ok:
+                self.send_header("Content-Encoding", "gzip")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if latency_ms:
+                time.sleep(random.uniform(0.5, 1.5) * latency_ms / 1000)
+            if error_rate and random.random() < error_rate:
+                return self._send(503)
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+            parts = url.path.strip("/").split("/")
+            try:
+                group = parts[parts.index("authGroup") + 1]
+            except (ValueError, IndexError):
+                return self._send(404)
+
+            if url.path.endswith("/entityId"):
+                return self._send(200, {"entities": [{"entityId": {"id": e}} for e in groups.get(group, [])]})
+            if url.path.endswith("/valueType"):
+                keys = sorted(group_keys.get(group, ()))
+                return self._send(200, {"valueType": {"TIME_SERIES": [{"key": k} for k in keys]}})
+            if url.path.endswith("/valueType/timeseries"):
+                entity = entities.get(parts[parts.index("entityId") + 1])
+                if entity is None:
+                    return self._send(404)
+                wanted = set(query.get("keys", [""])[0].split(",")) - {""}
+                start_ms, end_ms = int(query["startTs"][0]), int(query["endTs"][0])
+                series = {key: clock.window(offsets, values, start_ms, end_ms)
+                          for key, (offsets, values) in entity[1].items() if not wanted or key in wanted}
+                return self._send(200, {"timeseries": {k: v for k, v in series.items() if v}})
+            return self._send(404)
+
+    return StubHandler
+
+
+def _serve(entities: dict, clock: ReplayClock, latency_ms: float, error_rate: float, port_queue):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _make_handler(entities, clock, latency_ms, error_rate))
+    server.daemon_threads = True
+    port_queue.put(server.server_port)
+    server.serve_forever()
+
+
+# =============================================================
+# Messung
+# =============================================================
+
+def percentiles(values: list[float], points=(50, 95, 99)) -> dict[str, float]:
+    """Perzentile nach Nearest-Rank (leere Liste -> leeres Dict)."""
+    if not values:
+        return {}
+    ordered = sorted(values)
+    out = {f"p{p}": ordered[min(len(ordered) - 1, max(0, -(-p * len(ordered) // 100) - 1))] for p in points}
+    out["max"] = ordered[-1]
+    return out
+
+
+def _rss_mb() -> float | None:
+    """Aktueller Resident Set Size in MB (Linux, sonst None)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _peak_rss_mb() -> float | None:
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # Linux: KB
+    except ImportError:
+        return None
+
+
+class Metrics:
+    """Sammelt Latenzen und Zähler über die Hooks an Client und DB-Client."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.api_latency: list[float] = []
+        self.db_latency: list[float] = []
+        self.cycles: list[float] = []
+        self.rss: list[float] = []
+        self.inserted = 0
+        self.duplicates = 0
+        self.points = 0
+
+    def attach(self, poller):
+        def on_response(r, *args, **kwargs):
+            with self.lock:
+                self.api_latency.append(r.elapsed.total_seconds())
+        poller.client.session.hooks["response"].append(on_response)
+
+        db = poller.db_client
+        for name in ("insert_many", "insert_records"):
+            original = getattr(db, name)
+
+            def timed(data, *args, _original=original, **kwargs):
+                started = time.perf_counter()
+                result = _original(data, *args, **kwargs)
+                with self.lock:
+                    self.db_latency.append(time.perf_counter() - started)
+                    self.points += len(data)
+                    self.inserted += result.get("inserted", 0)
+                    self.duplicates += result.get("duplicates", 0)
+                return result
+            setattr(db, name, timed)
+
+    def report(self, wall_seconds: float) -> dict:
+        busy = sum(self.cycles)
+        return {
+            "cycles": len(self.cycles),
+            "api_requests": len(self.api_latency),
+            "points_fetched": self.points,
+            "inserted": self.inserted,
+            "duplicates": self.duplicates,
+            "throughput_points_per_s": round(self.points / busy, 1) if busy else None,
+            "inserted_per_wall_s": round(self.inserted / wall_seconds, 1) if wall_seconds else None,
+            "cycle_s": {k: round(v, 3) for k, v in percentiles(self.cycles).items()},
+            "api_latency_ms": {k: round(v * 1000, 1) for k, v in percentiles(self.api_latency).items()},
+            "db_write_ms": {k: round(v * 1000, 1) for k, v in percentiles(self.db_latency).items()},
+            "rss_mb": {"start": self.rss[0] if self.rss else None, "end": self.rss[-1] if self.rss else None,
+                       "peak": _peak_rss_mb()},
+        }
+
+
+# =============================================================
+# Ablauf
+# =============================================================
+
+def parse_args(argv=None) -> argparse.Namespace:
+    available = sorted(p.name for p in DATA_DIR.iterdir() if list(p.glob("auth_group_*.csv"))) \
+        if DATA_DIR.exists() else []
+    parser = argparse.ArgumentParser(description="Beschleunigte Wiedergabe der Archive als Lasttest für den Poller")
+    parser.add_argument("--days", nargs="+", default=available, help="Archiv-Tage (Standard: alle unter data/)")
+    parser.add_argument("--hives", type=int, default=30, help="Anzahl synthetischer Beuten")
+    parser.add_argument("--speed", type=float, default=12.0, help="Wiedergabe-Faktor (Archivzeit pro Echtzeit)")
+    parser.add_argument("--start-hour", type=float, default=8.0, help="Startpunkt im Archivtag (Stunde)")
+    parser.add_argument("--jitter-seconds", type=float, default=60.0, help="Phasen-Jitter pro Entity")
+    parser.add_argument("--cycles", type=int, default=5, help="Anzahl Poll-Zyklen")
+    parser.add_argument("--poll-seconds", type=float, default=60.0, help="Abstand zwischen zwei Zyklen")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="künstliche API-Latenz (±50 %%)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Anteil 503-Antworten der Stub-API")
+    parser.add_argument("--lite", action="store_true", help="Poller im schlanken Modus (POLLER_LITE)")
+    parser.add_argument("--collection", default="digitalBeehive_sim", help="Ziel-Collection")
+    parser.add_argument("--drop", action="store_true", help="Collection vorher leeren")
+    parser.add_argument("--report", type=Path, help="Ergebnis zusätzlich als JSON speichern")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not args.days:
+        raise SystemExit(f"Keine Archive unter {DATA_DIR}/ gefunden")
+
+    archive = load_archive(args.days)
+    entities, registry, span = build_fleet(archive, args.hives, args.jitter_seconds)
+    clock = ReplayClock(int(time.time() * 1000), int(args.start_hour * 3600 * 1000), args.speed, span)
+
+    ctx = multiprocessing.get_context("spawn")
+    port_queue = ctx.Queue()
+    stub = ctx.Process(target=_serve, args=(entities, clock, args.latency_ms, args.error_rate, port_queue),
+                       daemon=True)
+    stub.start()
+    port = port_queue.get(timeout=30)
+    entity_count = len(entities)
+    del entities, archive
+
+    # Konfiguration vor dem Import des Pollers setzen (wird dort beim Import gelesen)
+    registry_file = Path(tempfile.mkdtemp(prefix="beehive_sim_")) / "sensors.json"
+    registry_file.write_text(json.dumps({"sensors": registry}), encoding="utf-8")
+    os.environ["SENSOR_REGISTRY_FILE"] = str(registry_file)
+    os.environ["MONGO_COLLECTION"] = args.collection
+    os.environ["GAP_REFILL"] = "0"
+
+    from client import Client
+    from poller import BeehivePoller
+
+    poller = BeehivePoller(lite=args.lite, client=Client(base_url=f"http://127.0.0.1:{port}"))
+    if args.drop:
+        poller.db_client.collection.delete_many({})
+    # Keine Retention im Lasttest (Rollups würden die Messung verfälschen)
+    poller.retention.last_run = time.monotonic()
+    poller.retention.interval_seconds = float("inf")
+    metrics = Metrics()
+    metrics.attach(poller)
+
+    logger.info("Simulation: %d Beuten, %d Entities, Tage %s, Faktor %sx, %d Zyklen alle %ss",
+                args.hives, entity_count, ", ".join(args.days), args.speed, args.cycles, args.poll_seconds)
+    started = time.monotonic()
+    try:
+        for cycle in range(args.cycles):
+            metrics.rss.append(_rss_mb())
+            t0 = time.perf_counter()
+            poller.poll_once()
+            metrics.cycles.append(time.perf_counter() - t0)
+            if cycle < args.cycles - 1:
+                time.sleep(max(0.0, args.poll_seconds - metrics.cycles[-1]))
+        metrics.rss.append(_rss_mb())
+    finally:
+        stub.terminate()
+
+    report = metrics.report(time.monotonic() - started)
+    report.update({"hives": args.hives, "entities": entity_count, "speed": args.speed, "lite": args.lite})
+    if poller.db_client.seen_filter is not None:
+        report["dedup"] = poller.db_client.seen_filter.stats()
+    logger.info("Simulation beendet: %s", json.dumps(report, indent=2))
+    if args.report:
+        args.report.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    return report
+
+
+if __name__ == "__main__":
+    main()
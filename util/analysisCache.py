@@ -0,0 +1,331 @@
+from __future__ import annotations
+
+import os
+import json
+import time
+import logging
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc as ipc
+
+from util.schema import TZ_BERLIN, to_epoch_ms, value_as_float64
+
+logger = logging.getLogger("beehive_poller.analysis")
+
+CACHE_DAYS = 7                   # so viele Tage (UTC) werden vorgehalten
+DAY_MS = 24 * 60 * 60 * 1000
+# Serien als int32-Referenz; Namen (entityId, key) stehen einmal in den Metadaten
+SCHEMA = pa.schema([("series", pa.int32()), ("ts", pa.int64()), ("value", pa.float64())])
+
+Series = Tuple[str, str]
+Bound = Optional[int | datetime]
+
+
+class _Partition:
+    """Ein UTC-Tag: sortierte Tabelle (series, ts) plus noch nicht einsortierte Anhänge."""
+
+    __slots__ = ("table", "index", "pending", "dirty")
+
+    def __init__(self, table: Optional[pa.Table] = None):
+        self.table = SCHEMA.empty_table() if table is None else table
+        self.index: Dict[int, Tuple[int, int]] = {}  # series -> (Offset, Anzahl) in table
+        self.pending: List[Tuple[np.ndarray, np.ndarray, np.ndarray]] = []
+        self.dirty = False
+        self._build_index()
+
+    def _build_index(self):
+        series = _column(self.table, "series")
+        if not len(series):
+            self.index = {}
+            return
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(series)) + 1))
+        ends = np.append(starts[1:], len(series))
+        self.index = {int(series[s]): (int(s), int(e - s)) for s, e in zip(starts, ends)}
+
+
+def _column(table: pa.Table, name: str) -> np.ndarray:
+    """Spalte als (schreibgeschützte) numpy-Sicht ohne Kopie, sofern sie aus einem Chunk besteht."""
+    column = table.column(name)
+    if column.num_chunks == 1:
+        return column.chunk(0).to_numpy(zero_copy_only=True)
+    return column.to_numpy()
+
+
+class AnalysisCache:
+    """
+    Spaltenorientierter Cache der letzten Tage pro (entityId, key) für Analysen
+    (Kontext über 24 h / 7 Tage), ohne MongoDB oder die API erneut abzufragen.
+
+    Pro UTC-Tag eine Arrow-Tabelle (series, ts, value), sortiert nach (series, ts),
+    sodass eine Serie ein zusammenhängender Ausschnitt ist: Lesen liefert numpy-Sichten
+    ohne Kopie. Anhänge nach jedem Insert werden beim nächsten Lesen einsortiert
+    (Duplikate verworfen). Mit `directory` werden Tage als Arrow-IPC-Dateien abgelegt
+    und memory-mapped geladen; andere Prozesse können dasselbe Verzeichnis lesen.
+    """
+
+    def __init__(self, directory: Optional[str | Path] = None, days: float = CACHE_DAYS):
+        """
+        Args:
+            directory: Ablage der Tagesdateien (None = nur im Speicher)
+            days: Vorhaltezeit; ältere Tage werden verworfen (evict)
+        """
+        self.directory = Path(directory) if directory else None
+        self.days = days
+        self._parts: Dict[int, _Partition] = {}
+        self._series_ids: Dict[Series, int] = {}
+        self._names: List[Series] = []
+        self._lock = threading.RLock()
+        self.mapped = 0
+        if self.directory is not None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._load()
+
+    # ---------- Serien ----------
+
+    def _sid(self, entity_id: str, key: str) -> int:
+        series = (entity_id, key)
+        sid = self._series_ids.get(series)
+        if sid is None:
+            sid = self._series_ids[series] = len(self._names)
+            self._names.append(series)
+        return sid
+
+    def _floor_day(self, now_ms: Optional[int] = None) -> int:
+        now_ms = now_ms or int(time.time() * 1000)
+        return int((now_ms - self.days * DAY_MS) // DAY_MS)
+
+    # ---------- Schreiben ----------
+
+    def _append(self, sids: np.ndarray, ts: np.ndarray, values: np.ndarray) -> int:
+        keep = (ts // DAY_MS >= self._floor_day()) & ~np.isnan(values)
+        sids, ts, values = sids[keep], ts[keep], values[keep]
+        if not len(ts):
+            return 0
+        days = ts // DAY_MS
+        for day in np.unique(days):
+            mask = days == day
+            part = self._parts.setdefault(int(day), _Partition())
+            part.pending.append((sids[mask], ts[mask], values[mask]))
+            part.dirty = True
+        return len(ts)
+
+    def append_frame(self, df: pd.DataFrame) -> int:
+        """Messwerte im kompakten Schema (util.schema) anhängen, z.B. nach jedem Insert."""
+        if df is None or df.empty:
+            return 0
+        codes, uniques = pd.factorize(pd.MultiIndex.from_arrays(
+            [df["entityId"].astype(str), df["key"].astype(str)]))
+        with self._lock:
+            lut = np.array([self._sid(e, k) for e, k in uniques], dtype=np.int32)
+            return self._append(lut[codes], df["ts"].to_numpy(dtype=np.int64),
+                                value_as_float64(df["value"]).astype(np.float64, copy=False))
+
+    def append_records(self, records: Iterable[dict]) -> int:
+        """Messwerte als Dicts (entityId, key, ts in ms, value) anhängen (schlanker Poller)."""
+        sids, ts, values = [], [], []
+        with self._lock:
+            for r in records:
+                value = r.get("value")
+                if r.get("ts") is None or not isinstance(value, (int, float)):
+                    continue
+                sids.append(self._sid(r["entityId"], r["key"]))
+                ts.append(int(r["ts"]))
+                values.append(float(value))
+            return self._append(np.array(sids, dtype=np.int32), np.array(ts, dtype=np.int64),
+                                np.array(values, dtype=np.float64))
+
+    def _compact(self, part: _Partition):
+        """Anhänge einsortieren: nach (series, ts) sortieren, Duplikate verwerfen (ältester gewinnt)."""
+        if not part.pending:
+            return
+        series = np.concatenate([_column(part.table, "series")] + [p[0] for p in part.pending])
+        ts = np.concatenate([_column(part.table, "ts")] + [p[1] for p in part.pending])
+        values = np.concatenate([_column(part.table, "value")] + [p[2] for p in part.pending])
+        order = np.lexsort((ts, series))  # stabil: Bestehendes vor Angehängtem
+        series, ts, values = series[order], ts[order], values[order]
+        keep = np.ones(len(ts), dtype=bool)
+        keep[1:] = (series[1:] != series[:-1]) | (ts[1:] != ts[:-1])
+        part.table = pa.table({"series": series[keep], "ts": ts[keep], "value": values[keep]}, schema=SCHEMA)
+        part.pending = []
+        part._build_index()
+
+    def warm(self, db_client, now_ms: Optional[int] = None) -> int:
+        """
+        Fehlende Zeit seit dem neuesten Messwert im Cache (sonst den ganzen Vorhaltezeitraum)
+        einmalig aus MongoDB nachladen.
+        """
+        now_ms = now_ms or int(time.time() * 1000)
+        start_ms = self.latest_ts()
+        start_ms = self._floor_day(now_ms) * DAY_MS if start_ms is None else start_ms + 1
+        count = 0
+        for chunk in db_client.iter_reading_batches(start_ms, now_ms + 1):
+            count += self.append_frame(chunk)
+        logger.info("Analyse-Cache: %d Messwerte aus MongoDB nachgeladen", count)
+        return count
+
+    # ---------- Ablage ----------
+
+    def _path(self, day: int) -> Path:
+        return self.directory / f"part-{day}.arrow"
+
+    def _load(self):
+        """Tagesdateien im Vorhaltezeitraum memory-mapped laden, ältere löschen."""
+        floor = self._floor_day()
+        for path in sorted(self.directory.glob("part-*.arrow")):
+            day = int(path.stem.split("-", 1)[1])
+            if day < floor:
+                path.unlink(missing_ok=True)
+                continue
+            try:
+                table = ipc.open_file(pa.memory_map(str(path), "r")).read_all()
+                names = json.loads(table.schema.metadata[b"series"])
+            except Exception as e:
+                logger.warning("Analyse-Cache: %s nicht lesbar, verworfen (%s)", path.name, e)
+                continue
+            # Serien-Nummern der Datei auf die dieses Caches abbilden (ts/value bleiben gemappt)
+            remap = np.array([self._sid(e, k) for e, k in names], dtype=np.int32)
+            series = remap[_column(table, "series")] if len(names) else np.empty(0, dtype=np.int32)
+            table = table.replace_schema_metadata(None).set_column(0, SCHEMA.field("series"), pa.array(series))
+            self._parts[day] = _Partition(table.combine_chunks())
+            self.mapped += 1
+
+    def flush(self) -> int:
+        """Geänderte Tage einsortieren und (mit directory) als Arrow-IPC-Datei ablegen."""
+        written = 0
+        with self._lock:
+            for day, part in self._parts.items():
+                self._compact(part)
+                if not part.dirty or self.directory is None:
+                    continue
+                path = self._path(day)
+                tmp = path.with_suffix(".tmp")
+                schema = SCHEMA.with_metadata({"series": json.dumps(self._names)})
+                try:
+                    with pa.OSFile(str(tmp), "wb") as sink, ipc.new_file(sink, schema) as writer:
+                        writer.write_table(part.table.replace_schema_metadata(schema.metadata))
+                    os.replace(tmp, path)
+                    part.dirty = False
+                    written += 1
+                except OSError as e:
+                    logger.warning("Analyse-Cache: %s nicht geschrieben (%s)", path.name, e)
+        return written
+
+    def evict(self, now_ms: Optional[int] = None) -> int:
+        """Tage außerhalb der Vorhaltezeit verwerfen (auch die Dateien)."""
+        floor = self._floor_day(now_ms)
+        with self._lock:
+            old = [day for day in self._parts if day < floor]
+            for day in old:
+                del self._parts[day]
+                if self.directory is not None:
+                    self._path(day).unlink(missing_ok=True)
+        return len(old)
+
+    # ---------- Lesen ----------
+
+    def _pieces(self, sid: int, start_ms: Optional[int], end_ms: Optional[int]) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """(ts, value)-Sichten ohne Kopie je Tag im Fenster [start, end)."""
+        first = -1 if start_ms is None else start_ms // DAY_MS
+        last = float("inf") if end_ms is None else (end_ms - 1) // DAY_MS
+        with self._lock:
+            tables = []
+            for day in sorted(d for d in self._parts if first <= d <= last):
+                part = self._parts[day]
+                self._compact(part)
+                span = part.index.get(sid)
+                if span is not None:
+                    tables.append(part.table.slice(*span))
+        pieces = []
+        for table in tables:
+            ts, values = _column(table, "ts"), _column(table, "value")
+            lo = 0 if start_ms is None else np.searchsorted(ts, start_ms, "left")
+            hi = len(ts) if end_ms is None else np.searchsorted(ts, end_ms, "left")
+            if hi > lo:
+                pieces.append((ts[lo:hi], values[lo:hi]))
+        return pieces
+
+    def series(self, entity_id: str, key: str, start: Bound = None, end: Bound = None) -> pd.Series:
+        """
+        Messwerte einer Serie im Fenster [start, end) als pd.Series mit Europe/Berlin-Zeitindex.
+        Liegt das Fenster in einem Tag, teilen sich die Werte den Speicher mit dem Cache.
+
+        Args:
+            start, end: Epoch-ms oder zeitzonenbewusste datetimes (None = offen)
+        """
+        sid = self._series_ids.get((entity_id, key))
+        pieces = [] if sid is None else self._pieces(
+            sid, None if start is None else to_epoch_ms(start), None if end is None else to_epoch_ms(end))
+        if len(pieces) == 1:
+            ts, values = pieces[0]
+        elif pieces:
+            ts = np.concatenate([p[0] for p in pieces])
+            values = np.concatenate([p[1] for p in pieces])
+        else:
+            ts, values = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+        index = pd.to_datetime(ts, unit="ms", utc=True).tz_convert(TZ_BERLIN)
+        return pd.Series(values, index=index, name=key, copy=False)
+
+    def window(self, start: Bound = None, end: Bound = None, entity_ids: Optional[Iterable[str]] = None,
+               keys: Optional[Iterable[str]] = None) -> pd.DataFrame:
+        """Messwerte mehrerer Serien im Fenster [start, end) als DataFrame (entityId, key, ts, value)."""
+        entity_ids = None if entity_ids is None else set(entity_ids)
+        keys = None if keys is None else set(keys)
+        start_ms = None if start is None else to_epoch_ms(start)
+        end_ms = None if end is None else to_epoch_ms(end)
+        columns: Dict[str, list] = {"entityId": [], "key": [], "ts": [], "value": []}
+        for (entity_id, key), sid in list(self._series_ids.items()):
+            if (entity_ids is not None and entity_id not in entity_ids) or (keys is not None and key not in keys):
+                continue
+            for ts, values in self._pieces(sid, start_ms, end_ms):
+                columns["entityId"].append(np.full(len(ts), entity_id, dtype=object))
+                columns["key"].append(np.full(len(ts), key, dtype=object))
+                columns["ts"].append(ts)
+                columns["value"].append(values)
+        if not columns["ts"]:
+            return pd.DataFrame({"entityId": pd.Categorical([]), "key": pd.Categorical([]),
+                                 "ts": pd.Series([], dtype="int64"), "value": pd.Series([], dtype="float64")})
+        return pd.DataFrame({
+            "entityId": pd.Categorical(np.concatenate(columns["entityId"])),
+            "key": pd.Categorical(np.concatenate(columns["key"])),
+            "ts": np.concatenate(columns["ts"]),
+            "value": np.concatenate(columns["value"]),
+        })
+
+    def resample(self, entity_id: str, key: str, rule: str = "1h", how: str | list = "mean",
+                 start: Bound = None, end: Bound = None):
+        """Serie auf ein festes Raster aggregieren, z.B. rule="1h", how=["mean", "min", "max"]."""
+        return self.series(entity_id, key, start, end).resample(rule).agg(how)
+
+    def rolling(self, entity_id: str, key: str, window: str = "24h", start: Bound = None,
+                end: Bound = None, stats: Tuple[str, ...] = ("mean", "std", "min", "max")) -> pd.DataFrame:
+        """Gleitende Kennzahlen über ein Zeitfenster (z.B. "24h") an jedem Messwert."""
+        return self.series(entity_id, key, start, end).rolling(window).agg(list(stats))
+
+    def latest_ts(self) -> Optional[int]:
+        """Neuester Zeitstempel im Cache (Epoch-ms) oder None."""
+        with self._lock:
+            for day in sorted(self._parts, reverse=True):
+                part = self._parts[day]
+                self._compact(part)
+                ts = _column(part.table, "ts")
+                if len(ts):
+                    return int(ts.max())
+        return None
+
+    def stats(self) -> dict:
+        with self._lock:
+            parts = list(self._parts.values())
+            return {
+                "days": len(parts),
+                "series": len(self._names),
+                "rows": sum(p.table.num_rows for p in parts),
+                "pending": sum(len(chunk[1]) for p in parts for chunk in p.pending),
+                "bytes": sum(p.table.nbytes for p in parts),
+                "mapped": self.mapped,
+            }
@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+import time
+import logging
+from typing import Dict, Optional, Tuple
+
+from util.lazy import lazy_import
+
+# pandas/numpy erst bei Bedarf laden (schlanker Poller-Modus)
+pd = lazy_import("pandas")
+np = lazy_import("numpy")
+
+from util.schema import beehive_dimension, value_as_float64
+from util.sensorRegistry import get_registry
+
+logger = logging.getLogger("beehive_poller.derived")
+
+# =============================================================
+# Abgeleitete Kennzahlen pro Beute
+# =============================================================
+# Die Rohströme (Brutkammer D23, Futterkammer S31, Wetterstation S2120)
+# werden einmal über beehive_dimension auf die Beuten verteilt, per
+# merge_asof auf ein gemeinsames Zeitraster gelegt und dann spaltenweise
+# verrechnet. Die Wetterstation gehört zu allen Beuten.
+
+GRID_MINUTES = 5           # Zeitraster der abgeleiteten Reihen
+TOLERANCE_MINUTES = 15     # ältester Messwert, der noch einem Rasterpunkt zugeordnet wird
+
+# Sensortyp -> Rolle innerhalb der Beute
+SENSOR_ROLES = {
+    "LoRaWAN Dragino-D23-LB": "brood",
+    "LoRaWAN Dragino-S31-LB": "feed",
+    "LoRaWAN SenseCAP-S2120": "outside",
+}
+
+# (Rolle, Key) -> Signal; die drei Brut-Fühler werden vorher gemittelt
+SIGNALS = {
+    ("brood", "tempC1"): "brood_temp",
+    ("brood", "tempC2"): "brood_temp",
+    ("brood", "tempC3"): "brood_temp",
+    ("feed", "temperature"): "feed_temp",
+    ("feed", "relativeHumidity"): "feed_humidity",
+    ("outside", "temperature"): "outside_temp",
+    ("outside", "relativeHumidity"): "outside_humidity",
+}
+INPUT_KEYS = sorted({k for _, k in SIGNALS})
+
+# Kennzahl -> (Minuend, Subtrahend); None = Signal direkt übernehmen
+METRICS: Dict[str, Tuple[str, Optional[str]]] = {
+    "brood_temp_mean": ("brood_temp", None),
+    "brood_outside_temp_delta": ("brood_temp", "outside_temp"),
+    "feed_outside_temp_delta": ("feed_temp", "outside_temp"),
+    # Die D23 in der Brutkammer misst keine Feuchte: Gradient Futterkammer -> außen
+    "feed_outside_humidity_delta": ("feed_humidity", "outside_humidity"),
+}
+
+
+def _signals(readings: pd.DataFrame) -> pd.DataFrame:
+    """Rohwerte -> (entityId, signal, ts, value); Brut-Fühler pro Zeitpunkt gemittelt."""
+    role = get_registry().sensor_types(readings["entityId"]).map(SENSOR_ROLES).astype(object)
+    signal = pd.Series(list(zip(role, readings["key"].astype(str))), index=readings.index).map(SIGNALS)
+
+    out = pd.DataFrame({
+        "entityId": readings["entityId"].astype(str),
+        "signal": signal,
+        "ts": readings["ts"].to_numpy("int64"),
+        "value": value_as_float64(readings["value"]),
+    })
+    out = out[out["signal"].notna()]
+    return out.groupby(["entityId", "signal", "ts"], as_index=False, observed=True)["value"].mean()
+
+
+def compute_hive_metrics(readings: pd.DataFrame, start_ms: Optional[int] = None, end_ms: Optional[int] = None, *,
+                         grid_minutes: int = GRID_MINUTES,
+                         tolerance_minutes: int = TOLERANCE_MINUTES) -> pd.DataFrame:
+    """
+    Berechnet die Kennzahlen (METRICS) pro Beute auf einem festen Zeitraster.
+
+    Args:
+        readings: Messwerte im kompakten Schema (util.schema.READING_COLUMNS)
+        start_ms, end_ms: Rasterbereich [start, end) in Epoch-ms (Standard: Datenbereich)
+        grid_minutes: Rasterabstand
+        tolerance_minutes: maximales Alter des Messwerts je Rasterpunkt (as-of, rückwärts)
+
+    Returns:
+        DataFrame mit beehiveId, metric (kategorisch), ts (Epoch-ms), value
+    """
+    empty = pd.DataFrame({"beehiveId": pd.Series([], dtype="int16"), "metric": pd.Categorical([]),
+                          "ts": pd.Series([], dtype="int64"), "value": pd.Series([], dtype="float64")})
+    if readings.empty:
+        return empty
+    signals = _signals(readings)
+    if signals.empty:
+        return empty
+
+    # Beuten-Zugehörigkeit einmal auflösen (Wetterstation -> alle Beuten)
+    hives = beehive_dimension(signals["entityId"].unique())
+    hives["entityId"] = hives["entityId"].astype(str)
+    signals = signals.merge(hives, on="entityId", how="inner")
+    if signals.empty:
+        return empty
+
+    step = grid_minutes * 60 * 1000
+    lo = signals["ts"].min() if start_ms is None else start_ms
+    hi = signals["ts"].max() + 1 if end_ms is None else end_ms
+    first = -(-lo // step) * step  # erster Rasterpunkt >= lo
+    points = np.arange(first, hi, step, dtype="int64")
+    if len(points) == 0:
+        return empty
+    hive_ids = np.sort(hives["beehiveId"].unique())
+    grid = pd.DataFrame({
+        "ts": np.tile(points, len(hive_ids)),
+        "beehiveId": np.repeat(hive_ids, len(points)).astype("int16"),
+    }).sort_values("ts", kind="stable", ignore_index=True)
+
+    # Jedes Signal as-of (letzter Wert <= Rasterpunkt) auf das Raster legen
+    tolerance = tolerance_minutes * 60 * 1000
+    for name, part in signals.groupby("signal", observed=True):
+        part = part.groupby(["beehiveId", "ts"], as_index=False)["value"].mean().sort_values("ts")
+        part["beehiveId"] = part["beehiveId"].astype("int16")
+        grid = pd.merge_asof(grid, part.rename(columns={"value": name}), on="ts", by="beehiveId",
+                             direction="backward", tolerance=tolerance)
+
+    columns = {}
+    for metric, (a, b) in METRICS.items():
+        if a not in grid.columns or (b is not None and b not in grid.columns):
+            continue
+        columns[metric] = grid[a] if b is None else grid[a] - grid[b]
+    if not columns:
+        return empty
+
+    wide = pd.DataFrame(columns)
+    wide["beehiveId"] = grid["beehiveId"]
+    wide["ts"] = grid["ts"]
+    long = wide.melt(id_vars=["beehiveId", "ts"], var_name="metric", value_name="value").dropna(subset=["value"])
+    long["metric"] = long["metric"].astype("category")
+    return long[["beehiveId", "metric", "ts", "value"]].sort_values(
+        ["beehiveId", "metric", "ts"], ignore_index=True)
+
+
+def update_derived_metrics(db_client, end_ms: Optional[int] = None, *,
+                           initial_lookback_hours: int = 24,
+                           grid_minutes: int = GRID_MINUTES,
+                           tolerance_minutes: int = TOLERANCE_MINUTES) -> int:
+    """
+    Schreibt die abgeleiteten Reihen inkrementell fort: ab dem letzten gespeicherten
+    Rasterpunkt (Watermark, wird neu berechnet, falls Werte verspätet kamen) bis end.
+
+    Returns:
+        Anzahl geschriebener (upserted/geänderter) Punkte
+    """
+    step = grid_minutes * 60 * 1000
+    if end_ms is None:
+        end_ms = int(time.time() * 1000)
+    watermark = db_client.derived_watermark()
+    start_ms = watermark - tolerance_minutes * 60 * 1000 if watermark is not None \
+        else end_ms - initial_lookback_hours * 3600 * 1000
+    start_ms -= start_ms % step
+
+    # Messwerte ab start - tolerance, damit der erste Rasterpunkt seinen as-of-Wert findet
+    readings = db_client.find_readings(start_ms - tolerance_minutes * 60 * 1000, end_ms, keys=INPUT_KEYS)
+    metrics = compute_hive_metrics(readings, start_ms, end_ms,
+                                   grid_minutes=grid_minutes, tolerance_minutes=tolerance_minutes)
+    written = db_client.upsert_derived(metrics)
+    logger.info("Abgeleitete Kennzahlen: %d Punkte berechnet, %d geschrieben", len(metrics), written)
+    return written
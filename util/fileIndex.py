@@ -0,0 +1,178 @@
+from __future__ import annotations
+
+import os
+import json
+import time
+import zipfile
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class FileIndex:
+    """
+    Kleiner JSON-Index über geschriebene Export-/Log-Dateien.
+    Aufräumen und Verdichten lesen nur den Index statt jedes Mal das
+    Verzeichnis zu scannen und pro Datei getmtime aufzurufen.
+    Änderungen laufen unter einer Datei-Sperre und lesen den Index vorher neu ein,
+    damit parallele Schreiber (Poller, job.py, retention.py) sich nicht überschreiben.
+    """
+
+    INDEX_NAME = ".file_index.json"
+
+    def __init__(self, root, name: str = INDEX_NAME):
+        self.root = Path(root)
+        self.path = self.root / name
+        self._entries: Dict[str, dict] = self._load()
+
+    def _load(self) -> Dict[str, dict]:
+        with self._locked():
+            entries = self._read()
+            if entries is None:
+                # Einmaliger Scan, wenn es noch keinen (gültigen) Index gibt
+                entries = self._scan()
+                self._entries = entries
+                self._save()
+        return entries
+
+    def _read(self) -> Optional[Dict[str, dict]]:
+        try:
+            return json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    def _scan(self) -> Dict[str, dict]:
+        entries: Dict[str, dict] = {}
+        if self.root.exists():
+            for p in self.root.rglob("*"):
+                # Index, Sperre und temporäre Dateien des Index selbst auslassen
+                if p.is_file() and not p.name.startswith(self.path.stem):
+                    st = p.stat()
+                    rel = p.relative_to(self.root)
+                    is_archive = rel.parts[0] == "archive" and p.suffix == ".zip"
+                    entries[rel.as_posix()] = {
+                        "day": f"{p.stem}-01" if is_archive else self._day_of(rel),
+                        "mtime": st.st_mtime, "size": st.st_size, "archive": is_archive,
+                    }
+        return entries
+
+    def _save(self):
+        # Eindeutige Temp-Datei je Prozess, dann atomar ersetzen
+        tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(self._entries), encoding="utf-8")
+        os.replace(tmp, self.path)
+
+    @contextmanager
+    def _locked(self):
+        """Exklusive Sperre über Prozesse hinweg (Lock-Datei neben dem Index)."""
+        self.root.mkdir(parents=True, exist_ok=True)
+        with open(self.path.with_suffix(".lock"), "a+b") as fh:
+            if fcntl is not None:
+                fcntl.flock(fh, fcntl.LOCK_EX)
+            else:
+                fh.seek(0)
+                msvcrt.locking(fh.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(fh, fcntl.LOCK_UN)
+                else:
+                    fh.seek(0)
+                    msvcrt.locking(fh.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def _update(self, mutate):
+        """Liest den Index unter der Sperre neu ein, wendet mutate an und speichert."""
+        with self._locked():
+            current = self._read()
+            if current is not None:
+                self._entries = current
+            result = mutate(self._entries)
+            self._save()
+        return result
+
+    @staticmethod
+    def _day_of(path: Path) -> Optional[str]:
+        """Tag aus dem Ordnernamen data/YYYY-MM-DD/... (sonst None)."""
+        for part in path.parts:
+            if len(part) == 10 and part[4] == "-" and part[7] == "-" and part.replace("-", "").isdigit():
+                return part
+        return None
+
+    def _rel(self, path) -> str:
+        return Path(os.path.relpath(Path(path).resolve(), self.root.resolve())).as_posix()
+
+    def register(self, path, day: Optional[str] = None, archive: bool = False):
+        """Nimmt eine gerade geschriebene Datei (oder ein Archiv) in den Index auf."""
+        rel = self._rel(path)
+        st = (self.root / rel).stat()
+        entry = {"day": day or self._day_of(Path(rel)), "mtime": st.st_mtime,
+                 "size": st.st_size, "archive": archive}
+        self._update(lambda entries: entries.update({rel: entry}))
+
+    def entries(self) -> Dict[str, dict]:
+        return dict(self._entries)
+
+    def total_size(self) -> int:
+        return sum(e.get("size", 0) for e in self._entries.values())
+
+    def older_than(self, seconds: float, suffix: Optional[str] = None) -> List[str]:
+        """Dateien (relativ zu root), die älter als seconds sind."""
+        cutoff = time.time() - seconds
+        return [rel for rel, e in self._entries.items()
+                if e["mtime"] < cutoff and (suffix is None or rel.endswith(suffix))]
+
+    def days_before(self, day: str) -> Dict[str, List[str]]:
+        """Dateien (ohne Archive) mit Tag < day (YYYY-MM-DD), gruppiert nach Tag."""
+        out: Dict[str, List[str]] = {}
+        for rel, e in self._entries.items():
+            d = e.get("day")
+            if d and d < day and not e.get("archive"):
+                out.setdefault(d, []).append(rel)
+        return out
+
+    def archives_before(self, day: str) -> List[str]:
+        """Monatsarchive, deren Monat vollständig vor day (YYYY-MM-DD) liegt."""
+        return [rel for rel, e in self._entries.items()
+                if e.get("archive") and e.get("day") and e["day"][:7] < day[:7]]
+
+    def remove(self, rels: List[str]) -> int:
+        """Löscht Dateien und ihre Index-Einträge. Gibt die Anzahl gelöschter Dateien zurück."""
+        def mutate(entries):
+            removed = 0
+            for rel in rels:
+                try:
+                    (self.root / rel).unlink()
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+                entries.pop(rel, None)
+            return removed
+
+        return self._update(mutate)
+
+    def compact_day(self, day: str, rels: List[str], archive_dir: str = "archive") -> Path:
+        """
+        Packt die Dateien eines Tages in das Monatsarchiv archive/YYYY-MM.zip
+        und ersetzt sie im Index durch das Archiv.
+        """
+        archive = self.root / archive_dir / f"{day[:7]}.zip"
+        archive.parent.mkdir(parents=True, exist_ok=True)
+        with zipfile.ZipFile(archive, "a", compression=zipfile.ZIP_DEFLATED) as zf:
+            existing = set(zf.namelist())
+            for rel in rels:
+                if rel not in existing and (self.root / rel).exists():
+                    zf.write(self.root / rel, arcname=rel)
+        self.remove(rels)
+        for rel in rels:
+            day_dir = (self.root / rel).parent
+            if day_dir != self.root and day_dir.exists() and not any(day_dir.iterdir()):
+                day_dir.rmdir()
+        self.register(archive, day=f"{day[:7]}-01", archive=True)
+        return archive
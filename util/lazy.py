@@ -0,0 +1,25 @@
+import importlib
+from types import ModuleType
+
+
+class LazyModule(ModuleType):
+    """
+    Platzhalter, der das eigentliche Modul erst beim ersten Attributzugriff importiert.
+    So lädt der schlanke Poller-Pfad pandas/numpy nie, Export und Analyse wie gewohnt.
+    """
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.__dict__["_module"] = None
+
+    def __getattr__(self, attr: str):
+        module = self.__dict__["_module"]
+        if module is None:
+            module = importlib.import_module(self.__name__)
+            self.__dict__["_module"] = module
+        return getattr(module, attr)
+
+
+def lazy_import(name: str) -> ModuleType:
+    """Wie `import name`, aber erst bei Bedarf (z.B. pd = lazy_import("pandas"))."""
+    return LazyModule(name)
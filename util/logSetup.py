@@ -0,0 +1,176 @@
+from __future__ import annotations
+
+import os
+import sys
+import queue
+import atexit
+import logging
+import threading
+import logging.handlers
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+LOG_FORMAT = "%(asctime)s [%(levelname)s] %(message)s"
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+QUEUE_SIZE = 10_000             # Records in der Queue; bei vollem Puffer wird verworfen statt zu blockieren
+SAMPLE_BURST = 5                # gleichartige Meldungen pro Intervall, die durchgehen
+SAMPLE_INTERVAL_SECONDS = 60
+SAMPLE_MAX_KEYS = 10_000        # danach werden abgelaufene Intervalle aufgeräumt
+NO_SAMPLING = {"sample": False}  # als extra=NO_SAMPLING: Meldung nie drosseln (z.B. Alarme)
+
+_listeners: Dict[str, logging.handlers.QueueListener] = {}
+
+
+def parse_levels(spec: Optional[str]) -> Tuple[Optional[int], Dict[str, int]]:
+    """
+    Liest Log-Levels pro Komponente, z.B. "INFO,db=DEBUG,live=WARNING".
+
+    Returns:
+        (Level der Anwendung oder None, {Komponente: Level})
+    """
+    base, components = None, {}
+    for part in (spec or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, level = part.rpartition("=")
+        value = logging.getLevelName(level.strip().upper())
+        if not isinstance(value, int):
+            raise ValueError(f"Unbekanntes Log-Level '{level}'")
+        if name.strip():
+            components[name.strip()] = value
+        else:
+            base = value
+    return base, components
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Drosselt gleichartige Meldungen: pro Logger und Vorlage (record.msg, bei %-Stil also
+    ohne die Argumente) gehen je Intervall die ersten `burst` durch, der Rest wird nur
+    gezählt und an der nächsten durchgelassenen Meldung dieser Art vermerkt.
+    Gedrosselt wird nur bis max_level (Standard INFO); Warnungen und Fehler sowie
+    Meldungen mit extra=NO_SAMPLING gehen immer durch.
+    """
+
+    def __init__(self, burst: int = SAMPLE_BURST, interval_seconds: float = SAMPLE_INTERVAL_SECONDS,
+                 max_level: int = logging.INFO):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval_seconds
+        self.max_level = max_level
+        # (Logger, Vorlage) -> [Beginn des Intervalls, Anzahl im Intervall]
+        self._windows: Dict[Tuple[str, str], list] = {}
+        self._lock = threading.Lock()
+        self.suppressed = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > self.max_level or not getattr(record, "sample", True):
+            return True
+        key = (record.name, str(record.msg))
+        now = record.created
+        with self._lock:
+            window = self._windows.get(key)
+            if window is not None and now - window[0] < self.interval:
+                window[1] += 1
+                if window[1] > self.burst:
+                    self.suppressed += 1
+                    return False
+                return True
+            dropped = window[1] - self.burst if window is not None and window[1] > self.burst else 0
+            self._windows[key] = [now, 1]
+            if len(self._windows) > SAMPLE_MAX_KEYS:
+                self._windows = {k: w for k, w in self._windows.items() if now - w[0] < self.interval}
+        if dropped:
+            record.msg = f"{record.msg} [+{dropped} gleichartige Meldungen im letzten Intervall unterdrückt]"
+        return True
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler, der bei voller Queue verwirft statt den Aufrufer zu blockieren."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup_logging(name: str = "beehive_poller", log_file: Optional[Path] = None, *,
+                  level: Optional[int] = None, levels: Optional[str] = None,
+                  console: bool = True, sample: bool = True) -> logging.Logger:
+    """
+    Richtet den Logger einer Anwendung ein. Aufrufer legen Records nur in eine Queue
+    (QueueHandler); Formatierung der Ausgabe und Schreiben auf Konsole/Datei übernimmt
+    ein Hintergrund-Thread (QueueListener). Komponenten loggen als Kind-Logger
+    (z.B. beehive_poller.db) und lassen sich einzeln einstellen.
+
+    Args:
+        name: Logger der Anwendung
+        log_file: optionale Log-Datei (Verzeichnis wird angelegt)
+        level: Level der Anwendung (Standard: aus `levels`, sonst INFO)
+        levels: Levels pro Komponente, z.B. "INFO,db=DEBUG,live=WARNING" (Standard: LOG_LEVELS)
+        console: zusätzlich auf stdout schreiben
+        sample: gleichartige Meldungen bis INFO drosseln (SamplingFilter)
+
+    Returns:
+        der eingerichtete Logger
+    """
+    base, components = parse_levels(os.getenv("LOG_LEVELS") if levels is None else levels)
+    logger = logging.getLogger(name)
+    stop_logging(name)
+    logger.handlers.clear()
+    logger.setLevel(level if level is not None else base if base is not None else logging.INFO)
+    logger.propagate = False
+    for component, component_level in components.items():
+        logging.getLogger(f"{name}.{component}").setLevel(component_level)
+
+    fmt = logging.Formatter(LOG_FORMAT, DATE_FORMAT)
+    handlers = []
+    if console:
+        handlers.append(logging.StreamHandler(sys.stdout))
+    if log_file is not None:
+        Path(log_file).parent.mkdir(parents=True, exist_ok=True)
+        handlers.append(logging.FileHandler(log_file, encoding="utf-8"))
+    for handler in handlers:
+        handler.setFormatter(fmt)
+
+    queue_handler = _DroppingQueueHandler(queue.Queue(QUEUE_SIZE))
+    if sample:
+        queue_handler.addFilter(SamplingFilter())
+    logger.addHandler(queue_handler)
+
+    listener = logging.handlers.QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    listener.start()
+    if not _listeners:
+        atexit.register(stop_all)
+    _listeners[name] = listener
+    return logger
+
+
+def stop_logging(name: str):
+    """Schreibt die Queue eines Loggers leer und beendet seinen Hintergrund-Thread."""
+    listener = _listeners.pop(name, None)
+    if listener is not None:
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+
+
+def stop_all():
+    for name in list(_listeners):
+        stop_logging(name)
+
+
+def logging_stats(name: str = "beehive_poller") -> dict:
+    """Verworfene (Queue voll) und gedrosselte Meldungen seit dem Start."""
+    stats = {"dropped": 0, "suppressed": 0}
+    for handler in logging.getLogger(name).handlers:
+        stats["dropped"] += getattr(handler, "dropped", 0)
+        for f in handler.filters:
+            stats["suppressed"] += getattr(f, "suppressed", 0)
+    return stats
@@ -1,25 +1,27 @@
 from typing import List, Optional
-from constants import (
-    SENSOR_TO_ENTITY_ID,
-    ENTITY_ID_TO_SENSOR,
-    SENSOR_TO_BEEHIVE_IDS,
-)
+
+from util.sensorRegistry import get_registry
+
+# Dünne Hülle um die Sensor-Registry (constants.py, JSON-Datei oder Mongo, hot-reload).
+# Für ganze Spalten besser get_registry().sensor_names(...) / .beehive_dimension(...) nutzen.
 
 def _norm(name: str) -> str:
     return name.strip()
 
 def sensor_to_entity_id(sensor_name: str) -> Optional[str]:
-    return SENSOR_TO_ENTITY_ID.get(_norm(sensor_name))
+    return get_registry().entity_id(_norm(sensor_name))
 
 def entity_id_to_sensor(entity_id: str) -> Optional[str]:
-    return ENTITY_ID_TO_SENSOR.get(entity_id.strip())
+    return get_registry().sensor_name(entity_id)
 
 def sensor_to_beehives(sensor_name: str) -> List[int]:
-    return SENSOR_TO_BEEHIVE_IDS.get(_norm(sensor_name), [])
+    return get_registry().sensor_beehives(_norm(sensor_name))
 
 def entity_to_beehives(entity_id: str) -> List[int]:
-    sensor = entity_id_to_sensor(entity_id)
-    return sensor_to_beehives(sensor) if sensor else []
+    return get_registry().beehives(entity_id)
+
+def sensor_type(sensor_name: str) -> Optional[str]:
+    return get_registry().sensor_type(_norm(sensor_name))
 
 def beehive_has_sensor(beehive_id: int, sensor_name: str) -> bool:
     return beehive_id in set(sensor_to_beehives(sensor_name))
@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import time
+import logging
+import threading
+from typing import Dict, Iterable, List, Set, Tuple
+
+logger = logging.getLogger("beehive_poller.dedup")
+
+HORIZON_MINUTES = 120      # so weit zurück werden gespeicherte Messwerte gemerkt (Lookback + Carry-over)
+PARTITION_MINUTES = 15     # Zeitscheiben: ältere werden als Ganzes verworfen
+MAX_ENTRIES = 2_000_000    # harte Obergrenze (älteste Scheiben zuerst weg)
+
+Series = Tuple[str, str]
+
+
+class RecentlySeen:
+    """
+    Exakte Menge der zuletzt gespeicherten Messwerte (entityId, key, ts), nach
+    Messzeitpunkt in Zeitscheiben partitioniert und auf HORIZON_MINUTES begrenzt.
+
+    Bewusst kein Bloom-Filter: ein falsch-positiver Treffer würde einen neuen
+    Messwert stillschweigend verwerfen. Das Überlappungsfenster ist klein genug
+    für exakte Mengen; Messwerte außerhalb des Horizonts gehen unverändert an
+    MongoDB (Unique Index entscheidet), es kann also nichts verloren gehen.
+    """
+
+    def __init__(self, horizon_minutes: int = HORIZON_MINUTES,
+                 partition_minutes: int = PARTITION_MINUTES,
+                 max_entries: int = MAX_ENTRIES):
+        self.horizon_ms = horizon_minutes * 60 * 1000
+        self.partition_ms = partition_minutes * 60 * 1000
+        self.max_entries = max_entries
+        # Zeitscheibe -> (entityId, key) -> ts
+        self._parts: Dict[int, Dict[Series, Set[int]]] = {}
+        self._entries = 0
+        self._lock = threading.Lock()
+        self.hits = 0             # vor MongoDB verworfen
+        self.passed = 0           # an MongoDB weitergereicht
+        self.db_duplicates = 0    # trotzdem Duplikat in MongoDB (Filter kannte sie nicht)
+
+    def _floor(self) -> int:
+        """Älteste noch geführte Zeitscheibe."""
+        return (int(time.time() * 1000) - self.horizon_ms) // self.partition_ms
+
+    def _evict(self):
+        floor = self._floor()
+        for part in sorted(self._parts):
+            if part >= floor and self._entries <= self.max_entries:
+                break
+            self._entries -= sum(len(ts) for ts in self._parts.pop(part).values())
+
+    def _contains(self, entity_id: str, key: str, ts: int) -> bool:
+        part = self._parts.get(ts // self.partition_ms)
+        return part is not None and ts in part.get((entity_id, key), ())
+
+    def _add(self, entity_id: str, key: str, ts: int):
+        part_id = ts // self.partition_ms
+        if part_id < self._floor():
+            return
+        seen = self._parts.setdefault(part_id, {}).setdefault((entity_id, key), set())
+        if ts not in seen:
+            seen.add(ts)
+            self._entries += 1
+
+    def unseen(self, keys: Iterable[Tuple[str, str, int]]) -> List[bool]:
+        """Maske: True = noch nicht gespeichert (an MongoDB weitergeben)."""
+        with self._lock:
+            mask = [not self._contains(e, k, int(t)) for e, k, t in keys]
+        hits = mask.count(False)
+        self.hits += hits
+        self.passed += len(mask) - hits
+        return mask
+
+    def add(self, keys: Iterable[Tuple[str, str, int]]):
+        """Gespeicherte (oder von MongoDB als Duplikat gemeldete) Messwerte merken."""
+        with self._lock:
+            for e, k, t in keys:
+                self._add(e, k, int(t))
+            self._evict()
+
+    def warm(self, db_client) -> int:
+        """Mit den im Horizont gespeicherten Messwerten vorbelegen (Index-Scan, nur entityId/key/ts)."""
+        end_ms = int(time.time() * 1000)
+        docs = db_client.find_documents(end_ms - self.horizon_ms, end_ms + self.partition_ms,
+                                        fields=["entityId", "key", "ts"])
+        before = self._entries
+        self.add((d["entityId"], d["key"], db_client._ts_ms(d["ts"])) for d in docs)
+        logger.info("Dedup-Filter: %d gespeicherte Messwerte vorgemerkt", self._entries - before)
+        return self._entries - before
+
+    def stats(self) -> dict:
+        total = self.hits + self.passed
+        return {
+            "entries": self._entries,
+            "partitions": len(self._parts),
+            "hits": self.hits,
+            "passed": self.passed,
+            "hit_rate": round(self.hits / total, 4) if total else None,
+            # exakte Mengen: verworfen wird nur, was nachweislich gespeichert ist
+            "false_positive_rate": 0.0,
+            # Duplikate, die der Filter nicht kannte (Warmup-Lücke, Horizont, andere Schreiber)
+            "miss_rate": round(self.db_duplicates / self.passed, 4) if self.passed else None,
+        }
@@ -0,0 +1,183 @@
+from __future__ import annotations
+
+import time
+import bisect
+import logging
+import threading
+from collections import deque
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
+
+from util.derived import SENSOR_ROLES
+from util.sensorRegistry import get_registry
+
+logger = logging.getLogger("beehive_poller.live")
+
+RING_SIZE = 12      # letzte N Messwerte pro (entityId, key), bei 5-Minuten-Uplinks ~1 h
+SEED_HOURS = 6      # beim Start so weit zurück aus MongoDB vorbelegen
+STALE_AFTER_SECONDS = 15 * 60  # Serie ohne neuen Messwert seit 3 Uplinks gilt als veraltet
+
+Point = Tuple[int, float]
+
+
+class RingBuffer:
+    """
+    Letzte Messwerte im Speicher: pro (entityId, key) ein Ring der letzten N Punkte
+    (ts in Epoch-ms, value), aufsteigend nach ts. Wird vom Poller nach jedem Insert
+    fortgeschrieben; Lesen ist ein Dict-Zugriff unter einem Lock (keine DB-Abfrage).
+    Beuten-Sichten lösen entityId -> beehiveIds über die Sensor-Registry auf.
+    Jeder gelesene Wert trägt das Alter des letzten Messwerts (ageSeconds, aus dessen ts)
+    und ob die Serie als veraltet gilt (stale), z.B. bei Sensoren, die offline sind,
+    oder Entities eines anderen Replicas, die refresh() noch nicht nachgezogen hat.
+    """
+
+    def __init__(self, size: int = RING_SIZE, stale_after_seconds: float = STALE_AFTER_SECONDS):
+        self.size = size
+        self.stale_after_seconds = stale_after_seconds
+        # entityId -> key -> Ring (verschachtelt, damit Entity-/Beuten-Sichten nicht alles scannen)
+        self._series: Dict[str, Dict[str, Deque[Point]]] = {}
+        self._lock = threading.Lock()
+        self._hive_index: Dict[int, List[str]] = {}
+        self._hive_index_version: Optional[int] = None
+        self.updated_at: Optional[float] = None
+
+    # ---------- Schreiben ----------
+
+    def _add(self, entity_id: str, key: str, ts: int, value: float) -> bool:
+        """Fügt einen Punkt ein; False, wenn er schon bekannt oder zu alt ist."""
+        keys = self._series.setdefault(entity_id, {})
+        ring = keys.get(key)
+        if ring is None:
+            ring = keys[key] = deque(maxlen=self.size)
+        if not ring or ts > ring[-1][0]:
+            ring.append((ts, value))
+            return True
+        # Verspätet/nachgeholt: einsortieren, Duplikate (gleicher ts) ignorieren
+        points = list(ring)
+        i = bisect.bisect_left(points, (ts,))
+        if i < len(points) and points[i][0] == ts:
+            return False
+        if len(points) == self.size and i == 0:
+            return False  # älter als alles im vollen Ring
+        points.insert(i, (ts, value))
+        ring.clear()
+        ring.extend(points[-self.size:])
+        return True
+
+    def add_records(self, records: Iterable[dict]) -> int:
+        """Messwerte als Dicts (entityId, key, ts in ms, value) übernehmen. Gibt die Anzahl neuer Punkte zurück."""
+        count = 0
+        now = time.time()
+        with self._lock:
+            for r in records:
+                value = r.get("value")
+                if r.get("ts") is None or not isinstance(value, (int, float)):
+                    continue
+                if self._add(r["entityId"], r["key"], int(r["ts"]), float(value)):
+                    count += 1
+            self.updated_at = now
+        return count
+
+    def add_frame(self, df) -> int:
+        """Messwerte im kompakten Schema (util.schema) übernehmen, je Serie nur die letzten N."""
+        if df is None or df.empty:
+            return 0
+        from util.schema import value_as_float64
+
+        tail = df.sort_values("ts", kind="stable").groupby(
+            ["entityId", "key"], observed=True, sort=False).tail(self.size)
+        values = value_as_float64(tail["value"])
+        return self.add_records(
+            {"entityId": e, "key": k, "ts": t, "value": v}
+            for e, k, t, v in zip(tail["entityId"].astype(str).tolist(), tail["key"].astype(str).tolist(),
+                                  tail["ts"].tolist(), values.tolist())
+            if v == v  # NaN auslassen
+        )
+
+    def refresh(self, db_client, hours: float, entity_ids: Optional[List[str]] = None) -> int:
+        """
+        Übernimmt die Messwerte der letzten `hours` Stunden aus MongoDB (sortierter Index-Scan),
+        z.B. die von anderen Replicas geschriebenen. Bekannte Punkte werden ignoriert.
+
+        Returns:
+            Anzahl neuer Punkte
+        """
+        end_ms = int(time.time() * 1000)
+        docs = db_client.find_documents(end_ms - int(hours * 3600 * 1000), end_ms + 1, entity_ids=entity_ids,
+                                        fields=["entityId", "key", "ts", "value"], sort=True)
+        return self.add_records(
+            {"entityId": d["entityId"], "key": d["key"], "ts": db_client._ts_ms(d["ts"]), "value": d["value"]}
+            for d in docs)
+
+    def seed(self, db_client, hours: float = SEED_HOURS) -> int:
+        """Ringe aus den letzten `hours` Stunden in MongoDB vorbelegen."""
+        count = self.refresh(db_client, hours)
+        logger.info("Live-Puffer: %d Messwerte aus %sh geladen, %d Serien", count, hours, self.stats()["series"])
+        return count
+
+    # ---------- Lesen ----------
+
+    def latest(self, entity_id: str, key: str) -> Optional[Point]:
+        """Letzter Messwert (ts, value) oder None."""
+        with self._lock:
+            ring = self._series.get(entity_id, {}).get(key)
+            return ring[-1] if ring else None
+
+    def history(self, entity_id: str, key: str, n: Optional[int] = None) -> List[Point]:
+        """Die letzten n (Standard: alle gepufferten) Messwerte, aufsteigend nach ts."""
+        with self._lock:
+            points = list(self._series.get(entity_id, {}).get(key, ()))
+        return points[-n:] if n else points
+
+    def entity(self, entity_id: str) -> Dict[str, dict]:
+        """Letzte Werte aller Keys einer Entity: key -> {ts, value, ageSeconds, stale}."""
+        now_ms = time.time() * 1000
+        with self._lock:
+            out = {}
+            for k, ring in self._series.get(entity_id, {}).items():
+                if not ring:
+                    continue
+                ts, value = ring[-1]
+                age = max(0.0, (now_ms - ts) / 1000)
+                out[k] = {"ts": ts, "value": value, "ageSeconds": round(age, 1),
+                          "stale": age > self.stale_after_seconds}
+            return out
+
+    def _entities_by_hive(self) -> Dict[int, List[str]]:
+        registry = get_registry()
+        entity_ids = registry.entity_ids()  # prüft auch auf Änderungen (hot reload)
+        if self._hive_index_version != registry.version:
+            index: Dict[int, List[str]] = {}
+            for e in entity_ids:
+                for hive in registry.beehives(e):
+                    index.setdefault(hive, []).append(e)
+            self._hive_index, self._hive_index_version = index, registry.version
+        return self._hive_index
+
+    def beehive(self, beehive_id: int) -> dict:
+        """
+        Aktueller Zustand einer Beute, nach Rolle gruppiert (brood/feed/outside, sonst sensorType).
+
+        Returns:
+            {"beehiveId": id, "roles": {Rolle: {key: {ts, value, ageSeconds, stale, entityId, sensorName}}}}
+        """
+        registry = get_registry()
+        roles: Dict[str, dict] = {}
+        for entity_id in self._entities_by_hive().get(beehive_id, []):
+            name = registry.sensor_name(entity_id)
+            sensor_type = registry.sensor_type(name) if name else None
+            role = SENSOR_ROLES.get(sensor_type, sensor_type or "unknown")
+            for key, point in self.entity(entity_id).items():
+                roles.setdefault(role, {})[key] = {**point, "entityId": entity_id, "sensorName": name}
+        return {"beehiveId": beehive_id, "roles": roles}
+
+    def beehives(self) -> List[dict]:
+        """Zustand aller bekannten Beuten."""
+        return [self.beehive(h) for h in sorted(self._entities_by_hive())]
+
+    def stats(self) -> dict:
+        cutoff_ms = (time.time() - self.stale_after_seconds) * 1000
+        with self._lock:
+            rings = [r for keys in self._series.values() for r in keys.values()]
+            stale = sum(1 for r in rings if r and r[-1][0] < cutoff_ms)
+            return {"series": len(rings), "points": sum(len(r) for r in rings), "stale": stale,
+                    "size": self.size, "updated_at": self.updated_at}
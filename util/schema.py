@@ -0,0 +1,213 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+
+from util.lazy import lazy_import
+
+# pandas/numpy erst bei Bedarf laden (schlanker Poller-Modus)
+pd = lazy_import("pandas")
+np = lazy_import("numpy")
+
+from util.mapping import entity_to_beehives
+from util.sensorRegistry import get_registry
+
+# =============================================================
+# Kompaktes In-Memory-Schema für Sensordaten
+# =============================================================
+# Eine Zeile = ein Messwert. Wiederholte Strings sind kategorisch,
+# Zeitstempel sind int64 Epoch-Millisekunden (UTC), Werte float32
+# sofern verlustfrei darstellbar. Die Zuordnung Sensor -> Beute steht
+# nicht pro Zeile, sondern in einer kleinen Dimensionstabelle
+# (siehe beehive_dimension).
+READING_COLUMNS = ["entityId", "sensorName", "key", "ts", "value"]
+CATEGORY_COLUMNS = ["entityId", "sensorName", "key"]
+FLOAT32_DIGITS = 7  # signifikante Dezimalstellen, mit denen float32-Werte zurückgehoben werden
+
+TZ_BERLIN = "Europe/Berlin"
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def to_epoch_ms(value: int | datetime) -> int:
+    """Epoch-ms unverändert, zeitzonenbewusste datetimes exakt (ganzzahlig, ms) umgerechnet."""
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            raise ValueError(f"datetime ohne Zeitzone: {value!r}")
+        return (value - EPOCH) // timedelta(milliseconds=1)
+    return int(value)
+
+
+def _ts_to_epoch_ms(ts: pd.Series) -> pd.Series:
+    """Normalisiert Sekunden/Millisekunden/Datetime auf int64 Epoch-ms."""
+    if pd.api.types.is_datetime64_any_dtype(ts):
+        if ts.dt.tz is not None:
+            ts = ts.dt.tz_convert("UTC").dt.tz_localize(None)
+        return ts.astype("datetime64[ms]").astype("int64")
+
+    ts_num = pd.to_numeric(ts, errors="coerce")
+    is_ms = ts_num.dropna().gt(1e12).any()
+    if not is_ms:
+        ts_num = ts_num * 1000
+    return ts_num.round().astype("int64")
+
+
+def _round_significant(arr: np.ndarray, digits: int = FLOAT32_DIGITS) -> np.ndarray:
+    """Rundet auf `digits` signifikante Dezimalstellen, rein numerisch (ohne Umweg über str)."""
+    out = arr.astype(np.float64)
+    nz = np.isfinite(out) & (out != 0)
+    x = out[nz]
+    exp = digits - 1 - np.floor(np.log10(np.abs(x)))
+    # Zehnerpotenzen sind bis 1e22 exakt; kleine Werte hoch-, große herunterskalieren
+    scale = 10.0 ** np.abs(exp)
+    with np.errstate(over="ignore", invalid="ignore"):
+        out[nz] = np.where(exp >= 0, np.round(x * scale) / scale, np.round(x / scale) * scale)
+    return out
+
+
+def _compact_values(values: pd.Series) -> pd.Series:
+    """
+    float32, wenn jeder Wert beim Zurückheben (value_as_float64, Runden auf
+    FLOAT32_DIGITS Stellen) exakt wiederhergestellt wird, sonst float64.
+    """
+    numeric = pd.to_numeric(values, errors="coerce")
+    if numeric.dtype == np.float32:
+        return numeric  # bereits kompakt (nicht über float64 aufweiten)
+    v64 = numeric.astype("float64")
+    arr = v64.to_numpy()
+    v32 = arr.astype(np.float32)
+    finite = np.isfinite(arr)
+    if np.array_equal(_round_significant(v32[finite]), arr[finite]):
+        return pd.Series(v32, index=values.index, name=values.name)
+    return v64
+
+
+def value_as_float64(values: pd.Series) -> np.ndarray:
+    """float32-Spalte verlustfrei nach float64 heben (auf FLOAT32_DIGITS Stellen gerundet, 24.1 bleibt 24.1)."""
+    arr = values.to_numpy()
+    if arr.dtype == np.float32:
+        return _round_significant(arr)
+    return arr.astype(np.float64, copy=False)
+
+
+def compact_readings(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Bringt einen Messwert-DataFrame in das kompakte Schema.
+
+    Zeilen ohne gültigen Zeitstempel oder numerischen Wert werden verworfen,
+    abgeleitete Zeitspalten (datetime, datetime_utc, datetime_local) und
+    Beuten-Listen entfallen.
+
+    Args:
+        df: DataFrame mit mindestens 'entityId', 'key', 'ts', 'value'
+
+    Returns:
+        DataFrame mit den Spalten READING_COLUMNS
+    """
+    if df.empty or "ts" not in df.columns:
+        return empty_readings()
+
+    out = df[[c for c in READING_COLUMNS if c in df.columns]].copy()
+    if not pd.api.types.is_datetime64_any_dtype(out["ts"]):
+        out["ts"] = pd.to_numeric(out["ts"], errors="coerce")
+    out["value"] = pd.to_numeric(out["value"], errors="coerce")
+    out = out[out["ts"].notna() & out["value"].notna() & out["key"].notna()]
+    if out.empty:
+        return empty_readings()
+
+    out["ts"] = _ts_to_epoch_ms(out["ts"])
+    out["value"] = _compact_values(out["value"])
+
+    out["entityId"] = out["entityId"].astype("category")
+    if "sensorName" not in out.columns or out["sensorName"].isna().any():
+        # Lookup über die Kategorie-Codes: einmal pro Entity, nicht pro Zeile
+        out["sensorName"] = get_registry().sensor_names(out["entityId"])
+    for col in CATEGORY_COLUMNS:
+        out[col] = out[col].astype("category")
+
+    return out[READING_COLUMNS].reset_index(drop=True)
+
+
+def concat_readings(frames: list) -> pd.DataFrame:
+    """
+    Fügt DataFrames im kompakten Schema zusammen. Werte werden vorher verlustfrei
+    nach float64 gehoben, sonst würde concat float32 und float64 binär aufweiten
+    (24.1 -> 24.100000381...).
+    """
+    frames = [f for f in frames if not f.empty]
+    if not frames:
+        return empty_readings()
+    lifted = [f.assign(value=value_as_float64(f["value"])) for f in frames]
+    return compact_readings(pd.concat(lifted, ignore_index=True))
+
+
+def empty_readings() -> pd.DataFrame:
+    """Leerer DataFrame im kompakten Schema."""
+    return pd.DataFrame({
+        "entityId": pd.Categorical([]),
+        "sensorName": pd.Categorical([]),
+        "key": pd.Categorical([]),
+        "ts": pd.Series([], dtype="int64"),
+        "value": pd.Series([], dtype="float32"),
+    })
+
+
+def beehive_dimension(entity_ids=None) -> pd.DataFrame:
+    """
+    Kleine Dimensionstabelle Entity -> Beute (eine Zeile pro Zuordnung).
+
+    Args:
+        entity_ids: Entities, für die die Zuordnung gebraucht wird.
+                    None = alle bekannten Entities aus dem Mapping.
+    """
+    if isinstance(entity_ids, pd.Series):
+        entity_ids = entity_ids.cat.categories if isinstance(entity_ids.dtype, pd.CategoricalDtype) \
+            else entity_ids.unique()
+    return get_registry().beehive_dimension(entity_ids)
+
+
+def with_local_datetime(df: pd.DataFrame, column: str = "datetime") -> pd.DataFrame:
+    """Ergänzt eine lesbare Europe/Berlin-Zeitspalte (nur für Exporte)."""
+    if df.empty or "ts" not in df.columns:
+        return df
+    out = df.copy()
+    out[column] = pd.to_datetime(out["ts"], unit="ms", utc=True).dt.tz_convert(TZ_BERLIN)
+    return out
+
+
+def to_documents(df: pd.DataFrame, *, bson_ts: bool = True, with_beehives: bool = True) -> list[dict]:
+    """
+    Baut Mongo-Dokumente spaltenweise statt über df.to_dict("records").
+
+    Args:
+        df: DataFrame im kompakten Schema
+        bson_ts: 'ts' als UTC-datetime (BSON Date) statt Epoch-ms schreiben
+        with_beehives: 'beehiveIds' aus der Dimensionstabelle ergänzen
+
+    Returns:
+        Liste von Dokumenten
+    """
+    if df.empty:
+        return []
+
+    columns: dict[str, list] = {}
+    for col in df.columns:
+        s = df[col]
+        if col == "ts":
+            ms = s.to_numpy(dtype="int64")
+            if bson_ts:
+                columns[col] = [EPOCH + timedelta(milliseconds=t) for t in ms.tolist()]
+            else:
+                columns[col] = ms.tolist()
+        elif col == "value":
+            columns[col] = value_as_float64(s).tolist()
+        elif isinstance(s.dtype, pd.CategoricalDtype):
+            cats = s.cat.categories.tolist()
+            columns[col] = [cats[c] if c >= 0 else None for c in s.cat.codes.tolist()]
+        else:
+            columns[col] = s.tolist()
+
+    if with_beehives and "entityId" in columns:
+        hives = {e: entity_to_beehives(e) for e in set(columns["entityId"]) if e is not None}
+        columns["beehiveIds"] = [hives.get(e, []) for e in columns["entityId"]]
+
+    names = list(columns)
+    return [dict(zip(names, row)) for row in zip(*(columns[c] for c in names))]
@@ -0,0 +1,223 @@
+from __future__ import annotations
+
+import os
+import json
+import time
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from util.lazy import lazy_import
+
+# pandas/numpy erst bei Bedarf laden (schlanker Poller-Modus)
+pd = lazy_import("pandas")
+np = lazy_import("numpy")
+
+logger = logging.getLogger("beehive_poller.registry")
+
+RELOAD_CHECK_SECONDS = 30  # höchstens so oft auf Änderungen prüfen
+
+
+def _default_records() -> List[dict]:
+    """Eingebaute Zuordnung aus constants.py (Fallback und Basis)."""
+    from constants import SENSOR_TO_ENTITY_ID, SENSOR_TO_BEEHIVE_IDS, SENSOR_TYPE
+    return [
+        {"entityId": eid, "sensorName": name, "sensorType": SENSOR_TYPE.get(name),
+         "beehiveIds": list(SENSOR_TO_BEEHIVE_IDS.get(name, []))}
+        for name, eid in SENSOR_TO_ENTITY_ID.items()
+    ]
+
+
+class SensorRegistry:
+    """
+    Zuordnung entityId -> sensorName, sensorType, beehiveIds als Lookup-Tabellen.
+
+    Quellen (spätere überschreiben frühere, pro entityId):
+      1. constants.py
+      2. JSON-Datei (Liste oder {"sensors": [...]}) mit entityId, sensorName, sensorType, beehiveIds
+      3. Mongo-Collection (z.B. <collection>_sensors) mit denselben Feldern
+
+    Ändert sich die Datei (mtime) oder der Inhalt der Collection, wird beim nächsten
+    Zugriff neu kompiliert; 'version' zählt dabei hoch. Anreicherung läuft über die
+    Codes kategorischer Spalten statt über eine Python-Funktion pro Zeile.
+    """
+
+    def __init__(self, path: Optional[str] = None, collection=None,
+                 check_seconds: float = RELOAD_CHECK_SECONDS):
+        """
+        Args:
+            path: JSON-Datei mit Sensoren (None = keine)
+            collection: Mongo-Collection mit Sensoren (None = keine)
+            check_seconds: Mindestabstand zwischen zwei Änderungsprüfungen
+        """
+        self.path = Path(path) if path else None
+        self.collection = collection
+        self.check_seconds = check_seconds
+        self.version = 0
+        self._lock = threading.Lock()
+        self._checked_at = float("-inf")
+        self._fingerprint = None
+        self._reload(force=True)
+
+    def use_collection(self, collection):
+        """Mongo-Collection als zusätzliche Quelle setzen (sofort neu laden)."""
+        self.collection = collection
+        self._reload(force=True)
+
+    # ---------- Laden / Kompilieren ----------
+
+    def _read_file(self) -> List[dict]:
+        data = json.loads(self.path.read_text(encoding="utf-8"))
+        return data.get("sensors", []) if isinstance(data, dict) else data
+
+    def _read_collection(self) -> List[dict]:
+        return list(self.collection.find(
+            {}, {"_id": 0, "entityId": 1, "sensorName": 1, "sensorType": 1, "beehiveIds": 1}))
+
+    def _current_fingerprint(self):
+        mtime = None
+        if self.path is not None and self.path.exists():
+            mtime = self.path.stat().st_mtime
+        docs = None
+        if self.collection is not None:
+            docs = sorted(json.dumps(d, sort_keys=True, default=str) for d in self._read_collection())
+        return mtime, docs
+
+    def _reload(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.check_seconds:
+            return
+        with self._lock:
+            self._checked_at = now
+            try:
+                fingerprint = self._current_fingerprint()
+            except Exception as e:
+                logger.warning("Sensor-Registry: Quelle nicht lesbar (%s), behalte Version %s", e, self.version)
+                if self.version:
+                    return
+                fingerprint = (None, None)
+            if not force and fingerprint == self._fingerprint:
+                return
+
+            records = {r["entityId"]: r for r in _default_records()}
+            try:
+                if fingerprint[0] is not None:
+                    records.update({r["entityId"]: r for r in self._read_file() if r.get("entityId")})
+                if fingerprint[1] is not None:
+                    records.update({r["entityId"]: {**records.get(r["entityId"], {}), **r}
+                                    for r in self._read_collection() if r.get("entityId")})
+            except Exception as e:
+                logger.warning("Sensor-Registry: Laden fehlgeschlagen (%s), nutze constants.py", e)
+            self._compile(list(records.values()))
+            self._fingerprint = fingerprint
+            self.version += 1
+            if self.version > 1:
+                logger.info("Sensor-Registry neu geladen (Version %s, %d Sensoren)", self.version, len(records))
+
+    def _compile(self, records: List[dict]):
+        # Einzel-Lookups: reine Dicts (kein pandas nötig)
+        self._records = records
+        entity_ids = [r["entityId"].strip() for r in records]
+        self._position = {e: i for i, e in enumerate(entity_ids)}
+        self._names_list = [r.get("sensorName") for r in records]
+        self._types_list = [r.get("sensorType") for r in records]
+        self._beehives: Dict[str, List[int]] = {e: list(r.get("beehiveIds") or []) for e, r in zip(entity_ids, records)}
+        self._by_sensor = {r.get("sensorName"): e for e, r in zip(entity_ids, records) if r.get("sensorName")}
+        self._sensor_beehives = {r.get("sensorName"): self._beehives[e]
+                                 for e, r in zip(entity_ids, records) if r.get("sensorName")}
+        self._sensor_types = {r.get("sensorName"): r.get("sensorType")
+                              for r in records if r.get("sensorName")}
+        # Vektor-Tabellen werden beim ersten spaltenweisen Zugriff gebaut (_vector_tables)
+        self._tables = None
+
+    def _vector_tables(self) -> dict:
+        if self._tables is None:
+            entity_ids = list(self._position)
+            pairs = [(e, h) for e in entity_ids for h in self._beehives[e]]
+            self._tables = {
+                "entities": pd.Index(entity_ids),
+                # Zusätzlicher letzter Eintrag = "unbekannt" (Ziel für Code -1)
+                "names": np.array(self._names_list + [None], dtype=object),
+                "types": np.array(self._types_list + [None], dtype=object),
+                "dimension": pd.DataFrame({
+                    "entityId": pd.Categorical([p[0] for p in pairs]),
+                    "beehiveId": pd.Series([p[1] for p in pairs], dtype="int16"),
+                }),
+            }
+        return self._tables
+
+    # ---------- Einzel-Lookups ----------
+
+    def entity_ids(self) -> List[str]:
+        self._reload()
+        return list(self._position)
+
+    def sensor_name(self, entity_id: str) -> Optional[str]:
+        self._reload()
+        i = self._position.get(entity_id.strip())
+        return None if i is None else self._names_list[i]
+
+    def entity_id(self, sensor_name: str) -> Optional[str]:
+        self._reload()
+        return self._by_sensor.get(sensor_name.strip())
+
+    def beehives(self, entity_id: str) -> List[int]:
+        self._reload()
+        return list(self._beehives.get(entity_id.strip(), []))
+
+    def sensor_beehives(self, sensor_name: str) -> List[int]:
+        self._reload()
+        return list(self._sensor_beehives.get(sensor_name.strip(), []))
+
+    def sensor_type(self, sensor_name: str) -> Optional[str]:
+        self._reload()
+        return self._sensor_types.get(sensor_name.strip())
+
+    # ---------- Vektorisierte Lookups ----------
+
+    def _take(self, column: str, entity_ids: pd.Series) -> pd.Series:
+        self._reload()
+        tables = self._vector_tables()
+        entities, table = tables["entities"], tables[column]
+        cat = entity_ids if isinstance(entity_ids.dtype, pd.CategoricalDtype) else entity_ids.astype("category")
+        # Pro Kategorie einmal nachschlagen (unbekannt -> letzter Eintrag), dann per Code verteilen
+        idx = entities.get_indexer(cat.cat.categories.astype(str).str.strip())
+        per_category = table[np.where(idx < 0, len(entities), idx)]
+        values = pd.Categorical(per_category.tolist())
+        return pd.Series(pd.Categorical.from_codes(
+            np.append(values.codes, -1)[cat.cat.codes.to_numpy()], categories=values.categories),
+            index=entity_ids.index)
+
+    def sensor_names(self, entity_ids: pd.Series) -> pd.Series:
+        """entityId-Spalte -> kategorische sensorName-Spalte (eine Operation pro Batch)."""
+        return self._take("names", entity_ids)
+
+    def sensor_types(self, entity_ids: pd.Series) -> pd.Series:
+        """entityId-Spalte -> kategorische sensorType-Spalte."""
+        return self._take("types", entity_ids)
+
+    def beehive_dimension(self, entity_ids=None) -> pd.DataFrame:
+        """Dimensionstabelle entityId -> beehiveId, optional auf entity_ids beschränkt."""
+        self._reload()
+        dimension = self._vector_tables()["dimension"]
+        if entity_ids is None:
+            return dimension.copy()
+        wanted = pd.Index([str(e).strip() for e in entity_ids])
+        dim = dimension[dimension["entityId"].astype(str).isin(wanted)].reset_index(drop=True)
+        dim["entityId"] = dim["entityId"].cat.remove_unused_categories()
+        return dim
+
+
+_registry: Optional[SensorRegistry] = None
+
+
+def get_registry() -> SensorRegistry:
+    """
+    Prozessweite Registry. Quelle über SENSOR_REGISTRY_FILE (JSON-Datei); die
+    Mongo-Collection hängt BeehiveDbClient an, wenn SENSOR_REGISTRY_MONGO=1.
+    """
+    global _registry
+    if _registry is None:
+        _registry = SensorRegistry(path=os.getenv("SENSOR_REGISTRY_FILE") or None)
+    return _registry
@@ -1,6 +1,9 @@
 from __future__ import annotations
 
-import pandas as pd
+from util.lazy import lazy_import
+
+# pandas erst bei Bedarf laden (schlanker Poller-Modus)
+pd = lazy_import("pandas")
 
 from datetime import datetime, timedelta, timezone 
 